@@ -0,0 +1,47 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Photo, PhotoShare
+
+
+def _cache_key(user_id, path):
+    digest = hashlib.md5(path.encode('utf-8')).hexdigest()
+    return f'media-access:{user_id}:{digest}'
+
+
+def _visible_to(user_id):
+    # Identical uploads share one file, so access to any photo with it grants the bytes.
+    shared = Exists(PhotoShare.objects.filter(photo=OuterRef('pk'), shared_to_id=user_id))
+    return Q(owner_id=user_id) | Q(shared)
+
+
+def can_access_media(user, path):
+    """
+    Return whether `user` owns or has been shared a photo that uses the media
+    file at `path`. No distinction is made for paths no photo uses: they are
+    content digests, so telling the two apart would reveal whether someone
+    else uploaded a given image. Decisions are cached per (user, path).
+    """
+    key = _cache_key(user.id, path)
+    allowed = cache.get(key)
+    if allowed is None:
+        allowed = Photo.objects.filter(_visible_to(user.id), file=path).exists()
+        cache.set(key, allowed, settings.MEDIA_ACCESS_CACHE_TTL)
+    return allowed
+
+
+async def acan_access_media(user_id, path):
+    """can_access_media() for async views, sharing the same cache entries."""
+    key = _cache_key(user_id, path)
+    allowed = await cache.aget(key)
+    if allowed is None:
+        allowed = await Photo.objects.filter(_visible_to(user_id), file=path).aexists()
+        await cache.aset(key, allowed, settings.MEDIA_ACCESS_CACHE_TTL)
+    return allowed
+
+
+def invalidate_media_access(user_ids, path):
+    cache.delete_many([_cache_key(user_id, path) for user_id in user_ids])
@@ -0,0 +1,270 @@
+"""
+Seeding and measurement helpers for the bench_* management commands.
+
+Seeded rows use bulk_create and belong to users named BENCH_USER_PREFIX*, so
+clear_bench_data() can remove them again. API scenarios run in-process
+through the test client from a pool of threads, each with its own database
+connection, and report latency percentiles and queries per request.
+"""
+import io
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import connection
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .models import Blob, Photo, PhotoShare
+from .pagination import FeedCursorPagination
+
+
+BENCH_USER_PREFIX = 'bench_'
+
+
+def seed_users(count, batch_size=5000):
+    users = User.objects.bulk_create(
+        [
+            User(username=f'{BENCH_USER_PREFIX}{i}', email=f'{BENCH_USER_PREFIX}{i}@example.com')
+            for i in range(count)
+        ],
+        batch_size=batch_size,
+    )
+    return [user.id for user in users]
+
+
+def make_jpeg(seed, size=(1600, 1200)):
+    """A distinct photo-sized JPEG: smooth noise, so it encodes like a real photo."""
+    rng = random.Random(seed)
+    noise = Image.frombytes('RGB', (16, 12), rng.randbytes(16 * 12 * 3))
+    buffer = io.BytesIO()
+    noise.resize(size, Image.Resampling.BICUBIC).save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def seed_files(count, seed=0):
+    """Store `count` distinct JPEGs through the photo storage; returns {name: size}."""
+    field = Photo._meta.get_field('file')
+    files = {}
+    for i in range(count):
+        content = make_jpeg(seed + i)
+        name = field.storage.save(field.generate_filename(None, f'bench-{i}.jpg'), ContentFile(content))
+        files[name] = len(content)
+    return files
+
+
+def seed_photos(user_ids, per_user, batch_size=5000, files=None):
+    """
+    Create `per_user` photos for each user, marked ready so a running
+    process_photos worker leaves them alone. Without `files` they point at
+    paths that do not exist; with a {name: size} dict from seed_files() they
+    cycle through those files and hold blob references.
+    """
+    names = itertools.cycle(files) if files else None
+    used = Counter()
+    photo_ids = []
+    batch = []
+    for user_id in user_ids:
+        for i in range(per_user):
+            if names is None:
+                name = f'uploads/bench/{user_id}-{i}.jpg'
+            else:
+                name = next(names)
+                used[name] += 1
+            photo = Photo(owner_id=user_id, file=name, original_name=f'{i}.jpg', status=Photo.Status.READY)
+            batch.append(photo)
+            if len(batch) >= batch_size:
+                photo_ids.extend(p.id for p in Photo.objects.bulk_create(batch))
+                batch = []
+    if batch:
+        photo_ids.extend(p.id for p in Photo.objects.bulk_create(batch))
+    if used:
+        Blob.objects.acquire_many(files, used)
+    return photo_ids
+
+
+def seed_shares(photo_ids, user_ids, count, batch_size=10000, seed=0):
+    """Create roughly `count` random shares; duplicates are dropped by the DB."""
+    rng = random.Random(seed)
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        PhotoShare.objects.bulk_create(
+            [
+                PhotoShare(photo_id=rng.choice(photo_ids), shared_to_id=rng.choice(user_ids))
+                for _ in range(size)
+            ],
+            ignore_conflicts=True,
+        )
+        created += size
+    return created
+
+
+def clear_bench_data():
+    """Delete every bench user together with their photos, files and shares."""
+    users = User.objects.filter(username__startswith=BENCH_USER_PREFIX)
+    Photo.objects.filter(owner__in=users).delete()
+    return users.delete()[1].get(User._meta.label, 0)
+
+
+def legacy_feed(user):
+    """The feed query as it was before PhotoFeed: OR across the share join + DISTINCT."""
+    owned_photos = Photo.objects.filter(owner=user)
+    shared_photos = Photo.objects.filter(shares__shared_to=user)
+    return (owned_photos | shared_photos).distinct().order_by('-created_at', '-id')
+
+
+class PhotoFeed:
+    """
+    The feed as it was before FeedEntry: photos visible to a user, built from
+    two index-backed branches (owned and shared) merged with UNION ALL instead
+    of an OR across a join + DISTINCT.
+
+    The shared branch skips photos the user owns, so the branches are disjoint
+    and the merge needs no deduplication pass.
+    """
+    ordering = FeedCursorPagination.ordering
+
+    def __init__(self, user):
+        self.user = user
+
+    def owned(self):
+        return Photo.objects.filter(owner_id=self.user.id)
+
+    def shared(self):
+        return Photo.objects.filter(shares__shared_to_id=self.user.id).exclude(owner_id=self.user.id)
+
+    def page(self, position=None, limit=None):
+        branches = [self.owned(), self.shared()]
+        if position is not None:
+            keyset = FeedCursorPagination.keyset_filter(position)
+            branches = [qs.filter(keyset) for qs in branches]
+        if limit is not None and connection.features.supports_slicing_ordering_in_compound:
+            # Each branch stops after `limit` rows of its own index scan.
+            branches = [qs.order_by(*self.ordering)[:limit] for qs in branches]
+
+        feed = branches[0].union(branches[1], all=True).order_by(*self.ordering)
+        return feed if limit is None else feed[:limit]
+
+
+def explain(queryset):
+    if connection.vendor == 'postgresql':
+        return queryset.explain(analyze=True, buffers=True)
+    return queryset.explain()
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(samples[len(samples) // 2], 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def percentile(ordered, quantile):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[min(int(quantile * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(samples, elapsed):
+    """Summary of (seconds, queries, status) samples taken over `elapsed` seconds."""
+    latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+    queries = [count for _, count, _ in samples]
+    statuses = Counter(status for _, _, status in samples)
+
+    def ms(value):
+        return None if value is None else round(value, 3)
+
+    return {
+        'requests': len(samples),
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'requests_per_sec': round(len(samples) / elapsed, 1) if elapsed else None,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1]) if latencies else None,
+        'queries_per_request': {
+            'mean': round(sum(queries) / len(queries), 2) if queries else None,
+            'max': max(queries, default=None),
+        },
+    }
+
+
+def baseline_ratios(current, previous, fields):
+    """current/previous for each of `fields` that both summaries have."""
+    return {
+        field: round(current[field] / previous[field], 3)
+        for field in fields
+        if current.get(field) is not None and previous.get(field)
+    }
+
+
+class QueryCounter:
+    """Execute wrapper counting the queries run on one connection."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run_scenario(send, requests, concurrency):
+    """
+    Call send(client, i) for i in range(requests) from `concurrency` threads.
+    Each thread has its own APIClient (which send() may keep state on) and
+    database connection; streamed bodies are read in full before the clock
+    stops. Returns summarize() of the responses.
+    """
+    numbers = itertools.count()
+    samples = []
+    lock = threading.Lock()
+
+    def worker():
+        # Server errors are reported in the summary instead of raised here.
+        client = APIClient(SERVER_NAME='localhost', raise_request_exception=False)
+        local = []
+        while (i := next(numbers)) < requests:
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                response = send(client, i)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                response.close()
+                elapsed = time.perf_counter() - start
+            local.append((elapsed, counter.count, response.status_code))
+        with lock:
+            samples.extend(local)
+
+    def threaded_worker():
+        try:
+            worker()
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        worker()
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bench') as pool:
+            for future in [pool.submit(threaded_worker) for _ in range(concurrency)]:
+                future.result()
+    return summarize(samples, time.perf_counter() - start)
@@ -0,0 +1,288 @@
+"""
+How protected media bytes reach the client once the view has authorized the
+request. The Django backend streams the file from the worker; the proxy
+backends return an empty response with an internal-redirect header so nginx,
+Apache or lighttpd send the file and the worker is released immediately; the
+redirect backend sends the client to the storage's own (presigned) URL.
+
+Files are addressed as (storage, name). Local storages are read and stat'ed
+through their filesystem path, others (S3) through the Storage API.
+
+Every backend shares the same validators (ETag/Last-Modified from the file
+stat) and answers conditional requests with 304 before any bytes are touched.
+Byte ranges are handled here only for the Django backend; the proxies do
+their own range handling.
+
+Async views use aserve_media(), which streams through an async iterator whose
+reads run in worker threads, so a slow disk or client never blocks the event
+loop. The proxy backends touch no file bytes and are shared as they are.
+"""
+import asyncio
+import os
+import re
+import secrets
+from functools import partial
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+from .storage import ObjectStat
+
+RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+MAX_RANGES = 16
+CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range_header(header, size):
+    """
+    Parse a ``Range: bytes=...`` header into a list of inclusive (start, end)
+    pairs. Returns None when the header should be ignored (absent, malformed or
+    too many ranges) and an empty list when no range can be satisfied.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    specs = header[len('bytes='):].split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        match = RANGE_RE.match(spec)
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if first == '':
+            # Suffix range: the last N bytes.
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                continue
+        ranges.append((start, end))
+    return ranges
+
+
+def if_range_matches(request, etag, last_modified):
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    return parse_http_date_safe(value) == int(last_modified)
+
+
+def local_path(storage, name):
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        return None
+
+
+def media_stat(storage, name):
+    """Size and modification time of a stored file; FileNotFoundError if it is missing."""
+    path = local_path(storage, name)
+    if path is not None:
+        return os.stat(path)
+    if hasattr(storage, 'stat'):
+        return storage.stat(name)
+    modified = storage.get_modified_time(name).timestamp()
+    return ObjectStat(storage.size(name), modified, int(modified * 1_000_000_000))
+
+
+def _opener(storage, name):
+    path = local_path(storage, name)
+    if path is not None:
+        return partial(open, path, 'rb')
+    return partial(storage.open, name, 'rb')
+
+
+def read_range(open_file, start, end, chunk_size=CHUNK_SIZE):
+    with open_file() as fh:
+        fh.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = fh.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def aread_range(open_file, start, end, chunk_size=CHUNK_SIZE):
+    fh = await asyncio.to_thread(open_file)
+    try:
+        await asyncio.to_thread(fh.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(fh.read, min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await asyncio.to_thread(fh.close)
+
+
+def _part_header(start, end, size, content_type, boundary):
+    return (
+        f'--{boundary}\r\n'
+        f'Content-Type: {content_type}\r\n'
+        f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+    ).encode('ascii')
+
+
+def _multipart_ranges(open_file, ranges, size, content_type, boundary):
+    for start, end in ranges:
+        yield _part_header(start, end, size, content_type, boundary)
+        yield from read_range(open_file, start, end)
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode('ascii')
+
+
+async def _amultipart_ranges(open_file, ranges, size, content_type, boundary):
+    for start, end in ranges:
+        yield _part_header(start, end, size, content_type, boundary)
+        async for chunk in aread_range(open_file, start, end):
+            yield chunk
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode('ascii')
+
+
+def _range_response(request, open_file, content_type, stat, read, multipart):
+    """The 206/416 response for a Range request, or None to send the whole file."""
+    size = stat.st_size
+    if not if_range_matches(request, file_etag(stat), stat.st_mtime):
+        return None
+    ranges = parse_range_header(request.META.get('HTTP_RANGE'), size)
+
+    if ranges is None:
+        return None
+    if not ranges:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(read(open_file, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        boundary = secrets.token_hex(16)
+        response = StreamingHttpResponse(
+            multipart(open_file, ranges, size, content_type or 'application/octet-stream', boundary),
+            status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}',
+        )
+    return response
+
+
+def serve_with_django(request, storage, name, content_type, stat):
+    open_file = _opener(storage, name)
+    response = _range_response(request, open_file, content_type, stat, read_range, _multipart_ranges)
+    if response is None:
+        response = FileResponse(open_file(), content_type=content_type)
+        response['Content-Length'] = str(stat.st_size)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def aserve_with_django(request, storage, name, content_type, stat):
+    open_file = _opener(storage, name)
+    response = _range_response(request, open_file, content_type, stat, aread_range, _amultipart_ranges)
+    if response is None:
+        response = StreamingHttpResponse(aread_range(open_file, 0, stat.st_size - 1), content_type=content_type)
+        response['Content-Length'] = str(stat.st_size)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _proxy_response(content_type, header, value):
+    response = HttpResponse(content_type=content_type or 'application/octet-stream')
+    response[header] = value
+    return response
+
+
+def serve_with_x_accel_redirect(request, storage, name, content_type, stat):
+    location = settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(name)
+    return _proxy_response(content_type, 'X-Accel-Redirect', location)
+
+
+def serve_with_x_sendfile(request, storage, name, content_type, stat):
+    path = local_path(storage, name)
+    if path is None:
+        raise ImproperlyConfigured("MEDIA_DELIVERY_BACKEND='sendfile' needs files on the local filesystem.")
+    return _proxy_response(content_type, 'X-Sendfile', str(path))
+
+
+def serve_with_redirect(request, storage, name, content_type, stat):
+    if local_path(storage, name) is not None:
+        raise ImproperlyConfigured("MEDIA_DELIVERY_BACKEND='redirect' needs a storage with presigned URLs (S3).")
+    return HttpResponseRedirect(storage.url(name))
+
+
+BACKENDS = {
+    'django': serve_with_django,
+    'nginx': serve_with_x_accel_redirect,
+    'sendfile': serve_with_x_sendfile,
+    'redirect': serve_with_redirect,
+}
+
+ASYNC_BACKENDS = {**BACKENDS, 'django': aserve_with_django}
+
+
+def patch_media_headers(response, etag, last_modified, max_age=None):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Media is per-user: browsers may cache it, shared caches must not.
+    if max_age is None:
+        max_age = settings.MEDIA_CACHE_MAX_AGE
+    patch_cache_control(response, private=True, max_age=max_age)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def _backend(backends):
+    backend = settings.MEDIA_DELIVERY_BACKEND
+    try:
+        return backends[backend]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"MEDIA_DELIVERY_BACKEND must be one of {sorted(backends)}, not {backend!r}."
+        )
+
+
+def _conditional_response(request, stat):
+    etag, last_modified = file_etag(stat), int(stat.st_mtime)
+    return etag, last_modified, get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def serve_media(request, storage, name, content_type, max_age=None):
+    """Serve `name` from `storage`; raises FileNotFoundError if it is not stored."""
+    serve = _backend(BACKENDS)
+    stat = media_stat(storage, name)
+    etag, last_modified, response = _conditional_response(request, stat)
+    if response is None:
+        response = serve(request, storage, name, content_type, stat)
+    return patch_media_headers(response, etag, last_modified, max_age)
+
+
+async def aserve_media(request, storage, name, content_type, max_age=None):
+    serve = _backend(ASYNC_BACKENDS)
+    stat = await asyncio.to_thread(media_stat, storage, name)
+    etag, last_modified, response = _conditional_response(request, stat)
+    if response is None:
+        response = serve(request, storage, name, content_type, stat)
+    return patch_media_headers(response, etag, last_modified, max_age)
@@ -0,0 +1,169 @@
+"""
+The materialized gallery: one FeedEntry per (user, visible photo).
+
+Signals keep the table in step with single Photo/PhotoShare writes; the bulk
+endpoints call add_owner_entries()/add_share_entries() themselves because
+bulk_create sends no signals. rebuild_feed() recomputes rows from the source
+tables and diff_feed() reports where the two disagree.
+
+Each entry also carries the photo's filterable metadata (capture time,
+dimensions, type), so filtered and re-sorted feeds read FeedEntry indexes
+only. The processing pipeline fills it in through sync_feed_metadata().
+"""
+from django.db import transaction
+from django.db.models import F
+
+from .models import FeedEntry, Photo, PhotoShare
+from .pagination import FeedCursorPagination
+
+
+# Photo columns copied onto its entries, in the order entry_values() returns them.
+PHOTO_FIELDS = ('created_at', 'taken_at', 'width', 'height', 'mime_type')
+
+# sort param -> (entry field, descending)
+SORTS = {
+    '-created_at': ('created_at', True),
+    'created_at': ('created_at', False),
+    '-taken_at': ('taken_at', True),
+    'taken_at': ('taken_at', False),
+}
+
+# filter param -> FeedEntry lookup
+FILTERS = {
+    'taken_after': 'taken_at__gte',
+    'taken_before': 'taken_at__lt',
+    'min_width': 'width__gte',
+    'max_width': 'width__lte',
+    'min_height': 'height__gte',
+    'max_height': 'height__lte',
+    'mime_type': 'mime_type',
+}
+
+
+class MaterializedFeed:
+    """
+    Reads a user's feed with one range scan of a FeedEntry index. `filters`
+    maps FILTERS keys to values; `sort` is one of SORTS.
+    """
+
+    def __init__(self, user, sort='-created_at', filters=None):
+        self.user = user
+        self.sort_field, self.descending = SORTS[sort]
+        self.filters = {FILTERS[name]: value for name, value in (filters or {}).items()}
+
+    @property
+    def ordering(self):
+        prefix = '-' if self.descending else ''
+        return (f'{prefix}{self.sort_field}', f'{prefix}photo_id')
+
+    def page(self, position=None, limit=None):
+        entries = FeedEntry.objects.filter(user_id=self.user.id, **self.filters)
+        if position is not None:
+            entries = entries.filter(FeedCursorPagination.keyset_filter(
+                position, pk_field='photo_id', field=self.sort_field, descending=self.descending,
+            ))
+        entries = entries.select_related('photo').order_by(*self.ordering)
+        if limit is not None:
+            entries = entries[:limit]
+        photos = []
+        for entry in entries:
+            entry.photo.feed_position = (getattr(entry, self.sort_field), entry.photo_id)
+            photos.append(entry.photo)
+        return photos
+
+
+def entry_values(created_at, taken_at, width, height, mime_type):
+    return {
+        'created_at': created_at, 'taken_at': taken_at or created_at,
+        'width': width, 'height': height, 'mime_type': mime_type,
+    }
+
+
+def photo_entry_values(photo):
+    return entry_values(*(getattr(photo, field) for field in PHOTO_FIELDS))
+
+
+def sync_feed_metadata(photo):
+    """Copy the photo's current metadata onto all of its entries."""
+    FeedEntry.objects.filter(photo_id=photo.id).update(**photo_entry_values(photo))
+
+
+def add_owner_entries(photos):
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=p.owner_id, photo_id=p.id, is_owned=True, **photo_entry_values(p)) for p in photos],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def add_share_entries(shares):
+    """Entries for new shares; a share of a photo with its own owner adds nothing."""
+    photos = {
+        photo_id: entry_values(*values)
+        for photo_id, *values in Photo.objects.filter(id__in={s.photo_id for s in shares})
+        .values_list('id', *PHOTO_FIELDS)
+    }
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=s.shared_to_id, photo_id=s.photo_id, is_owned=False, **photos[s.photo_id])
+            for s in shares if s.photo_id in photos
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def expected_entries(user_ids=None):
+    """Yield (user_id, photo_id, is_owned, values) for every row the table should hold."""
+    owned = Photo.objects.all()
+    shared = PhotoShare.objects.exclude(photo__owner_id=F('shared_to_id'))
+    if user_ids is not None:
+        owned = owned.filter(owner_id__in=user_ids)
+        shared = shared.filter(shared_to_id__in=user_ids)
+    for photo_id, owner_id, *values in owned.values_list('id', 'owner_id', *PHOTO_FIELDS).iterator():
+        yield owner_id, photo_id, True, entry_values(*values)
+    shared_fields = [f'photo__{field}' for field in PHOTO_FIELDS]
+    for user_id, photo_id, *values in shared.values_list('shared_to_id', 'photo_id', *shared_fields).iterator():
+        yield user_id, photo_id, False, entry_values(*values)
+
+
+def rebuild_feed(user_ids=None, batch_size=5000):
+    """
+    Replace the entries of `user_ids` (all users when None) with freshly computed
+    ones, inserted in batches inside one transaction. Returns the row count.
+    """
+    count = 0
+    with transaction.atomic():
+        stale = FeedEntry.objects.all()
+        if user_ids is not None:
+            stale = stale.filter(user_id__in=user_ids)
+        stale.delete()
+
+        batch = []
+        for user_id, photo_id, is_owned, values in expected_entries(user_ids):
+            batch.append(FeedEntry(user_id=user_id, photo_id=photo_id, is_owned=is_owned, **values))
+            if len(batch) >= batch_size:
+                FeedEntry.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        FeedEntry.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def diff_feed(user_ids):
+    """
+    Compare the stored entries of `user_ids` with the source tables. Returns
+    sorted (user_id, photo_id) lists of missing, extra and stale rows.
+    """
+    expected = {(u, p): (owned, values) for u, p, owned, values in expected_entries(user_ids)}
+    actual = {
+        (u, p): (owned, dict(zip(PHOTO_FIELDS, values)))
+        for u, p, owned, *values in FeedEntry.objects.filter(user_id__in=user_ids)
+        .values_list('user_id', 'photo_id', 'is_owned', *PHOTO_FIELDS).iterator()
+    }
+    return {
+        'missing': sorted(expected.keys() - actual.keys()),
+        'extra': sorted(actual.keys() - expected.keys()),
+        'stale': sorted(key for key in expected.keys() & actual.keys() if expected[key] != actual[key]),
+    }
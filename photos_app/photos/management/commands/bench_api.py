@@ -0,0 +1,189 @@
+import json
+import random
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from photos.benchmarks import (
+    BENCH_USER_PREFIX, baseline_ratios, clear_bench_data, make_jpeg, run_scenario, seed_files, seed_photos, seed_shares, seed_users,
+)
+from photos.feed import rebuild_feed
+from photos.models import Photo, PhotoShare
+
+SCENARIOS = ['feed', 'thumbnails', 'uploads', 'shares']
+
+# Ratios against --baseline are reported for these summary fields.
+COMPARED = ['p50_ms', 'p95_ms', 'p99_ms', 'requests_per_sec']
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed bench users, photos and shares, then drive the photo API through feed paging, '
+        'thumbnail storms, concurrent uploads and sharing. Prints p50/p95/p99 latency and '
+        'queries per request for each scenario as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--photos-per-user', type=int, default=50)
+        parser.add_argument('--shares', type=int, default=20_000)
+        parser.add_argument('--files', type=int, default=50, help='Distinct image files the seeded photos point at.')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse previously seeded bench_* users.')
+        parser.add_argument('--reset', action='store_true', help='Delete existing bench_* users before seeding.')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated subset to run.')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--pages', type=int, default=5, help='Feed pages walked per user before switching.')
+        parser.add_argument('--thumbnail-size', type=int, default=256)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Also write the report to this file.')
+        parser.add_argument('--baseline', help='A previous report; adds current/baseline ratios per scenario.')
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}. Choose from {', '.join(SCENARIOS)}.")
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive.')
+
+        if options['reset']:
+            self.stderr.write(f'Deleted {clear_bench_data()} bench users.')
+        if not options['skip_seed']:
+            self.stderr.write('Seeding users, photos and shares...')
+            user_ids = seed_users(options['users'])
+            files = seed_files(options['files'], seed=options['seed'])
+            photo_ids = seed_photos(user_ids, options['photos_per_user'], files=files)
+            seed_shares(photo_ids, user_ids, options['shares'], seed=options['seed'])
+            rebuild_feed(user_ids)
+
+        users = list(
+            User.objects.filter(username__startswith=BENCH_USER_PREFIX)
+            .exclude(username=f'{BENCH_USER_PREFIX}media').order_by('id')
+        )
+        if len(users) < 2:
+            raise CommandError('At least two bench users are needed; run without --skip-seed first.')
+        photos = defaultdict(list)
+        for photo_id, owner_id, name in (
+            Photo.objects.filter(owner__in=users, status=Photo.Status.READY).values_list('id', 'owner_id', 'file')
+        ):
+            photos[owner_id].append((photo_id, name))
+
+        context = {
+            'options': options,
+            'rng': random.Random(options['seed']),
+            'users': [user for user in users if photos[user.id]],
+            'emails': [user.email for user in users],
+            'tokens': {user.id: str(AccessToken.for_user(user)) for user in users},
+            'photos': photos,
+        }
+        if not context['users']:
+            raise CommandError('No bench user has ready photos to request.')
+
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'users': len(users),
+            'photos': sum(len(owned) for owned in photos.values()),
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'scenarios': {},
+        }
+        for name in scenarios:
+            self.stderr.write(f'Running {name}...')
+            send = getattr(self, f'{name}_request')(context)
+            report['scenarios'][name] = run_scenario(send, options['requests'], options['concurrency'])
+
+        if options['baseline']:
+            with open(options['baseline']) as fh:
+                add_baseline_ratios(report, json.load(fh))
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        self.stdout.write(output)
+
+    @staticmethod
+    def _authenticate(client, context, user):
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {context['tokens'][user.id]}")
+
+    def feed_request(self, context):
+        """Each client walks --pages pages of one user's feed, then moves on to another user."""
+        users, options = context['users'], context['options']
+
+        def send(client, i):
+            url = getattr(client, 'bench_next', None)
+            if url is None or client.bench_depth >= options['pages']:
+                self._authenticate(client, context, users[i % len(users)])
+                url = f"/api/photos/?page_size={options['page_size']}"
+                client.bench_depth = 0
+            response = client.get(url)
+            client.bench_next = response.data.get('next') if response.status_code == 200 else None
+            client.bench_depth += 1
+            return response
+
+        return send
+
+    def thumbnails_request(self, context):
+        """Gallery tiles: many rendition fetches for the users' own photos."""
+        users, photos, size = context['users'], context['photos'], context['options']['thumbnail_size']
+        rng = context['rng']
+        picks = [(user, rng.choice(photos[user.id])[1]) for user in users]
+
+        def send(client, i):
+            user, name = picks[i % len(picks)]
+            self._authenticate(client, context, user)
+            return client.get(f'/api/media/{name}/?size={size}')
+
+        return send
+
+    def uploads_request(self, context):
+        """Photo uploads with distinct bytes, so every one is stored rather than deduplicated."""
+        users = context['users']
+        base = make_jpeg(context['options']['seed'] + 1_000_000)
+
+        def send(client, i):
+            self._authenticate(client, context, users[i % len(users)])
+            upload = SimpleUploadedFile(f'bench-upload-{i}.jpg', base + i.to_bytes(8, 'big'), content_type='image/jpeg')
+            return client.post('/api/photos/', {'file': upload}, format='multipart')
+
+        return send
+
+    def shares_request(self, context):
+        """Single shares of a random own photo with another user it isn't shared with yet."""
+        users, photos, rng = context['users'], context['photos'], context['rng']
+        taken = set(
+            PhotoShare.objects.filter(photo__owner__in=users).values_list('photo_id', 'shared_to__email')
+        )
+        plan = []
+        for i in range(context['options']['requests']):
+            user = users[i % len(users)]
+            for _ in range(10):
+                photo_id, _ = rng.choice(photos[user.id])
+                email = rng.choice(context['emails'])
+                if email != user.email and (photo_id, email) not in taken:
+                    break
+            taken.add((photo_id, email))
+            plan.append((user, photo_id, email))
+
+        def send(client, i):
+            user, photo_id, email = plan[i]
+            self._authenticate(client, context, user)
+            return client.post('/api/photos/share/', {'photo': photo_id, 'shared_to': email}, format='json')
+
+        return send
+
+
+def add_baseline_ratios(report, baseline):
+    """Record current/baseline for COMPARED fields of every scenario both reports ran."""
+    for name, current in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        current['vs_baseline'] = baseline_ratios(current, previous, COMPARED)
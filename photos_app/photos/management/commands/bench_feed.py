@@ -0,0 +1,60 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from photos.benchmarks import (
+    BENCH_USER_PREFIX, PhotoFeed, explain, legacy_feed, seed_photos, seed_shares, seed_users, timed,
+)
+from photos.feed import MaterializedFeed, rebuild_feed
+
+
+class Command(BaseCommand):
+    help = 'Seed a large share table and compare the legacy OR/DISTINCT feed, the UNION ALL feed and the materialized FeedEntry feed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--photos-per-user', type=int, default=50)
+        parser.add_argument('--shares', type=int, default=1_000_000)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse previously seeded bench_* users.')
+        parser.add_argument('--plans', action='store_true', help='Print EXPLAIN output for both queries.')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            self.stdout.write('Seeding users, photos and shares...')
+            user_ids = seed_users(options['users'])
+            photo_ids = seed_photos(user_ids, options['photos_per_user'])
+            seed_shares(photo_ids, user_ids, options['shares'])
+            self.stdout.write('Rebuilding the materialized feed...')
+            rebuild_feed()
+
+        # The user with the most incoming shares is the worst case for the legacy plan.
+        user = (
+            User.objects.filter(username__startswith=BENCH_USER_PREFIX)
+            .annotate(share_count=Count('shared_photos'))
+            .order_by('-share_count')
+            .first()
+        )
+        if user is None:
+            self.stderr.write('No bench users found; run without --skip-seed first.')
+            return
+
+        limit = options['page_size']
+        legacy = legacy_feed(user)[:limit]
+        union = PhotoFeed(user).page(limit=limit)
+
+        report = {
+            'user_id': user.id,
+            'incoming_shares': user.share_count,
+            'page_size': limit,
+            'legacy': timed(lambda: list(legacy_feed(user)[:limit]), options['repeat']),
+            'union': timed(lambda: list(PhotoFeed(user).page(limit=limit)), options['repeat']),
+            'materialized': timed(lambda: MaterializedFeed(user).page(limit=limit), options['repeat']),
+        }
+        if options['plans']:
+            report['legacy_plan'] = explain(legacy)
+            report['union_plan'] = explain(union)
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from photos.benchmarks import BENCH_USER_PREFIX, baseline_ratios
+from photos.models import Photo
+
+# Server option -> media route it is loaded through.
+SERVERS = {'wsgi': 'media', 'asgi': 'media-async'}
+COMPARED = ['requests_per_sec', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms']
+
+
+async def fetch(host, port, request):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(request)
+        await writer.drain()
+        status_line = await reader.readline()
+        body = await reader.read()  # Connection: close, so the body runs to EOF.
+    finally:
+        writer.close()
+    return int(status_line.split()[1]), len(body)
+
+
+async def load(url, token, concurrency, total):
+    parts = urlsplit(url)
+    target = parts.path + (f'?{parts.query}' if parts.query else '')
+    request = (
+        f'GET {target} HTTP/1.1\r\n'
+        f'Host: {parts.netloc}\r\n'
+        f'Authorization: Bearer {token}\r\n'
+        'Connection: close\r\n\r\n'
+    ).encode('ascii')
+    latencies, errors, received = [], 0, 0
+    remaining = iter(range(total))
+
+    async def client():
+        nonlocal errors, received
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                code, size = await fetch(parts.hostname, parts.port or 80, request)
+            except OSError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            received += size
+            if code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def ms(quantile):
+        if not latencies:
+            return None
+        return round(latencies[min(int(quantile * len(latencies)), len(latencies) - 1)] * 1000, 2)
+
+    return {
+        'url': url,
+        'requests': total,
+        'errors': errors,
+        'requests_per_sec': round(total / elapsed, 1),
+        'mb_per_sec': round(received / elapsed / 1e6, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2) if latencies else None,
+        'p50_ms': ms(0.50),
+        'p95_ms': ms(0.95),
+        'p99_ms': ms(0.99),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Download one protected photo many times concurrently from a WSGI and an ASGI server '
+        'and compare throughput. Start both servers against the same database first, e.g. '
+        '`gunicorn photos_app.wsgi` and `uvicorn photos_app.asgi:application`. With --baseline, '
+        'compares against an earlier run, e.g. before and after changing DB_CONN_MAX_AGE or DB_POOL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', default='http://127.0.0.1:8000', help='Base URL of the WSGI server.')
+        parser.add_argument('--asgi', default='http://127.0.0.1:8001', help='Base URL of the ASGI server.')
+        parser.add_argument('--size-kb', type=int, default=512, help='Size of the seeded photo.')
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--servers', default=','.join(SERVERS), help='Comma-separated subset to load.')
+        parser.add_argument('--output', help='Also write the report to this file.')
+        parser.add_argument('--baseline', help='A previous report; adds current/baseline ratios per server.')
+
+    def seed(self, size):
+        user, _ = User.objects.get_or_create(username=f'{BENCH_USER_PREFIX}media')
+        photo = Photo.objects.filter(owner=user, original_name='bench_media.bin').first()
+        if photo is None or photo.file.size != size:
+            # Ready, so a process_photos worker does not try to decode it.
+            photo = Photo(owner=user, original_name='bench_media.bin', status=Photo.Status.READY)
+            photo.file.save('bench_media.bin', ContentFile(b'\0' * size))
+        return user, photo
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be positive.')
+        servers = [name.strip() for name in options['servers'].split(',') if name.strip()]
+        unknown = set(servers) - set(SERVERS)
+        if unknown or not servers:
+            raise CommandError(f"--servers takes a subset of {', '.join(SERVERS)}.")
+        user, photo = self.seed(options['size_kb'] * 1024)
+        token = str(AccessToken.for_user(user))
+
+        report = {'file': photo.file.name, 'bytes': photo.file.size, 'concurrency': options['concurrency']}
+        for label in servers:
+            url = f"{options[label].rstrip('/')}/api/{SERVERS[label]}/{photo.file.name}/"
+            report[label] = asyncio.run(load(url, token, options['concurrency'], options['requests']))
+
+        if options['baseline']:
+            with open(options['baseline']) as fh:
+                baseline = json.load(fh)
+            for label in servers:
+                if baseline.get(label):
+                    report[label]['vs_baseline'] = baseline_ratios(report[label], baseline[label], COMPARED)
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from photos.feed import diff_feed, rebuild_feed
+
+
+class Command(BaseCommand):
+    help = 'Compare the materialized feed with photos and shares, a batch of users at a time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Users compared per batch.')
+        parser.add_argument('--fix', action='store_true', help='Rebuild the entries of users that differ.')
+        parser.add_argument('--verbose-rows', action='store_true', help='List every differing (user, photo).')
+
+    def handle(self, *args, **options):
+        user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+        totals = {'missing': 0, 'extra': 0, 'stale': 0}
+        broken = set()
+
+        for start in range(0, len(user_ids), options['batch_size']):
+            diff = diff_feed(user_ids[start:start + options['batch_size']])
+            for kind, rows in diff.items():
+                totals[kind] += len(rows)
+                broken.update(user_id for user_id, _ in rows)
+                if options['verbose_rows']:
+                    for user_id, photo_id in rows:
+                        self.stdout.write(f'{kind}: user={user_id} photo={photo_id}')
+
+        self.stdout.write(
+            f"Checked {len(user_ids)} user(s): {totals['missing']} missing, "
+            f"{totals['extra']} extra, {totals['stale']} stale entries"
+        )
+        if not broken:
+            return
+        if options['fix']:
+            rebuild_feed(sorted(broken))
+            self.stdout.write(f'Rebuilt the feed of {len(broken)} user(s)')
+        else:
+            raise CommandError(f'The feed of {len(broken)} user(s) is inconsistent; rerun with --fix to repair it.')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from photos.metadata import extract_metadata
+from photos.models import Photo
+
+
+class Command(BaseCommand):
+    help = 'Read dimensions and EXIF details for photos processed before metadata was part of the pipeline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        pending = Photo.objects.filter(mime_type='', status=Photo.Status.READY).order_by('id')
+        extracted = failed = 0
+        for photo in pending.iterator(chunk_size=options['batch_size']):
+            try:
+                extract_metadata(photo)
+            except (OSError, ValueError) as exc:
+                failed += 1
+                self.stderr.write(f'Photo {photo.id}: {exc}')
+                continue
+            extracted += 1
+        self.stdout.write(f'Read metadata for {extracted} photos, {failed} failed.')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from photos.models import Photo
+from photos.similarity import compute_phash
+
+
+class Command(BaseCommand):
+    help = 'Compute perceptual hashes for photos processed before hashing was part of the pipeline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        pending = Photo.objects.filter(phash__isnull=True, status=Photo.Status.READY).order_by('id')
+        hashed = failed = 0
+        for photo in pending.iterator(chunk_size=options['batch_size']):
+            try:
+                compute_phash(photo)
+            except (OSError, ValueError) as exc:
+                failed += 1
+                self.stderr.write(f'Photo {photo.id}: {exc}')
+                continue
+            hashed += 1
+        self.stdout.write(f'Hashed {hashed} photos, {failed} failed.')
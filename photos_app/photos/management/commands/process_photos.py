@@ -0,0 +1,49 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _init_worker():
+    # Spawned workers import this module before Django is set up, so it must
+    # not import models at module level.
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = 'Run post-upload processing for queued photos, and queued WebP/AVIF transcodes, on a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=None, help='Photos claimed per round (default: 4 per worker).')
+        parser.add_argument('--poll-interval', type=float, default=2.0)
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty.')
+
+    def handle(self, *args, **options):
+        from photos.processing import claim_photos, process_claimed
+        from photos.transcoding import claim_transcodes, process_transcodes
+
+        batch_size = options['batch_size'] or options['workers'] * 4
+        # Fresh interpreters rather than forks, so no worker inherits this process's DB connection.
+        context = multiprocessing.get_context('spawn')
+
+        with ProcessPoolExecutor(options['workers'], mp_context=context, initializer=_init_worker) as executor:
+            while True:
+                photo_ids = claim_photos(limit=batch_size)
+                if photo_ids:
+                    process_claimed(photo_ids, executor)
+                    self.stdout.write(f'Processed {len(photo_ids)} photo(s)')
+                transcode_ids = claim_transcodes(limit=batch_size)
+                if transcode_ids:
+                    process_transcodes(transcode_ids, executor)
+                    self.stdout.write(f'Transcoded {len(transcode_ids)} file(s)')
+                if photo_ids or transcode_ids:
+                    continue
+                if options['once']:
+                    break
+                connections.close_all()
+                time.sleep(options['poll_interval'])
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from photos.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = 'Delete resumable upload sessions (and their part files) idle for longer than RESUMABLE_UPLOAD_EXPIRY.'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=settings.RESUMABLE_UPLOAD_EXPIRY)
+        deleted, _ = UploadSession.objects.filter(updated_at__lt=cutoff).delete()
+        self.stdout.write(f'Deleted {deleted} expired upload session(s)')
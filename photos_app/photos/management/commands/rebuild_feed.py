@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from photos.feed import rebuild_feed
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized feed (FeedEntry) from photos and shares.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only rebuild this user id (repeatable). Defaults to everyone.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        count = rebuild_feed(options['users'], batch_size=options['batch_size'])
+        self.stdout.write(f'Rebuilt {count} feed entr{"y" if count == 1 else "ies"}')
@@ -0,0 +1,75 @@
+"""
+Image metadata read once by the processing pipeline.
+
+Only the header and EXIF block are parsed (Pillow does not decode pixels for
+this), and the values are stored on the Photo and copied onto its feed
+entries, so the feed can filter and sort by them without touching files.
+"""
+from datetime import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from PIL import ExifTags, Image
+
+from .feed import sync_feed_metadata
+from .models import Photo
+
+EXIF_DATE_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+# EXIF orientations that rotate the image by 90 degrees one way or the other.
+TRANSPOSED = {5, 6, 7, 8}
+
+
+def _text(value, max_length):
+    if isinstance(value, bytes):
+        value = value.decode('ascii', 'ignore')
+    return str(value or '').strip('\x00 ')[:max_length]
+
+
+def parse_exif_datetime(value, offset=None):
+    """An aware datetime from an EXIF timestamp, or None when it is blank or invalid."""
+    value = _text(value, 32)
+    try:
+        taken_at = datetime.strptime(value, EXIF_DATE_FORMAT)
+    except ValueError:
+        return None
+    offset = _text(offset, 8)
+    if offset:
+        aware = parse_datetime(f'{taken_at.isoformat()}{offset}')
+        if aware is not None:
+            return aware
+    # No offset recorded: assume the camera clock ran on the server's zone.
+    return timezone.make_aware(taken_at)
+
+
+def read_metadata(file):
+    """Photo field values for an image file, without decoding its pixels."""
+    with file.open('rb'), Image.open(file) as image:
+        width, height = image.size
+        mime_type = Image.MIME.get(image.format, '')
+        exif = image.getexif()
+
+    if exif.get(ExifTags.Base.Orientation) in TRANSPOSED:
+        width, height = height, width
+    details = exif.get_ifd(ExifTags.IFD.Exif)
+    taken_at = (
+        parse_exif_datetime(details.get(ExifTags.Base.DateTimeOriginal), details.get(ExifTags.Base.OffsetTimeOriginal))
+        or parse_exif_datetime(exif.get(ExifTags.Base.DateTime), details.get(ExifTags.Base.OffsetTime))
+    )
+    return {
+        'width': width,
+        'height': height,
+        'mime_type': mime_type,
+        'taken_at': taken_at,
+        'camera_make': _text(exif.get(ExifTags.Base.Make), 64),
+        'camera_model': _text(exif.get(ExifTags.Base.Model), 64),
+    }
+
+
+def extract_metadata(photo):
+    """Pipeline step: store the photo's dimensions, type and EXIF details."""
+    values = read_metadata(photo.file)
+    Photo.objects.filter(pk=photo.pk).update(**values)
+    for field, value in values.items():
+        setattr(photo, field, value)
+    sync_feed_metadata(photo)
@@ -0,0 +1,248 @@
+"""
+Per-request performance metrics, exposed in the Prometheus text format at
+/metrics.
+
+PerformanceMetricsMiddleware times every request and labels it with the view
+that handled it; a database execute wrapper adds the request's query count
+and query time, and response bodies are counted as they are sent (streamed
+bodies as their chunks go out). Upload views report file sizes through
+observe_upload().
+
+Values live in this process, so with several workers each one is scraped as
+its own target. Scrapes must present METRICS_TOKEN as a bearer token. With
+PERFORMANCE_METRICS_ENABLED off the middleware removes itself at startup,
+observe_upload() returns straight away and /metrics is a 404, so the request
+path pays nothing.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+UPLOAD_SIZE_BUCKETS = (64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2)
+
+_lock = threading.Lock()
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, labelnames
+        self.values = defaultdict(float)
+
+    def inc(self, labels=(), amount=1):
+        with _lock:
+            self.values[labels] += amount
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(self.values.items()):
+            yield f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts (last is +Inf), sum]
+        self.values = {}
+
+    def observe(self, labels=(), value=0):
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            counts_sum = self.values.get(labels)
+            if counts_sum is None:
+                counts_sum = self.values[labels] = [[0] * (len(self.buckets) + 1), 0]
+            counts_sum[0][index] += 1
+            counts_sum[1] += value
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else f'{bound:g}'
+                yield f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", le)])} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}'
+
+
+REQUESTS = Counter('http_requests_total', 'Requests handled, by view, method and status.', ('view', 'method', 'status'))
+DURATION = Histogram('http_request_duration_seconds', 'Wall time until the response is returned.', ('view',))
+QUERIES = Counter('http_request_db_queries_total', 'SQL queries run while handling requests.', ('view',))
+QUERY_TIME = Counter('http_request_db_query_seconds_total', 'Time spent in SQL queries.', ('view',))
+RESPONSE_BYTES = Counter('http_response_bytes_total', 'Response body bytes sent by the app.', ('view',))
+UPLOAD_SIZE = Histogram('photo_upload_size_bytes', 'Size of each stored photo upload.', ('view',), UPLOAD_SIZE_BUCKETS)
+
+METRICS = [REQUESTS, DURATION, QUERIES, QUERY_TIME, RESPONSE_BYTES, UPLOAD_SIZE]
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'query_time', 'view')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.view = ''
+
+
+def _record_query(execute, sql, params, many, context):
+    current = _current.get()
+    if current is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current.queries += 1
+        current.query_time += time.perf_counter() - start
+
+
+def _install_query_hook():
+    for connection in connections.all():
+        if _record_query not in connection.execute_wrappers:
+            # Outermost, so execute_wrapper() blocks that are open now still pop their own.
+            connection.execute_wrappers.insert(0, _record_query)
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+def observe_upload(size):
+    """Record the size of an upload stored by the current request."""
+    current = _current.get()
+    if current is not None:
+        UPLOAD_SIZE.observe((current.view,), size)
+
+
+def _count_bytes(chunks, view):
+    sent = 0
+    try:
+        for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        RESPONSE_BYTES.inc((view,), sent)
+
+
+async def _acount_bytes(chunks, view):
+    sent = 0
+    try:
+        async for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        RESPONSE_BYTES.inc((view,), sent)
+
+
+class PerformanceMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PERFORMANCE_METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics, token, start = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        metrics, token, start = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, start)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current = _current.get()
+        if current is not None:
+            current.view = view_label(request)
+
+    @staticmethod
+    def _start():
+        _install_query_hook()
+        metrics = RequestMetrics()
+        return metrics, _current.set(metrics), time.perf_counter()
+
+    @staticmethod
+    def _finish(request, response, metrics, start):
+        elapsed = time.perf_counter() - start
+        view = (metrics.view or view_label(request),)
+        REQUESTS.inc((*view, request.method, response.status_code))
+        DURATION.observe(view, elapsed)
+        QUERIES.inc(view, metrics.queries)
+        QUERY_TIME.inc(view, metrics.query_time)
+
+        if response.has_header('Content-Length'):
+            RESPONSE_BYTES.inc(view, int(response['Content-Length']))
+        elif isinstance(response, StreamingHttpResponse):
+            count = _acount_bytes if response.is_async else _count_bytes
+            response.streaming_content = count(response.streaming_content, *view)
+        else:
+            RESPONSE_BYTES.inc(view, len(response.content))
+        return response
+
+
+def render_metrics():
+    with _lock:
+        lines = [line for metric in METRICS for line in metric.collect()]
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint, answered only for `Authorization: Bearer
+    <METRICS_TOKEN>`. The client address is not trusted: behind the reverse
+    proxy every request arrives from 127.0.0.1. Without a token it is a 404.
+    """
+    if not settings.PERFORMANCE_METRICS_ENABLED or not settings.METRICS_TOKEN:
+        raise Http404()
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not constant_time_compare(token.strip(), settings.METRICS_TOKEN):
+        response = HttpResponse('Unauthorized', status=401, content_type='text/plain')
+        response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['owner', '-created_at', '-id'], name='photo_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photoshare',
+            index=models.Index(fields=['shared_to', 'photo'], name='share_to_photo_idx'),
+        ),
+    ]
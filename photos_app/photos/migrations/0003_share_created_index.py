@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0002_feed_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photoshare',
+            index=models.Index(fields=['shared_to', '-created_at'], name='share_to_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0003_share_created_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='photo',
+            name='file',
+            field=models.ImageField(unique=True, upload_to='uploads/'),
+        ),
+    ]
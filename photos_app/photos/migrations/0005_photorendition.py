@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:00
+
+import django.db.models.deletion
+import photos.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0004_unique_photo_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotoRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.PositiveIntegerField()),
+                ('format', models.CharField(max_length=8)),
+                ('file', models.ImageField(upload_to=photos.models.rendition_upload_to)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('photo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='photos.photo')),
+            ],
+            options={
+                'unique_together': {('photo', 'size', 'format')},
+            },
+        ),
+    ]
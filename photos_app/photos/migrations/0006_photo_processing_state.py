@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0005_photorendition'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='processing_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='processing_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='processing_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # Photos uploaded before the processing queue existed are already served as-is.
+        migrations.AddField(
+            model_name='photo',
+            name='status',
+            field=models.CharField(choices=[('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=16),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='photo',
+            name='status',
+            field=models.CharField(choices=[('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='processing', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(condition=models.Q(('status', 'processing')), fields=['processing_started_at'], name='photo_processing_queue_idx'),
+        ),
+    ]
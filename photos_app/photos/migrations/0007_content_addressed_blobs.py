@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:03
+
+import photos.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0006_photo_processing_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='photo',
+            name='file',
+            field=models.ImageField(db_index=True, storage=photos.storage.photo_storage, upload_to='uploads/'),
+        ),
+    ]
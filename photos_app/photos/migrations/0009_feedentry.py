@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+BATCH_SIZE = 5000
+
+
+def backfill_feed(apps, schema_editor):
+    Photo = apps.get_model('photos', 'Photo')
+    PhotoShare = apps.get_model('photos', 'PhotoShare')
+    FeedEntry = apps.get_model('photos', 'FeedEntry')
+
+    owned = (
+        (owner_id, photo_id, created_at, True)
+        for photo_id, owner_id, created_at in Photo.objects.values_list('id', 'owner_id', 'created_at').iterator()
+    )
+    shared = (
+        (*row, False)
+        for row in PhotoShare.objects.exclude(photo__owner_id=F('shared_to_id'))
+        .values_list('shared_to_id', 'photo_id', 'photo__created_at').iterator()
+    )
+    batch = []
+    for rows in (owned, shared):
+        for user_id, photo_id, created_at, is_owned in rows:
+            batch.append(FeedEntry(user_id=user_id, photo_id=photo_id, created_at=created_at, is_owned=is_owned))
+            if len(batch) >= BATCH_SIZE:
+                FeedEntry.objects.bulk_create(batch)
+                batch = []
+    FeedEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0008_uploadsession'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('is_owned', models.BooleanField()),
+                ('photo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='photos.photo')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at', '-photo'], name='feed_user_created_idx')],
+                'unique_together': {('user', 'photo')},
+            },
+        ),
+        migrations.RunPython(backfill_feed, migrations.RunPython.noop),
+    ]
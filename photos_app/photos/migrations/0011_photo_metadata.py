@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:24
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_taken_at(apps, schema_editor):
+    # No metadata has been read yet, so every entry falls back to its upload time.
+    FeedEntry = apps.get_model('photos', 'FeedEntry')
+    FeedEntry.objects.update(taken_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0010_photo_phash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedentry',
+            name='height',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='feedentry',
+            name='mime_type',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='feedentry',
+            name='taken_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='feedentry',
+            name='width',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='camera_make',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='camera_model',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='mime_type',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='taken_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_taken_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='feedentry',
+            name='taken_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-taken_at', '-photo'], name='feed_user_taken_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', 'mime_type', '-created_at', '-photo'], name='feed_user_mime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', 'width', 'height'], name='feed_user_size_idx'),
+        ),
+    ]
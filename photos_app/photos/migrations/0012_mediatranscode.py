@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:36
+
+import photos.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0011_photo_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaTranscode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=100)),
+                ('format', models.CharField(max_length=8)),
+                ('file', models.FileField(blank=True, max_length=200, upload_to=photos.models.transcode_upload_to)),
+                ('file_size', models.BigIntegerField(default=0)),
+                ('last_used_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at'], name='transcode_last_used_idx')],
+                'unique_together': {('source', 'format')},
+            },
+        ),
+    ]
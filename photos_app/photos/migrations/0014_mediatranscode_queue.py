@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:14
+
+from django.db import migrations, models
+
+
+def mark_existing(apps, schema_editor):
+    # Rows made on request before the queue: a file means ready, none means skipped.
+    MediaTranscode = apps.get_model('photos', 'MediaTranscode')
+    MediaTranscode.objects.exclude(file='').update(status='ready')
+    MediaTranscode.objects.filter(file='').update(status='skipped')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0013_uploadsession_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediatranscode',
+            name='encoding_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mediatranscode',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('skipped', 'Skipped')], default='pending', max_length=8),
+        ),
+        migrations.AddIndex(
+            model_name='mediatranscode',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['encoding_started_at'], name='transcode_queue_idx'),
+        ),
+        migrations.RunPython(mark_existing, migrations.RunPython.noop),
+    ]
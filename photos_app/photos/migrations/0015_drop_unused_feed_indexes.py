@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:53
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0014_mediatranscode_queue'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='photo',
+            name='photo_owner_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='photoshare',
+            name='share_to_created_idx',
+        ),
+    ]
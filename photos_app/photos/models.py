@@ -1,14 +1,94 @@
-from django.db import models
+import os
+import uuid
+from collections import Counter
+from concurrent.futures import wait
+from functools import partial
+
+from django.conf import settings
+
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .storage import delete_in_background, photo_storage
+
+class PhotoQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Delete the photos with set-based bookkeeping: one query each for the
+        sharers, renditions and blob counts instead of several per photo. The
+        per-instance signal handlers skip deletes that originate here.
+        """
+        from .access import invalidate_media_access
+        from .renditions import invalidate_renditions
+
+        photos = list(self.values_list('id', 'owner_id', 'file'))
+        if not photos:
+            return 0, {}
+        ids = [pk for pk, _, _ in photos]
+        users_by_file = {name: {owner_id} for _, owner_id, name in photos}
+        for name, user_id in PhotoShare.objects.filter(photo_id__in=ids).values_list('photo__file', 'shared_to_id'):
+            users_by_file[name].add(user_id)
+        renditions = [
+            name for name in PhotoRendition.objects.filter(photo_id__in=ids).values_list('file', flat=True) if name
+        ]
+
+        with transaction.atomic(using=self.db):
+            result = super(PhotoQuerySet, Photo.objects.filter(pk__in=ids)).delete()
+            Blob.objects.release_many(Counter(name for _, _, name in photos if name), background=True)
+
+        for name, user_ids in users_by_file.items():
+            invalidate_media_access(user_ids, name)
+        invalidate_renditions(users_by_file)
+        if renditions:
+            storage = PhotoRendition._meta.get_field('file').storage
+            transaction.on_commit(partial(delete_in_background, storage, renditions), using=self.db)
+        return result
 
 class Photo(models.Model):
+    class Status(models.TextChoices):
+        PROCESSING = 'processing'
+        READY = 'ready'
+        FAILED = 'failed'
+
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='photos')
-    file = models.ImageField(upload_to='uploads/')
+    file = models.ImageField(upload_to='uploads/', storage=photo_storage, db_index=True)
     original_name = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PROCESSING)
+    processing_attempts = models.PositiveSmallIntegerField(default=0)
+    processing_error = models.TextField(blank=True)
+    processing_started_at = models.DateTimeField(null=True, blank=True)
+    # Read from the file by the pipeline (see metadata.py); empty until then.
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    mime_type = models.CharField(max_length=32, blank=True)
+    taken_at = models.DateTimeField(null=True, blank=True)
+    camera_make = models.CharField(max_length=64, blank=True)
+    camera_model = models.CharField(max_length=64, blank=True)
+    # 64-bit dHash (see similarity.py) and its four 16-bit chunks, each indexed.
+    phash = models.BigIntegerField(null=True, blank=True)
+    phash_0 = models.PositiveIntegerField(null=True, blank=True)
+    phash_1 = models.PositiveIntegerField(null=True, blank=True)
+    phash_2 = models.PositiveIntegerField(null=True, blank=True)
+    phash_3 = models.PositiveIntegerField(null=True, blank=True)
+
+    objects = PhotoQuerySet.as_manager()
 
     class Meta:
         app_label = 'photos'
+        indexes = [
+            models.Index(
+                fields=['processing_started_at'],
+                condition=models.Q(status='processing'),
+                name='photo_processing_queue_idx',
+            ),
+            models.Index(fields=['phash_0'], name='photo_phash_0_idx'),
+            models.Index(fields=['phash_1'], name='photo_phash_1_idx'),
+            models.Index(fields=['phash_2'], name='photo_phash_2_idx'),
+            models.Index(fields=['phash_3'], name='photo_phash_3_idx'),
+        ]
 
 class PhotoShare(models.Model):
     photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name='shares')
@@ -18,3 +98,194 @@ class PhotoShare(models.Model):
     class Meta:
         app_label = 'photos'
         unique_together = ('photo', 'shared_to')
+        indexes = [
+            models.Index(fields=['shared_to', 'photo'], name='share_to_photo_idx'),
+        ]
+
+class FeedEntry(models.Model):
+    """A photo in a user's gallery, denormalized so the feed reads one index range."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_entries')
+    photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name='feed_entries')
+    created_at = models.DateTimeField()
+    is_owned = models.BooleanField()
+    # Copies of the photo's metadata for filtering; taken_at falls back to created_at.
+    taken_at = models.DateTimeField()
+    width = models.PositiveIntegerField(null=True)
+    height = models.PositiveIntegerField(null=True)
+    mime_type = models.CharField(max_length=32, blank=True)
+
+    class Meta:
+        app_label = 'photos'
+        unique_together = ('user', 'photo')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-photo'], name='feed_user_created_idx'),
+            models.Index(fields=['user', '-taken_at', '-photo'], name='feed_user_taken_idx'),
+            models.Index(fields=['user', 'mime_type', '-created_at', '-photo'], name='feed_user_mime_idx'),
+            models.Index(fields=['user', 'width', 'height'], name='feed_user_size_idx'),
+        ]
+
+
+def delete_unreferenced_blobs(names, background=False):
+    """
+    Delete the files in `names` that neither a Blob reference nor a photo
+    uses. Runs after the releasing transaction commits, with the Blob rows
+    locked until the files are gone: an upload reusing one of them has either
+    taken its reference first, which keeps the file, or waits in
+    BlobManager.acquire_many() and writes the bytes again with restore_blob().
+    """
+    with transaction.atomic():
+        # Placeholder rows give files without one (from before refcounting) a lock too.
+        Blob.objects.bulk_create([Blob(name=name, size=0, ref_count=0) for name in names], ignore_conflicts=True)
+        counts = dict(Blob.objects.select_for_update().filter(name__in=names).values_list('name', 'ref_count'))
+        in_use = {name for name, ref_count in counts.items() if ref_count}
+        in_use.update(Photo.objects.filter(file__in=names).values_list('file', flat=True))
+        Blob.objects.filter(name__in=names, ref_count=0).delete()
+        names = [name for name in names if name not in in_use]
+        MediaTranscode.objects.filter(source__in=names).delete()
+        if background:
+            wait(delete_in_background(photo_storage(), names))
+        else:
+            for name in names:
+                photo_storage().delete(name)
+
+
+def restore_blob(name, content):
+    """
+    Write `content` back to `name` if a concurrent delete unlinked it after
+    the upload found the bytes already stored. Call once the new photo holds
+    its Blob reference, so that no later delete can remove the file.
+    """
+    storage = photo_storage()
+    if not storage.exists(name):
+        storage.save(name, content)
+
+def _by_name(counts, expression):
+    return Case(*(When(name=name, then=Value(count)) for name, count in counts.items()), default=expression)
+
+class BlobManager(models.Manager):
+    def acquire(self, name, size):
+        self.acquire_many({name: size}, Counter([name]))
+
+    def acquire_many(self, sizes, counts):
+        """Add ``counts[name]`` references to each blob, creating missing rows."""
+        with transaction.atomic():
+            names = set(counts)
+            for _ in range(2):
+                self.bulk_create(
+                    [Blob(name=name, size=sizes[name], ref_count=0) for name in names], ignore_conflicts=True,
+                )
+                # Waits for a delete_unreferenced_blobs() holding the rows; one
+                # that committed meanwhile took them along, so create them again.
+                names -= set(self.select_for_update().filter(name__in=names).values_list('name', flat=True))
+            increments = _by_name(counts, Value(0))
+            self.filter(name__in=counts).update(ref_count=F('ref_count') + increments)
+
+    def release(self, name):
+        self.release_many(Counter([name]))
+
+    def release_many(self, counts, background=False):
+        """Drop ``counts[name]`` references; files left unreferenced are deleted after commit."""
+        with transaction.atomic():
+            blobs = dict(self.select_for_update().filter(name__in=counts).values_list('name', 'ref_count'))
+            gone = [name for name, ref_count in blobs.items() if ref_count <= counts[name]]
+            kept = {name: counts[name] for name in blobs if name not in gone}
+            if gone:
+                # delete_unreferenced_blobs() removes these together with their files.
+                self.filter(name__in=gone).update(ref_count=0)
+            if kept:
+                self.filter(name__in=kept).update(ref_count=F('ref_count') - _by_name(kept, Value(0)))
+        # Files without a Blob row predate refcounting and go with their last photo.
+        orphans = [name for name in counts if name not in kept]
+        if orphans:
+            transaction.on_commit(partial(delete_unreferenced_blobs, orphans, background))
+
+class Blob(models.Model):
+    """A stored upload file and the number of photos that reference it."""
+    name = models.CharField(max_length=100, unique=True)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = BlobManager()
+
+    class Meta:
+        app_label = 'photos'
+
+def rendition_upload_to(instance, filename):
+    return f'renditions/{instance.photo_id}/{filename}'
+
+class PhotoRendition(models.Model):
+    photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name='renditions')
+    size = models.PositiveIntegerField()
+    format = models.CharField(max_length=8)
+    file = models.ImageField(upload_to=rendition_upload_to)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'photos'
+        unique_together = ('photo', 'size', 'format')
+
+
+def transcode_upload_to(instance, filename):
+    return f'transcodes/{filename}'
+
+class MediaTranscode(models.Model):
+    """
+    A full-size WebP/AVIF encoding of an original file, queued on first
+    request, encoded by the process_photos worker and evicted least recently
+    used first (see transcoding.py). Until it is ready, and for good once it
+    is skipped (no saving, or the source could not be transcoded), the
+    original is served instead.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        READY = 'ready'
+        SKIPPED = 'skipped'
+
+    source = models.CharField(max_length=100)
+    format = models.CharField(max_length=8)
+    status = models.CharField(max_length=8, choices=Status.choices, default=Status.PENDING)
+    encoding_started_at = models.DateTimeField(null=True, blank=True)
+    file = models.FileField(upload_to=transcode_upload_to, max_length=200, blank=True)
+    file_size = models.BigIntegerField(default=0)
+    last_used_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'photos'
+        unique_together = ('source', 'format')
+        indexes = [
+            models.Index(fields=['last_used_at'], name='transcode_last_used_idx'),
+            models.Index(
+                fields=['encoding_started_at'],
+                condition=models.Q(status='pending'),
+                name='transcode_queue_idx',
+            ),
+        ]
+
+
+class UploadSession(models.Model):
+    """A resumable upload in progress; the received bytes live in a part file."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever a chunk is stored; expiry counts from here.
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        app_label = 'photos'
+
+    @property
+    def path(self):
+        return os.path.join(settings.RESUMABLE_UPLOAD_DIR, f'{self.id}.part')
+
+    @property
+    def offset(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
@@ -0,0 +1,103 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class FeedCursorPagination(BasePagination):
+    """
+    Keyset pagination over (created_at, id), newest first, or over another
+    (datetime, id) key for views whose get_feed_page() sorts differently.
+
+    The cursor is the position of the last item on the previous page, so
+    fetching a page is a bounded index range scan no matter how deep it is.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 200
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        if hasattr(view, 'get_feed_page'):
+            rows = list(view.get_feed_page(position, self.page_size + 1))
+        else:
+            rows = list(self.get_page(queryset, position, self.page_size + 1))
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_page(self, queryset, position, limit):
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position))
+        return queryset.order_by(*self.ordering)[:limit]
+
+    @staticmethod
+    def keyset_filter(position, prefix='', pk_field='id', field='created_at', descending=True):
+        value, pk = position
+        op = 'lt' if descending else 'gt'
+        return (
+            Q(**{f'{prefix}{field}__{op}': value})
+            | Q(**{f'{prefix}{field}': value, f'{prefix}{pk_field}__{op}': pk})
+        )
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            created_at, pk = raw.rsplit('|', 1)
+            position = (parse_datetime(created_at), int(pk))
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if position[0] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        created_at, pk = position
+        raw = f'{created_at.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        # Feeds sorted by another column record each item's position on it.
+        position = getattr(last, 'feed_position', None) or (last.created_at, last.id)
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,11 @@
+from rest_framework.permissions import BasePermission
+
+from .signing import verify_media_signature
+
+
+class HasValidMediaSignature(BasePermission):
+    """Grants access to a media path through an unexpired signed URL."""
+
+    def has_permission(self, request, view):
+        path = view.kwargs.get('path')
+        return path is not None and verify_media_signature(path, request.GET) is not None
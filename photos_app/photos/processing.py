@@ -0,0 +1,98 @@
+"""
+Post-upload work (decoding, renditions, ...) runs outside the upload request.
+
+Photos are their own queue: a new upload is saved with status 'processing',
+and the ``process_photos`` worker claims batches of them, runs PIPELINE in a
+process pool and marks each one ready, or failed after
+PHOTO_PROCESSING_MAX_ATTEMPTS attempts. A claim is a lease: a photo whose
+worker died is picked up again once PHOTO_PROCESSING_LEASE has passed.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .models import Photo
+from .metadata import extract_metadata
+from .renditions import generate_renditions
+from .similarity import compute_phash
+
+logger = logging.getLogger(__name__)
+
+PIPELINE = [
+    extract_metadata,
+    generate_renditions,
+    compute_phash,
+]
+
+
+def enqueue_photo(photo):
+    if settings.PHOTO_PROCESSING_BACKEND == 'eager':
+        transaction.on_commit(lambda: process_claimed(claim_photos(ids=[photo.id])))
+
+
+def claim_photos(limit=None, ids=None):
+    """Lease up to `limit` queued photos to the caller and return their ids."""
+    now = timezone.now()
+    expired = now - timedelta(seconds=settings.PHOTO_PROCESSING_LEASE)
+    queued = Photo.objects.filter(
+        Q(processing_started_at__isnull=True) | Q(processing_started_at__lt=expired),
+        status=Photo.Status.PROCESSING,
+    )
+    if ids is not None:
+        queued = queued.filter(id__in=ids)
+
+    with transaction.atomic():
+        claimed = queued.select_for_update(skip_locked=True).order_by('id').values_list('id', flat=True)
+        claimed = list(claimed[:limit] if limit else claimed)
+        Photo.objects.filter(id__in=claimed).update(
+            processing_started_at=now,
+            processing_attempts=F('processing_attempts') + 1,
+        )
+    return claimed
+
+
+def run_pipeline(photo_id):
+    """Process one photo. Returns None on success or the formatted error."""
+    try:
+        photo = Photo.objects.get(pk=photo_id)
+    except Photo.DoesNotExist:
+        return None
+    try:
+        for step in PIPELINE:
+            step(photo)
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+def finish_photo(photo_id, error=None):
+    if error is None:
+        Photo.objects.filter(pk=photo_id).update(
+            status=Photo.Status.READY, processing_error='', processing_started_at=None,
+        )
+        return
+
+    logger.warning('Processing photo %s failed:\n%s', photo_id, error)
+    Photo.objects.filter(pk=photo_id).update(
+        status=Case(
+            When(processing_attempts__gte=settings.PHOTO_PROCESSING_MAX_ATTEMPTS, then=Value(Photo.Status.FAILED)),
+            default=Value(Photo.Status.PROCESSING),
+        ),
+        processing_error=error,
+        processing_started_at=None,
+    )
+
+
+def process_claimed(photo_ids, executor=None):
+    """Run the pipeline for claimed photos, in `executor` when one is given."""
+    if executor is None:
+        results = map(run_pipeline, photo_ids)
+    else:
+        results = executor.map(run_pipeline, photo_ids)
+    for photo_id, error in zip(photo_ids, results):
+        finish_photo(photo_id, error)
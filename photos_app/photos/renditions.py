@@ -0,0 +1,131 @@
+"""
+Downscaled copies of uploaded photos for gallery tiles and previews.
+
+Renditions are generated with Pillow, stored next to the uploads and tracked
+by PhotoRendition rows, so each (photo, size, format) is encoded once. The
+stored name is cached per (path, size, format) for MEDIA_LOOKUP_CACHE_TTL
+seconds, so serving a known rendition runs no queries.
+"""
+import hashlib
+import io
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from PIL import Image, ImageOps, features
+
+from .models import Photo, PhotoRendition
+
+logger = logging.getLogger(__name__)
+
+# format name -> (Pillow format, file extension, content type, save options)
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4}),
+    'avif': ('AVIF', 'avif', 'image/avif', {'quality': 60}),
+}
+
+
+def supported_formats():
+    formats = []
+    for name in settings.PHOTO_RENDITION_FORMATS:
+        if name == 'jpeg' or (name in FORMATS and features.check(name)):
+            formats.append(name)
+    return formats
+
+
+def content_type_for(fmt):
+    return FORMATS[fmt][2]
+
+
+def load_image(file, size=None):
+    """Decode an upload, at reduced scale for JPEGs when only `size` px are needed."""
+    with file.open('rb'), Image.open(file) as image:
+        if size and image.format == 'JPEG':
+            # Let libjpeg decode at a fraction of the resolution instead of the full frame.
+            image.draft('RGB', (size, size))
+        return ImageOps.exif_transpose(image)
+
+
+def encode(image, size, fmt):
+    pil_format, _, _, options = FORMATS[fmt]
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA')
+    else:
+        image = image.copy()
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return ContentFile(buffer.getvalue()), image.size
+
+
+def create_rendition(photo, image, size, fmt):
+    content, (width, height) = encode(image, size, fmt)
+    rendition = PhotoRendition(photo=photo, size=size, format=fmt, width=width, height=height)
+    rendition.file.save(f'{size}.{FORMATS[fmt][1]}', content, save=False)
+    try:
+        with transaction.atomic():
+            rendition.save()
+    except IntegrityError:
+        # Another request generated the same rendition first; keep theirs.
+        rendition.file.delete(save=False)
+        return PhotoRendition.objects.get(photo=photo, size=size, format=fmt)
+    return rendition
+
+
+def _cache_key(path, size, fmt):
+    digest = hashlib.md5(path.encode('utf-8')).hexdigest()
+    return f'media-rendition:{digest}:{size}:{fmt}'
+
+
+def get_rendition(path, size, fmt):
+    """Return the rendition of the photo stored at `path`, generating it on first use."""
+    key = _cache_key(path, size, fmt)
+    name = cache.get(key)
+    if name is not None:
+        return PhotoRendition(size=size, format=fmt, file=name)
+    rendition = PhotoRendition.objects.filter(photo__file=path, size=size, format=fmt).first()
+    if rendition is None:
+        photo = Photo.objects.filter(file=path).first()
+        if photo is None:
+            raise Photo.DoesNotExist(path)
+        rendition = create_rendition(photo, load_image(photo.file, size), size, fmt)
+    cache.set(key, rendition.file.name, settings.MEDIA_LOOKUP_CACHE_TTL)
+    return rendition
+
+
+async def aget_rendition(path, size, fmt):
+    """get_rendition() for async views; only a lookup or render that misses the cache runs in a thread."""
+    name = await cache.aget(_cache_key(path, size, fmt))
+    if name is not None:
+        return PhotoRendition(size=size, format=fmt, file=name)
+    return await sync_to_async(get_rendition)(path, size, fmt)
+
+
+def invalidate_renditions(paths):
+    """Forget the cached renditions of `paths`, whose photos are being deleted."""
+    cache.delete_many([
+        _cache_key(path, size, fmt) for path in paths for size in settings.PHOTO_RENDITION_SIZES for fmt in FORMATS
+    ])
+
+
+def generate_renditions(photo):
+    """Create every configured size and format that does not exist yet."""
+    existing = set(photo.renditions.values_list('size', 'format'))
+    missing = [
+        (size, fmt)
+        for size in sorted(settings.PHOTO_RENDITION_SIZES, reverse=True)
+        for fmt in supported_formats()
+        if (size, fmt) not in existing
+    ]
+    if not missing:
+        return
+    image = load_image(photo.file, max(size for size, _ in missing))
+    for size, fmt in missing:
+        create_rendition(photo, image, size, fmt)
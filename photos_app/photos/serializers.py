@@ -1,28 +1,75 @@
 from rest_framework import serializers
-from .models import Photo, PhotoShare
+from .feed import SORTS
+from .models import Photo, PhotoShare, UploadSession
+from .signing import signed_media_url
+from .uploads import InvalidImage, validate_image_upload
 from django.contrib.auth.models import User
+from django.conf import settings
+
+class ImageUploadField(serializers.FileField):
+    """A file that must be a supported image, judged from its header alone (see uploads.py)."""
+
+    def to_internal_value(self, data):
+        rejection = getattr(data, 'rejection', None)
+        if rejection:
+            raise serializers.ValidationError(rejection)
+        file = super().to_internal_value(data)
+        try:
+            validate_image_upload(file)
+        except InvalidImage as exc:
+            raise serializers.ValidationError(str(exc))
+        return file
 
 class PhotoSerializer(serializers.ModelSerializer):
     original_name = serializers.CharField(required=False, allow_blank=True)
-    file = serializers.FileField(required=True)
+    file = ImageUploadField(required=True)
     isOwned = serializers.SerializerMethodField()
+    url = serializers.SerializerMethodField()
 
     class Meta:
         model = Photo
-        fields = ['id', 'original_name', 'file', 'created_at', 'isOwned']
+        fields = [
+            'id', 'original_name', 'file', 'url', 'created_at', 'status', 'isOwned',
+            'width', 'height', 'mime_type', 'taken_at', 'camera_make', 'camera_model',
+        ]
+        read_only_fields = ['status', 'width', 'height', 'mime_type', 'taken_at', 'camera_make', 'camera_model']
 
     def get_isOwned(self, obj):
         request = self.context.get('request')
         if request and hasattr(request, 'user'):
-            return obj.owner == request.user
+            return obj.owner_id == request.user.id
         return False
 
+    def get_url(self, obj):
+        # Signed for the requesting user so <img> tags can load it without a token.
+        request = self.context.get('request')
+        if not request or not obj.file or not request.user.is_authenticated:
+            return None
+        return request.build_absolute_uri(signed_media_url(request.user.id, obj.file.name))
+
     def to_representation(self, instance):
         data = super().to_representation(instance)
         if instance.file and instance.file.name:
             data['file'] = instance.file.name
         return data
 
+class SimilarPhotoSerializer(PhotoSerializer):
+    distance = serializers.IntegerField(read_only=True)
+
+    class Meta(PhotoSerializer.Meta):
+        fields = PhotoSerializer.Meta.fields + ['distance']
+
+class FeedQuerySerializer(serializers.Serializer):
+    """Filter and sort query params of the photo feed."""
+    taken_after = serializers.DateTimeField(required=False)
+    taken_before = serializers.DateTimeField(required=False)
+    min_width = serializers.IntegerField(required=False, min_value=0)
+    max_width = serializers.IntegerField(required=False, min_value=0)
+    min_height = serializers.IntegerField(required=False, min_value=0)
+    max_height = serializers.IntegerField(required=False, min_value=0)
+    mime_type = serializers.CharField(required=False, max_length=32)
+    sort = serializers.ChoiceField(choices=list(SORTS), default='-created_at')
+
 class PhotoShareSerializer(serializers.ModelSerializer):
     shared_to = serializers.EmailField(write_only=True)
 
@@ -45,4 +92,36 @@ class PhotoShareSerializer(serializers.ModelSerializer):
         except User.DoesNotExist:
             raise serializers.ValidationError(f"User with email {value} does not exist.")
         
-        return value
\ No newline at end of file
+        return value
+
+class BulkShareSerializer(serializers.Serializer):
+    photos = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    emails = serializers.ListField(child=serializers.EmailField(), allow_empty=False, max_length=100)
+
+    def validate(self, attrs):
+        # Keep request order for the per-item results but drop repeats.
+        attrs['photos'] = list(dict.fromkeys(attrs['photos']))
+        attrs['emails'] = list(dict.fromkeys(attrs['emails']))
+        return attrs
+
+class BulkDeleteSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+
+class ExportQuerySerializer(serializers.Serializer):
+    """``?ids=`` (repeatable) picks photos to export; without it everything visible is exported."""
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False, max_length=1000)
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'offset', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+    def validate_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Size must be positive.")
+        if value > settings.PHOTO_MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError(f"Uploads are limited to {settings.PHOTO_MAX_UPLOAD_SIZE} bytes.")
+        return value
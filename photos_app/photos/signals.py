@@ -0,0 +1,91 @@
+import os
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .access import invalidate_media_access
+from .feed import photo_entry_values
+from .models import (
+    Blob, FeedEntry, MediaTranscode, Photo, PhotoQuerySet, PhotoRendition, PhotoShare, UploadSession,
+)
+from .renditions import invalidate_renditions
+from .transcoding import invalidate_transcode
+
+
+def _deleted_with_photo(origin):
+    if isinstance(origin, QuerySet):
+        return origin.model is Photo
+    return isinstance(origin, Photo)
+
+
+def _bulk_delete(origin):
+    # PhotoQuerySet.delete() does this bookkeeping once for the whole batch.
+    return isinstance(origin, PhotoQuerySet)
+
+
+@receiver(post_save, sender=Photo)
+def photo_created(sender, instance, created, **kwargs):
+    if not created:
+        return
+    if instance.file:
+        Blob.objects.acquire(instance.file.name, instance.file.size)
+        # The path may be shared with an existing photo the owner was denied.
+        invalidate_media_access([instance.owner_id], instance.file.name)
+    FeedEntry.objects.create(user_id=instance.owner_id, photo=instance, is_owned=True, **photo_entry_values(instance))
+
+
+@receiver(post_delete, sender=Photo)
+def photo_deleted(sender, instance, origin=None, **kwargs):
+    if instance.file and not _bulk_delete(origin):
+        Blob.objects.release(instance.file.name)
+
+
+@receiver(post_save, sender=PhotoShare)
+def share_created(sender, instance, created, **kwargs):
+    if created:
+        invalidate_media_access([instance.shared_to_id], instance.photo.file.name)
+        if instance.photo.owner_id != instance.shared_to_id:
+            FeedEntry.objects.get_or_create(
+                user_id=instance.shared_to_id, photo_id=instance.photo_id,
+                defaults={'is_owned': False, **photo_entry_values(instance.photo)},
+            )
+
+
+@receiver(post_delete, sender=PhotoShare)
+def share_deleted(sender, instance, origin=None, **kwargs):
+    # Cascades from a photo delete are handled once in photo_deleting and
+    # the photo's feed entries go with it.
+    if not _deleted_with_photo(origin):
+        invalidate_media_access([instance.shared_to_id], instance.photo.file.name)
+        FeedEntry.objects.filter(user_id=instance.shared_to_id, photo_id=instance.photo_id, is_owned=False).delete()
+
+
+@receiver(pre_delete, sender=Photo)
+def photo_deleting(sender, instance, origin=None, **kwargs):
+    if _bulk_delete(origin):
+        return
+    user_ids = [instance.owner_id, *instance.shares.values_list('shared_to_id', flat=True)]
+    invalidate_media_access(user_ids, instance.file.name)
+    invalidate_renditions([instance.file.name])
+
+
+@receiver(post_delete, sender=PhotoRendition)
+def rendition_deleted(sender, instance, origin=None, **kwargs):
+    if instance.file and not _bulk_delete(origin):
+        instance.file.delete(save=False)
+
+
+@receiver(post_delete, sender=MediaTranscode)
+def transcode_deleted(sender, instance, **kwargs):
+    invalidate_transcode(instance.source, instance.format)
+    if instance.file:
+        instance.file.delete(save=False)
+
+
+@receiver(post_delete, sender=UploadSession)
+def upload_session_deleted(sender, instance, **kwargs):
+    try:
+        os.remove(instance.path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,97 @@
+"""
+Near-duplicate search over perceptual hashes.
+
+Every processed photo gets a 64-bit dHash: the sign of the horizontal
+gradient on a 9x8 grayscale thumbnail, which survives re-encoding, resizing
+and small edits. Similar photos have hashes a few bits apart.
+
+The hash is also stored as four 16-bit chunks in separate indexed columns
+(multi-index hashing). Two hashes within Hamming distance 3 must agree exactly
+on at least one chunk, so a lookup is four equality probes on B-tree indexes
+followed by an exact distance check on the few candidates, never a scan.
+"""
+from django.db.models import Q
+from PIL import Image
+
+from .models import Photo
+from .renditions import load_image
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+HASH_MASK = (1 << HASH_BITS) - 1
+
+# The pigeonhole guarantee above only holds for distances below CHUNKS.
+MAX_DISTANCE = CHUNKS - 1
+
+# Bounds the work for pathological hashes shared by huge numbers of photos
+# (e.g. blank frames); real near-duplicate clusters are far smaller.
+MAX_CANDIDATES = 2000
+
+
+def dhash(image):
+    """The 64-bit difference hash of a Pillow image."""
+    small = image.convert('L').resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left, right = pixels[row * 9 + col], pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def to_signed(value):
+    # 64-bit unsigned hashes go into a signed BIGINT column.
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def from_signed(value):
+    return value & HASH_MASK
+
+
+def hash_chunks(value):
+    return [(value >> (CHUNK_BITS * i)) & CHUNK_MASK for i in range(CHUNKS)]
+
+
+def hash_fields(value):
+    fields = {f'phash_{i}': chunk for i, chunk in enumerate(hash_chunks(value))}
+    fields['phash'] = to_signed(value)
+    return fields
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def compute_phash(photo):
+    """Pipeline step: hash the photo and store the hash with its index chunks."""
+    # 64px is plenty for a 9x8 grid and lets JPEGs decode at reduced scale.
+    value = dhash(load_image(photo.file, 64))
+    Photo.objects.filter(pk=photo.pk).update(**hash_fields(value))
+
+
+def similar_photos(photo, queryset, max_distance=MAX_DISTANCE):
+    """
+    Photos from `queryset` (excluding `photo`) whose hash is within
+    `max_distance` bits of `photo`'s, as (distance, photo) pairs, closest first.
+    """
+    if photo.phash is None:
+        return []
+    if not 0 <= max_distance <= MAX_DISTANCE:
+        raise ValueError(f'max_distance must be between 0 and {MAX_DISTANCE}')
+
+    value = from_signed(photo.phash)
+    probe = Q()
+    for i, chunk in enumerate(hash_chunks(value)):
+        probe |= Q(**{f'phash_{i}': chunk})
+    candidates = queryset.filter(probe).exclude(pk=photo.pk)[:MAX_CANDIDATES]
+
+    matches = []
+    for candidate in candidates:
+        distance = hamming(value, from_signed(candidate.phash))
+        if distance <= max_distance:
+            matches.append((distance, candidate))
+    matches.sort(key=lambda match: (match[0], -match[1].created_at.timestamp(), -match[1].id))
+    return matches
@@ -0,0 +1,256 @@
+"""
+Content-addressed storage for photo uploads.
+
+Each upload is stored once under ``blobs/<aa>/<bb>/<sha256><ext>``; the digest
+is computed in the same pass that writes the bytes, and an upload whose digest
+is already stored is dropped instead of stored again. Blob rows count the
+photos that reference each file so the bytes are removed with the last one.
+
+Files live under MEDIA_ROOT by default. With PHOTO_STORAGE_BACKEND=s3 they go
+to an S3-compatible object store (AWS, MinIO, ...) through boto3 instead, so
+any number of web nodes can share them.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, Storage, storages
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = 'blobs'
+EXTENSION_RE = re.compile(r'^\.[a-z0-9]{1,8}$')
+
+# What delivery needs to build validators for a stored file; os.stat_result fits too.
+ObjectStat = namedtuple('ObjectStat', 'st_size st_mtime st_mtime_ns')
+
+# Bulk deletes unlink their files here, several at a time.
+_deleter = ThreadPoolExecutor(max_workers=4, thread_name_prefix='photo-delete')
+_pending = set()
+
+
+def photo_storage():
+    return storages['photos']
+
+
+def delete_in_background(storage, names):
+    futures = []
+    for name in names:
+        future = _deleter.submit(storage.delete, name)
+        _pending.add(future)
+        future.add_done_callback(_pending.discard)
+        futures.append(future)
+    return futures
+
+
+def wait_for_background_deletes():
+    wait(list(_pending))
+
+
+class ContentAddressedMixin:
+
+    def blob_name(self, digest, extension):
+        return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+    def blob_extension(self, name):
+        extension = os.path.splitext(name)[1].lower()
+        return extension if EXTENSION_RE.match(extension) else ''
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from content in _save(); equal names mean equal bytes.
+        return name
+
+
+class ContentAddressedStorage(ContentAddressedMixin, FileSystemStorage):
+
+    def _save(self, name, content):
+        extension = self.blob_extension(name)
+
+        tmp_dir = self.path(f'{BLOB_DIR}/tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+
+        if hasattr(content, 'temporary_file_path'):
+            # Already spooled to disk by the upload handler: hash it and move it into place.
+            tmp_path = content.temporary_file_path()
+            for chunk in content.chunks():
+                digest.update(chunk)
+            moved = False
+        else:
+            fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    for chunk in content.chunks():
+                        digest.update(chunk)
+                        out.write(chunk)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            moved = True
+
+        name = self.blob_name(digest.hexdigest(), extension)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            if moved:
+                os.remove(tmp_path)
+            return name
+
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if moved:
+            os.replace(tmp_path, full_path)
+        else:
+            file_move_safe(tmp_path, full_path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return name
+
+    def delete(self, name):
+        super().delete(name)
+        if not name.startswith(f'{BLOB_DIR}/'):
+            return
+        # Drop the now-empty fan-out directories as well.
+        directory = os.path.dirname(self.path(name))
+        for _ in range(2):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+
+
+def _missing(error):
+    return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+
+@deconstructible
+class S3Storage(Storage):
+    """
+    Files in an S3-compatible bucket. Writes are streamed with boto3's managed
+    multipart upload; reads are spooled so callers get a seekable file; url()
+    returns a presigned GET that expires after `querystring_expire` seconds.
+    """
+
+    def __init__(self, bucket_name=None, endpoint_url=None, region_name=None, access_key=None,
+                 secret_key=None, location='', querystring_expire=3600,
+                 multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024,
+                 spool_max_size=8 * 1024 * 1024):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+        except ImportError:
+            raise ImproperlyConfigured('The S3 storage backend requires boto3 (pip install boto3).')
+        if not bucket_name:
+            raise ImproperlyConfigured('S3Storage needs a bucket_name.')
+
+        self.bucket_name = bucket_name
+        self.location = location.strip('/')
+        self.querystring_expire = querystring_expire
+        self.spool_max_size = spool_max_size
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold, multipart_chunksize=multipart_chunksize,
+        )
+        self.client = boto3.client(
+            's3', endpoint_url=endpoint_url, region_name=region_name,
+            aws_access_key_id=access_key, aws_secret_access_key=secret_key,
+        )
+
+    def _key(self, name):
+        return f'{self.location}/{name}' if self.location else name
+
+    def _head(self, name):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket_name, Key=self._key(name))
+        except ClientError as error:
+            if _missing(error):
+                raise FileNotFoundError(name)
+            raise
+
+    def _upload(self, name, fileobj, content_type=None):
+        extra = {'ContentType': content_type} if content_type else {}
+        self.client.upload_fileobj(
+            fileobj, self.bucket_name, self._key(name), ExtraArgs=extra, Config=self.transfer_config,
+        )
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode:
+            raise ValueError('S3Storage files are read-only; use save().')
+        from botocore.exceptions import ClientError
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_max_size)
+        try:
+            self.client.download_fileobj(self.bucket_name, self._key(name), spool, Config=self.transfer_config)
+        except ClientError as error:
+            spool.close()
+            if _missing(error):
+                raise FileNotFoundError(name)
+            raise
+        spool.seek(0)
+        return File(spool, name)
+
+    def _save(self, name, content):
+        content.seek(0)
+        self._upload(name, content, getattr(content, 'content_type', None))
+        return name
+
+    def exists(self, name):
+        try:
+            self._head(name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket_name, Key=self._key(name))
+
+    def stat(self, name):
+        head = self._head(name)
+        modified = head['LastModified'].timestamp()
+        return ObjectStat(head['ContentLength'], modified, int(modified * 1_000_000_000))
+
+    def size(self, name):
+        return self.stat(name).st_size
+
+    def get_modified_time(self, name):
+        modified = self._head(name)['LastModified'].astimezone(dt_timezone.utc)
+        return modified if settings.USE_TZ else timezone.make_naive(modified)
+
+    def url(self, name):
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket_name, 'Key': self._key(name)},
+            ExpiresIn=self.querystring_expire,
+        )
+
+
+@deconstructible
+class S3ContentAddressedStorage(ContentAddressedMixin, S3Storage):
+
+    def _save(self, name, content):
+        extension = self.blob_extension(name)
+        digest = hashlib.sha256()
+
+        if hasattr(content, 'temporary_file_path'):
+            # Already on local disk: hash it in place, then stream it from there.
+            for chunk in content.chunks():
+                digest.update(chunk)
+            source = open(content.temporary_file_path(), 'rb')
+        else:
+            source = tempfile.SpooledTemporaryFile(max_size=self.spool_max_size)
+            for chunk in content.chunks():
+                digest.update(chunk)
+                source.write(chunk)
+            source.seek(0)
+
+        name = self.blob_name(digest.hexdigest(), extension)
+        with source:
+            if not self.exists(name):
+                self._upload(name, source, getattr(content, 'content_type', None))
+        return name
@@ -2,24 +2,57 @@ from django.contrib.auth.models import User
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.core.files.uploadedfile import SimpleUploadedFile
-from .models import Photo, PhotoShare
+from .feed import add_owner_entries, add_share_entries, diff_feed, rebuild_feed
+from .models import Blob, FeedEntry, MediaTranscode, Photo, PhotoRendition, PhotoShare, UploadSession
+from .processing import claim_photos, process_claimed
+from .renditions import supported_formats
+from PIL import Image
+from asgiref.sync import sync_to_async
+import io
 import os
+import unittest
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
 TEST_IMAGE_CONTENT = b'GIF89a\x01\x00\x01\x00\x80\x00\x00\xff\xff\xff\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;'
 TEST_TEXT_CONTENT = b'This is not an image.'
 
-class PhotoAPITests(APITestCase):
+class PhotoTestCase(APITestCase):
+    """Creates user1 and user2, clears the cache and logs the client in as user1."""
+
+    passwords = {'user1': 'Password1', 'user2': 'Password2'}
 
     def setUp(self):
         self.user1 = User.objects.create_user(username='user1', password='Password1', email='user1@example.com')
         self.user2 = User.objects.create_user(username='user2', password='Password2', email='user2@example.com')
-
         os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
-        
-        login_resp = self.client.post('/api/auth/login/', {'username': 'user1', 'password': 'Password1'})
-        self.token1 = login_resp.data['access']
-        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token1}')
+        cache.clear()
+        self.token1 = self._login('user1', 'Password1')
+
+    def _get_token(self, user, password):
+        login_resp = self.client.post('/api/auth/login/', {'username': user, 'password': password})
+        return login_resp.data['access']
+
+    def _login(self, user, password):
+        token = self._get_token(user, password)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return token
+
+    def _upload(self, content=None, name='photo.png', user=None):
+        """Uploads an image (logging in as `user` first, if given) and returns its Photo."""
+        if user is not None:
+            self._login(user.username, self.passwords[user.username])
+        response = self.client.post('/api/photos/', {
+            'file': SimpleUploadedFile(name, make_image() if content is None else content),
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Photo.objects.get(id=response.data['id'])
+
+
+class PhotoAPITests(PhotoTestCase):
 
     def tearDown(self):
         for photo in Photo.objects.all():
@@ -29,10 +62,6 @@ class PhotoAPITests(APITestCase):
                 except FileNotFoundError:
                     pass
 
-    def _get_token(self, user, password):
-        login_resp = self.client.post('/api/auth/login/', {'username': user, 'password': password})
-        return login_resp.data['access']
-
     def _upload_photo(self, token, filename='test.gif', content=TEST_IMAGE_CONTENT, content_type='image/gif'):
         if not token:
             self.client.credentials()
@@ -85,8 +114,8 @@ class PhotoAPITests(APITestCase):
         response = self.client.get('/api/photos/')
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
-        photo_names = {p['original_name'] for p in response.data}
+        self.assertEqual(len(response.data['results']), 2)
+        photo_names = {p['original_name'] for p in response.data['results']}
         self.assertEqual(photo_names, {'photo1.gif', 'photo2.gif'})
 
     def test_list_shows_only_own_photos_no_shares(self):
@@ -99,8 +128,8 @@ class PhotoAPITests(APITestCase):
         response = self.client.get('/api/photos/')
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['original_name'], 'photo1.gif')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['original_name'], 'photo1.gif')
 
     def test_get_other_user_photo_detail_forbidden(self):
         token2 = self._get_token('user2', 'Password2')
@@ -197,7 +226,7 @@ class PhotoAPITests(APITestCase):
         
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token1}')
         response = self.client.get(f'/api/media/{photo.file.name}/')
-        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_protected_media_access_shared_photo(self):
         upload_resp = self._upload_photo(self.token1)
@@ -210,4 +239,1719 @@ class PhotoAPITests(APITestCase):
         
         response = self.client.get(f'/api/media/{photo.file.name}/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.content, TEST_IMAGE_CONTENT)
\ No newline at end of file
+        self.assertEqual(response.content, TEST_IMAGE_CONTENT)
+
+
+class PhotoFeedPaginationTests(PhotoTestCase):
+
+    def _create_photos(self, owner, count, prefix='photo'):
+        photos = Photo.objects.bulk_create([
+            Photo(owner=owner, file=f'uploads/{prefix}{i}.gif', original_name=f'{prefix}{i}.gif')
+            for i in range(count)
+        ])
+        add_owner_entries(photos)
+        return photos
+
+    def _walk_feed(self, page_size):
+        ids = []
+        url = f'/api/photos/?page_size={page_size}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), page_size)
+            ids.extend(p['id'] for p in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_feed_pages_cover_owned_and_shared_photos_once(self):
+        own = self._create_photos(self.user1, 7, prefix='own')
+        others = self._create_photos(self.user2, 5, prefix='other')
+        add_share_entries(PhotoShare.objects.bulk_create([PhotoShare(photo=p, shared_to=self.user1) for p in others[:3]]))
+
+        ids = self._walk_feed(page_size=4)
+
+        expected = Photo.objects.filter(id__in=[p.id for p in own + others[:3]])
+        self.assertEqual(ids, list(expected.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_feed_paging_is_stable_with_identical_timestamps(self):
+        photos = self._create_photos(self.user1, 6)
+        Photo.objects.filter(id__in=[p.id for p in photos]).update(created_at=photos[0].created_at)
+        rebuild_feed()
+
+        ids = self._walk_feed(page_size=4)
+
+        self.assertEqual(ids, sorted((p.id for p in photos), reverse=True))
+
+    def test_feed_lists_photo_shared_with_its_owner_once(self):
+        photo = self._create_photos(self.user1, 1)[0]
+        PhotoShare.objects.create(photo=photo, shared_to=self.user1)
+
+        ids = self._walk_feed(page_size=10)
+
+        self.assertEqual(ids, [photo.id])
+
+    def test_feed_last_page_has_no_next_link(self):
+        self._create_photos(self.user1, 2)
+        response = self.client.get('/api/photos/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['next'])
+
+    def test_feed_invalid_cursor(self):
+        response = self.client.get('/api/photos/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(JWT_USER_STATUS_CACHE_TTL=0)
+class PhotoFeedQueryCountTests(PhotoTestCase):
+
+    def _seed(self, count):
+        Photo.objects.all().delete()
+        owned = Photo.objects.bulk_create([
+            Photo(owner=self.user1, file=f'uploads/own{i}.gif', original_name=f'own{i}.gif')
+            for i in range(count // 2)
+        ])
+        shared = Photo.objects.bulk_create([
+            Photo(owner=self.user2, file=f'uploads/shared{i}.gif', original_name=f'shared{i}.gif')
+            for i in range(count - len(owned))
+        ])
+        add_owner_entries(owned + shared)
+        add_share_entries(PhotoShare.objects.bulk_create([PhotoShare(photo=p, shared_to=self.user1) for p in shared]))
+
+    def _count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/photos/?page_size=200')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response
+
+    def test_list_query_count_is_constant(self):
+        self._seed(10)
+        baseline, _ = self._count_list_queries()
+
+        for count in (100, 1000):
+            with self.subTest(photos=count):
+                self._seed(count)
+                queries, response = self._count_list_queries()
+                self.assertEqual(queries, baseline)
+                self.assertEqual(len(response.data['results']), min(count, 200))
+
+    def test_is_owned_flag(self):
+        self._seed(4)
+        _, response = self._count_list_queries()
+        flags = {p['original_name']: p['isOwned'] for p in response.data['results']}
+        self.assertEqual(flags, {'own0.gif': True, 'own1.gif': True, 'shared0.gif': False, 'shared1.gif': False})
+
+
+class MediaAccessCacheTests(PhotoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.photo = self._upload(TEST_IMAGE_CONTENT, 'cached.gif')
+        self._login('user2', 'Password2')
+
+    def tearDown(self):
+        if os.path.exists(self.photo.file.path):
+            os.remove(self.photo.file.path)
+
+    def _get_media(self):
+        response = self.client.get(f'/api/media/{self.photo.file.name}/')
+        response.close()
+        return response.status_code
+
+    def test_repeat_fetch_skips_authorization_queries(self):
+        PhotoShare.objects.create(photo=self.photo, shared_to=self.user2)
+
+        with CaptureQueriesContext(connection) as cold:
+            self.assertEqual(self._get_media(), status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as warm:
+            self.assertEqual(self._get_media(), status.HTTP_200_OK)
+
+        self.assertLess(len(warm.captured_queries), len(cold.captured_queries))
+
+    def test_share_created_after_denial_grants_access(self):
+        self.assertEqual(self._get_media(), status.HTTP_404_NOT_FOUND)
+        PhotoShare.objects.create(photo=self.photo, shared_to=self.user2)
+        self.assertEqual(self._get_media(), status.HTTP_200_OK)
+
+    def test_share_deleted_revokes_cached_access(self):
+        share = PhotoShare.objects.create(photo=self.photo, shared_to=self.user2)
+        self.assertEqual(self._get_media(), status.HTTP_200_OK)
+        share.delete()
+        self.assertEqual(self._get_media(), status.HTTP_404_NOT_FOUND)
+
+    def test_other_users_file_is_indistinguishable_from_missing(self):
+        missing = self.client.get(f'/api/media/blobs/00/00/{"0" * 64}.gif/')
+        foreign = self.client.get(f'/api/media/{self.photo.file.name}/')
+        self.assertEqual(foreign.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual((foreign.status_code, foreign.content), (missing.status_code, missing.content))
+
+    def test_uploading_same_bytes_grants_access(self):
+        self.assertEqual(self._get_media(), status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self._upload(TEST_IMAGE_CONTENT, 'copy.gif').file.name, self.photo.file.name)
+        self.assertEqual(self._get_media(), status.HTTP_200_OK)
+
+    def test_bulk_uploading_same_bytes_grants_access(self):
+        self.assertEqual(self._get_media(), status.HTTP_404_NOT_FOUND)
+        self.client.post('/api/photos/bulk/', {
+            'files': [SimpleUploadedFile('copy.gif', TEST_IMAGE_CONTENT, content_type='image/gif')],
+        }, format='multipart')
+        self.assertEqual(self._get_media(), status.HTTP_200_OK)
+
+    def test_photo_deleted_drops_cached_access(self):
+        PhotoShare.objects.create(photo=self.photo, shared_to=self.user2)
+        self.assertEqual(self._get_media(), status.HTTP_200_OK)
+        self.photo.delete()
+        self.assertEqual(self._get_media(), status.HTTP_404_NOT_FOUND)
+
+
+class MediaDeliveryBackendTests(PhotoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.photo = self._upload(TEST_IMAGE_CONTENT, 'delivered.gif')
+
+    def tearDown(self):
+        if os.path.exists(self.photo.file.path):
+            os.remove(self.photo.file.path)
+
+    @override_settings(MEDIA_DELIVERY_BACKEND='nginx', MEDIA_ACCEL_REDIRECT_PREFIX='/internal/')
+    def test_x_accel_redirect(self):
+        response = self.client.get(f'/api/media/{self.photo.file.name}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], f'/internal/{self.photo.file.name}')
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_DELIVERY_BACKEND='sendfile')
+    def test_x_sendfile(self):
+        response = self.client.get(f'/api/media/{self.photo.file.name}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Sendfile'], self.photo.file.path)
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_DELIVERY_BACKEND='nginx')
+    def test_proxy_backend_still_checks_access(self):
+        self._login('user2', 'Password2')
+
+        response = self.client.get(f'/api/media/{self.photo.file.name}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(response.has_header('X-Accel-Redirect'))
+
+    def test_django_backend_streams_file(self):
+        response = self.client.get(f'/api/media/{self.photo.file.name}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), TEST_IMAGE_CONTENT)
+
+
+class MediaConditionalRangeTests(PhotoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.photo = self._upload(TEST_IMAGE_CONTENT, 'ranged.gif')
+        self.url = f'/api/media/{self.photo.file.name}/'
+
+    def tearDown(self):
+        if os.path.exists(self.photo.file.path):
+            os.remove(self.photo.file.path)
+
+    def _body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_validators_and_private_cache_headers(self):
+        response = self.client.get(self.url)
+        self._body(response)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('Authorization', response['Vary'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_if_none_match_returns_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_if_modified_since_returns_not_modified(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_single_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-9')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 2-9/{len(TEST_IMAGE_CONTENT)}')
+        self.assertEqual(self._body(response), TEST_IMAGE_CONTENT[2:10])
+
+    def test_suffix_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(self._body(response), TEST_IMAGE_CONTENT[-4:])
+
+    def test_multiple_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3,10-12')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        body = self._body(response)
+        self.assertIn(TEST_IMAGE_CONTENT[0:4], body)
+        self.assertIn(TEST_IMAGE_CONTENT[10:13], body)
+        self.assertIn(f'Content-Range: bytes 10-12/{len(TEST_IMAGE_CONTENT)}'.encode(), body)
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1000-2000')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(TEST_IMAGE_CONTENT)}')
+
+    def test_stale_if_range_returns_full_body(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._body(response), TEST_IMAGE_CONTENT)
+
+
+class AsyncMediaViewTests(PhotoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.token2 = self._get_token('user2', 'Password2')
+        self.photo = self._upload(TEST_IMAGE_CONTENT, 'async.gif')
+        self.url = f'/api/media-async/{self.photo.file.name}/'
+
+    def tearDown(self):
+        if os.path.exists(self.photo.file.path):
+            os.remove(self.photo.file.path)
+
+    async def _get(self, url=None, token=None, **headers):
+        if token is not False:
+            headers['AUTHORIZATION'] = f'Bearer {token or self.token1}'
+        return await self.async_client.get(url or self.url, headers=headers)
+
+    async def _body(self, response):
+        if not response.streaming:
+            return response.content
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def test_streams_the_file(self):
+        response = await self._get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(await self._body(response), TEST_IMAGE_CONTENT)
+        self.assertEqual(response['Content-Length'], str(len(TEST_IMAGE_CONTENT)))
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertIn('private', response['Cache-Control'])
+
+    async def test_if_none_match_returns_not_modified(self):
+        etag = (await self._get())['ETag']
+        response = await self._get(IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_ranges(self):
+        response = await self._get(RANGE='bytes=2-9')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(await self._body(response), TEST_IMAGE_CONTENT[2:10])
+
+        response = await self._get(RANGE='bytes=0-3,10-12')
+        body = await self._body(response)
+        self.assertIn(TEST_IMAGE_CONTENT[0:4], body)
+        self.assertIn(TEST_IMAGE_CONTENT[10:13], body)
+
+    async def test_requires_a_valid_token(self):
+        response = await self._get(token=False)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+        response = await self._get(token='not-a-jwt')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_other_users_and_unknown_paths(self):
+        response = await self._get(token=self.token2)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self._get(url='/api/media-async/uploads/missing.gif/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_shared_photo_is_served(self):
+        await PhotoShare.objects.acreate(photo=self.photo, shared_to=self.user2)
+        response = await self._get(token=self.token2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(MEDIA_DELIVERY_BACKEND='nginx')
+    async def test_proxy_backend(self):
+        response = await self._get()
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.photo.file.name}')
+
+    async def test_rendition_is_streamed_asynchronously(self):
+        from unittest import mock
+        url = f'{self.url}?size=256'
+        response = await self._get(url=url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_async)
+        self.assertEqual(Image.open(io.BytesIO(await self._body(response))).format, 'JPEG')
+
+        # A cached rendition is found without a thread.
+        with mock.patch('photos.renditions.sync_to_async', side_effect=AssertionError):
+            response = await self._get(url=url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_async)
+
+    async def test_unsupported_rendition(self):
+        response = await self._get(url=f'{self.url}?size=3')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SignedMediaURLTests(PhotoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.photo = self._upload(TEST_IMAGE_CONTENT, 'signed.gif')
+        self.url = self.client.get('/api/photos/').data['results'][0]['url']
+        self.client.credentials()
+
+    def tearDown(self):
+        if os.path.exists(self.photo.file.path):
+            os.remove(self.photo.file.path)
+
+    def _body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_feed_url_is_stable(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token1}')
+        self.assertEqual(self.client.get('/api/photos/').data['results'][0]['url'], self.url)
+
+    def test_signed_url_needs_no_token_or_queries(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+            body = self._body(response)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(body, TEST_IMAGE_CONTENT)
+        max_age = int(response['Cache-Control'].split('max-age=')[1].split(',')[0])
+        self.assertGreater(max_age, settings.MEDIA_CACHE_MAX_AGE)
+        self.assertLessEqual(max_age, settings.MEDIA_URL_TTL * 5 // 4)
+
+    def test_repeat_rendition_needs_no_queries(self):
+        url = f'{self.url}&size=256'
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+            body = self._body(response)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(Image.open(io.BytesIO(body)).format, 'JPEG')
+
+    def test_deleting_photo_forgets_cached_rendition(self):
+        # A second photo with the same bytes keeps the path in use.
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token1}')
+        self.assertEqual(self._upload(TEST_IMAGE_CONTENT, 'signed.gif').file.name, self.photo.file.name)
+        url = f'{self.url}&size=256'
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/photos/{self.photo.id}/')
+        self.client.credentials()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_tampered_signature_is_rejected(self):
+        response = self.client.get(self.url.replace('sig=', 'sig=x'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_signature_is_bound_to_path_and_user(self):
+        from .signing import signed_media_params
+        params = signed_media_params(self.user1.id, 'uploads/other.gif')
+        response = self.client.get(f'/api/media/{self.photo.file.name}/', params)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        params = signed_media_params(self.user1.id, self.photo.file.name)
+        params['uid'] = self.user1.id + 1
+        response = self.client.get(f'/api/media/{self.photo.file.name}/', params)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_url_is_rejected(self):
+        import time
+        from .signing import signed_media_url
+        url = signed_media_url(self.user1.id, self.photo.file.name, now=time.time() - 2 * settings.MEDIA_URL_TTL)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_async_view_accepts_signed_urls(self):
+        url = self.url.replace('/api/media/', '/api/media-async/')
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+def make_image(size=(600, 400), fmt='PNG', color=(200, 40, 40)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class PhotoRenditionTests(PhotoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.photo = self._upload(make_image(), 'large.png')
+        self.url = f'/api/media/{self.photo.file.name}/'
+
+    def tearDown(self):
+        self.photo.delete()
+        if os.path.exists(self.photo.file.path):
+            os.remove(self.photo.file.path)
+
+    def _get_image(self, query):
+        response = self.client.get(f'{self.url}?{query}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = b''.join(response.streaming_content)
+        return response, Image.open(io.BytesIO(body))
+
+    def test_size_serves_downscaled_jpeg(self):
+        response, image = self._get_image('size=256')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(image.format, 'JPEG')
+        self.assertEqual(image.size, (256, 171))
+
+    def test_rendition_is_generated_once(self):
+        self._get_image('size=256&fmt=webp')
+        self._get_image('size=256&fmt=webp')
+        renditions = PhotoRendition.objects.filter(photo=self.photo)
+        self.assertEqual(renditions.count(), 1)
+        self.assertEqual((renditions[0].width, renditions[0].height), (256, 171))
+
+    def test_small_originals_are_not_upscaled(self):
+        _, image = self._get_image('size=1024&fmt=webp')
+        self.assertEqual(image.format, 'WEBP')
+        self.assertEqual(image.size, (600, 400))
+
+    def test_unsupported_size(self):
+        response = self.client.get(f'{self.url}?size=300')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rendition_requires_access(self):
+        self._login('user2', 'Password2')
+        response = self.client.get(f'{self.url}?size=256')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(PhotoRendition.objects.exists())
+
+    def test_deleting_photo_removes_rendition_files(self):
+        self._get_image('size=256')
+        rendition_path = PhotoRendition.objects.get(photo=self.photo).file.path
+        self.assertTrue(os.path.exists(rendition_path))
+        self.client.delete(f'/api/photos/{self.photo.id}/')
+        self.assertFalse(os.path.exists(rendition_path))
+
+
+class PhotoProcessingTests(PhotoTestCase):
+
+    def tearDown(self):
+        for photo in Photo.objects.all():
+            photo.delete()
+            if os.path.exists(photo.file.path):
+                os.remove(photo.file.path)
+
+    def test_upload_returns_processing_state(self):
+        photo = self._upload()
+        self.assertEqual(photo.status, Photo.Status.PROCESSING)
+        self.assertFalse(PhotoRendition.objects.exists())
+
+    def test_worker_round_marks_photo_ready(self):
+        photo_id = self._upload().id
+
+        process_claimed(claim_photos(limit=10))
+
+        photo = Photo.objects.get(id=photo_id)
+        self.assertEqual(photo.status, Photo.Status.READY)
+        self.assertEqual(photo.processing_attempts, 1)
+        self.assertEqual(photo.renditions.count(), len(settings.PHOTO_RENDITION_SIZES) * len(supported_formats()))
+
+    def test_claimed_photo_is_leased(self):
+        self._upload()
+        self.assertEqual(len(claim_photos(limit=10)), 1)
+        self.assertEqual(claim_photos(limit=10), [])
+
+    @override_settings(PHOTO_PROCESSING_MAX_ATTEMPTS=2)
+    def test_failing_photo_is_retried_then_failed(self):
+        # A valid header passes upload validation; the truncated pixel data fails decoding.
+        photo_id = self._upload(make_image()[:100], 'broken.png').id
+
+        process_claimed(claim_photos(limit=10))
+        photo = Photo.objects.get(id=photo_id)
+        self.assertEqual(photo.status, Photo.Status.PROCESSING)
+        self.assertIn('Error', photo.processing_error)
+
+        process_claimed(claim_photos(limit=10))
+        photo = Photo.objects.get(id=photo_id)
+        self.assertEqual(photo.status, Photo.Status.FAILED)
+        self.assertEqual(claim_photos(limit=10), [])
+
+    @override_settings(PHOTO_PROCESSING_BACKEND='eager')
+    def test_eager_backend_processes_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            photo_id = self._upload().id
+        self.assertEqual(Photo.objects.get(id=photo_id).status, Photo.Status.READY)
+
+
+class UploadValidationTests(PhotoTestCase):
+
+    def _post(self, content, name):
+        return self.client.post('/api/photos/', {'file': SimpleUploadedFile(name, content)}, format='multipart')
+
+    @staticmethod
+    def _png_header(width, height):
+        import struct
+        import zlib
+        ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+        chunk = b'IHDR' + ihdr
+        return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(ihdr)) + chunk + struct.pack('>I', zlib.crc32(chunk))
+
+    def test_reads_dimensions_from_headers(self):
+        from .uploads import read_image_header
+        cases = [
+            (make_image(size=(321, 123), fmt='PNG'), 'PNG'),
+            (make_image(size=(321, 123), fmt='GIF'), 'GIF'),
+            (make_image(size=(321, 123), fmt='JPEG'), 'JPEG'),
+            (make_image(size=(321, 123), fmt='WEBP'), 'WEBP'),
+        ]
+        lossless = io.BytesIO()
+        Image.new('RGB', (321, 123)).save(lossless, 'WEBP', lossless=True)
+        extended = io.BytesIO()
+        Image.new('RGBA', (321, 123)).save(extended, 'WEBP', exif=b'Exif\x00\x00')
+        cases += [(lossless.getvalue(), 'WEBP'), (extended.getvalue(), 'WEBP')]
+        for content, fmt in cases:
+            self.assertEqual(tuple(read_image_header(io.BytesIO(content))), (fmt, 321, 123))
+
+    def test_rejects_non_images(self):
+        response = self._post(b'<html>definitely not a picture</html>' * 10, 'page.png')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('not a JPEG, PNG, GIF or WebP', str(response.data['file']))
+        self.assertEqual(Photo.objects.count(), 0)
+
+    def test_rejects_decompression_bomb_from_header(self):
+        response = self._post(self._png_header(50_000, 50_000) + b'\0' * 1000, 'bomb.png')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('50000x50000', str(response.data['file']))
+
+    def test_rejects_truncated_header(self):
+        response = self._post(make_image(fmt='JPEG')[:40], 'cut.jpg')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(PHOTO_MAX_UPLOAD_SIZE=64 * 1024)
+    def test_rejects_oversize_upload(self):
+        noise = Image.frombytes('RGB', (256, 256), os.urandom(256 * 256 * 3))
+        buffer = io.BytesIO()
+        noise.save(buffer, 'PNG')
+        response = self._post(buffer.getvalue(), 'big.png')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('limited', str(response.data['file']))
+
+    def test_accepts_jpeg_with_frame_header_after_kept_bytes(self):
+        from .uploads import HEADER_BYTES
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48)).save(buffer, 'JPEG', icc_profile=b'\0' * (HEADER_BYTES * 2))
+        response = self._post(buffer.getvalue(), 'icc.jpg')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_handler_refuses_part_after_first_chunk(self):
+        from django.test import RequestFactory
+        from .uploads import ImageUploadHandler, RejectedUpload
+        request = RequestFactory().post('/')
+        request.upload_handlers = [ImageUploadHandler(request)]
+        handler = request.upload_handlers[0]
+        handler.new_file('file', 'fake.png', 'image/png', None)
+
+        self.assertIsNone(handler.receive_data_chunk(b'MZ\x90\x00' + b'\0' * 4096, 0))
+        self.assertIsNone(handler.receive_data_chunk(b'\0' * 4096, 4100))
+        rejected = handler.file_complete(8196)
+        self.assertIsInstance(rejected, RejectedUpload)
+        self.assertIn('not a JPEG', rejected.rejection)
+
+        handler.new_file('file', 'ok.png', 'image/png', None)
+        content = make_image()
+        self.assertEqual(handler.receive_data_chunk(content, 0), content)
+        self.assertIsNone(handler.file_complete(len(content)))
+
+    def test_bulk_upload_reports_rejected_parts(self):
+        response = self.client.post('/api/photos/bulk/', {'files': [
+            SimpleUploadedFile('good.png', make_image()),
+            SimpleUploadedFile('bad.png', b'plain text'),
+        ]}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([p['original_name'] for p in response.data['created']], ['good.png'])
+        self.assertEqual([e['name'] for e in response.data['errors']], ['bad.png'])
+
+
+class ContentAddressedStorageTests(PhotoTestCase):
+
+    def tearDown(self):
+        for photo in Photo.objects.all():
+            if os.path.exists(photo.file.path):
+                os.remove(photo.file.path)
+
+    def test_identical_uploads_share_one_blob(self):
+        content = make_image()
+        first = self._upload(content, 'a.png', user=self.user1)
+        second = self._upload(content, 'b.png', user=self.user2)
+
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertTrue(first.file.name.startswith('blobs/'))
+        self.assertEqual(Blob.objects.get(name=first.file.name).ref_count, 2)
+        with first.file.open('rb') as fh:
+            self.assertEqual(fh.read(), content)
+
+    def test_different_content_gets_different_blobs(self):
+        first = self._upload(make_image(color=(1, 2, 3)), user=self.user1)
+        second = self._upload(make_image(color=(4, 5, 6)), user=self.user1)
+        self.assertNotEqual(first.file.name, second.file.name)
+
+    def test_bytes_deleted_with_last_reference(self):
+        content = make_image()
+        first = self._upload(content, user=self.user1)
+        second = self._upload(content, user=self.user2)
+        path = first.file.path
+
+        self._login('user1', 'Password1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/photos/{first.id}/')
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(Blob.objects.get(name=second.file.name).ref_count, 1)
+
+        self._login('user2', 'Password2')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/photos/{second.id}/')
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(Blob.objects.exists())
+
+    def _racing_delete(self):
+        """Unlink the stored bytes between the upload's save and its Blob reference."""
+        from unittest import mock
+        from .models import BlobManager
+        from .storage import photo_storage
+        acquire_many = BlobManager.acquire_many
+
+        def acquire_after_delete(manager, sizes, counts):
+            for name in counts:
+                photo_storage().delete(name)
+            return acquire_many(manager, sizes, counts)
+        return mock.patch.object(BlobManager, 'acquire_many', acquire_after_delete)
+
+    def test_upload_restores_bytes_unlinked_by_a_racing_delete(self):
+        content = make_image()
+        self._upload(content, user=self.user1)
+        with self._racing_delete():
+            photo = self._upload(content, user=self.user2)
+        with photo.file.open('rb') as fh:
+            self.assertEqual(fh.read(), content)
+
+    def test_bulk_upload_restores_bytes_unlinked_by_a_racing_delete(self):
+        content = make_image()
+        self._upload(content, user=self.user1)
+        with self._racing_delete():
+            response = self.client.post('/api/photos/bulk/', {
+                'files': [SimpleUploadedFile('again.png', content, content_type='image/png')],
+            }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        photo = Photo.objects.get(id=response.data['created'][0]['id'])
+        with photo.file.open('rb') as fh:
+            self.assertEqual(fh.read(), content)
+        self.assertEqual(Blob.objects.get(name=photo.file.name).ref_count, 2)
+
+    def test_unreferenced_blob_delete_keeps_referenced_files(self):
+        from .models import delete_unreferenced_blobs
+        content = make_image()
+        photo = self._upload(content, user=self.user1)
+        Photo.objects.filter(pk=photo.pk).update(file='uploads/elsewhere.png')
+        delete_unreferenced_blobs([photo.file.name])
+        self.assertTrue(os.path.exists(photo.file.path))
+
+        Blob.objects.filter(name=photo.file.name).update(ref_count=0)
+        delete_unreferenced_blobs([photo.file.name])
+        self.assertFalse(os.path.exists(photo.file.path))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_shared_blob_access_follows_any_owned_or_shared_photo(self):
+        content = make_image()
+        photo = self._upload(content, user=self.user1)
+        User.objects.create_user(username='user3', password='Password3', email='user3@example.com')
+        self._login('user3', 'Password3')
+        self.assertEqual(self.client.get(f'/api/media/{photo.file.name}/').status_code, status.HTTP_404_NOT_FOUND)
+
+        self._upload(content, user=self.user2)
+        response = self.client.get(f'/api/media/{photo.file.name}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), content)
+
+
+class ResumableUploadTests(PhotoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.content = make_image()
+
+    def tearDown(self):
+        for session in UploadSession.objects.all():
+            session.delete()
+        for photo in Photo.objects.all():
+            if os.path.exists(photo.file.path):
+                os.remove(photo.file.path)
+
+    def _start(self, size=None):
+        response = self.client.post('/api/photos/uploads/', {
+            'filename': 'resumed.png', 'size': size or len(self.content),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['offset'], 0)
+        return f'/api/photos/uploads/{response.data["id"]}/'
+
+    def _append(self, url, offset, chunk):
+        return self.client.patch(url, chunk, content_type='application/offset+octet-stream',
+                                 HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_chunked_upload_creates_photo(self):
+        url = self._start()
+        middle = len(self.content) // 2
+
+        response = self._append(url, 0, self.content[:middle])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response['Upload-Offset'], str(middle))
+
+        self.assertEqual(self.client.get(url).data['offset'], middle)
+        self._append(url, middle, self.content[middle:])
+
+        response = self.client.post(f'{url}complete/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        photo = Photo.objects.get(id=response.data['id'])
+        self.assertEqual(photo.owner, self.user1)
+        self.assertEqual(photo.original_name, 'resumed.png')
+        with photo.file.open('rb') as fh:
+            self.assertEqual(fh.read(), self.content)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_offset_mismatch_reports_current_offset(self):
+        url = self._start()
+        self._append(url, 0, self.content[:10])
+        response = self._append(url, 5, self.content[5:20])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Upload-Offset'], '10')
+
+    def test_chunk_beyond_declared_size_is_rejected(self):
+        url = self._start(size=10)
+        response = self._append(url, 0, self.content[:20])
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(self.client.get(url).data['offset'], 0)
+
+    def test_complete_before_all_bytes_arrive(self):
+        url = self._start()
+        self._append(url, 0, self.content[:10])
+        response = self.client.post(f'{url}complete/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Photo.objects.exists())
+
+    def test_sessions_are_private_to_their_owner(self):
+        url = self._start()
+        self._login('user2', 'Password2')
+        self.assertEqual(self._append(url, 0, self.content[:10]).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_purge_keeps_sessions_that_are_still_receiving(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+
+        stale = timezone.now() - timedelta(seconds=settings.RESUMABLE_UPLOAD_EXPIRY + 60)
+        active, idle = self._start(), self._start()
+        UploadSession.objects.update(created_at=stale, updated_at=stale)
+        self._append(active, 0, self.content[:10])
+
+        call_command('purge_upload_sessions', stdout=io.StringIO())
+        self.assertEqual(self.client.get(active).data['offset'], 10)
+        self.assertEqual(self.client.get(idle).status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(PHOTO_MAX_UPLOAD_SIZE=100)
+    def test_declared_size_limit(self):
+        response = self.client.post('/api/photos/uploads/', {'filename': 'big.png', 'size': 101}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(JWT_USER_STATUS_CACHE_TTL=0)
+class BulkShareTests(PhotoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.recipients = [
+            User.objects.create_user(username=f'friend{i}', password='Password9', email=f'friend{i}@example.com')
+            for i in range(3)
+        ]
+        self.other = User.objects.create_user(username='other', password='Password2', email='other@example.com')
+
+        self.photos = Photo.objects.bulk_create([
+            Photo(owner=self.user1, file=f'uploads/bulk{i}.gif', original_name=f'bulk{i}.gif') for i in range(5)
+        ])
+        self.foreign, = Photo.objects.bulk_create([
+            Photo(owner=self.other, file='uploads/foreign.gif', original_name='foreign.gif'),
+        ])
+
+    def _share(self, photos, emails):
+        return self.client.post('/api/photos/share/bulk/', {'photos': photos, 'emails': emails}, format='json')
+
+    def test_shares_every_photo_with_every_recipient(self):
+        response = self._share([p.id for p in self.photos], [u.email for u in self.recipients])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['shared'], 15)
+        self.assertEqual(PhotoShare.objects.count(), 15)
+        self.assertEqual({r['status'] for r in response.data['results']}, {'shared'})
+
+    def test_query_count_does_not_grow_with_request_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self._share([self.photos[0].id], [self.recipients[0].email])
+        PhotoShare.objects.all().delete()
+        with CaptureQueriesContext(connection) as large:
+            self._share([p.id for p in self.photos], [u.email for u in self.recipients])
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+    def test_reports_per_item_outcomes(self):
+        PhotoShare.objects.create(photo=self.photos[0], shared_to=self.recipients[0])
+        response = self._share(
+            [self.photos[0].id, self.foreign.id],
+            [self.recipients[0].email, self.recipients[1].email, 'ghost@example.com', self.user1.email],
+        )
+        outcomes = {(r['photo'], r['email']): r['status'] for r in response.data['results']}
+        self.assertEqual(outcomes[(self.photos[0].id, self.recipients[0].email)], 'already_shared')
+        self.assertEqual(outcomes[(self.photos[0].id, self.recipients[1].email)], 'shared')
+        self.assertEqual(outcomes[(self.photos[0].id, 'ghost@example.com')], 'user_not_found')
+        self.assertEqual(outcomes[(self.photos[0].id, self.user1.email)], 'self')
+        self.assertEqual(outcomes[(self.foreign.id, self.recipients[1].email)], 'photo_not_found')
+        self.assertEqual(response.data['shared'], 1)
+        self.assertFalse(PhotoShare.objects.filter(photo=self.foreign).exists())
+
+    def test_clears_cached_denials(self):
+        from .access import can_access_media
+        recipient = self.recipients[0]
+        path = self.photos[0].file.name
+        self.assertFalse(can_access_media(recipient, path))
+
+        self._share([self.photos[0].id], [recipient.email])
+
+        self.assertTrue(can_access_media(recipient, path))
+
+    def test_rejects_empty_lists(self):
+        response = self._share([], [self.recipients[0].email])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(JWT_USER_STATUS_CACHE_TTL=0)
+class BulkUploadDeleteTests(PhotoTestCase):
+
+    def tearDown(self):
+        for photo in Photo.objects.all():
+            if os.path.exists(photo.file.path):
+                os.remove(photo.file.path)
+
+    def _bulk_upload(self, files):
+        return self.client.post('/api/photos/bulk/', {'files': files}, format='multipart')
+
+    def _images(self, count):
+        return [
+            SimpleUploadedFile(f'img{i}.png', make_image(color=(i, 10, 20)), content_type='image/png')
+            for i in range(count)
+        ]
+
+    def test_uploads_many_files_in_one_request(self):
+        response = self._bulk_upload(self._images(3))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['created']), 3)
+        self.assertEqual(response.data['errors'], [])
+        photos = Photo.objects.filter(owner=self.user1)
+        self.assertEqual(photos.count(), 3)
+        self.assertEqual({p.original_name for p in photos}, {'img0.png', 'img1.png', 'img2.png'})
+        for photo in photos:
+            self.assertEqual(photo.status, Photo.Status.PROCESSING)
+            self.assertEqual(Blob.objects.get(name=photo.file.name).ref_count, 1)
+
+    def test_duplicate_files_share_a_blob(self):
+        content = make_image()
+        response = self._bulk_upload([
+            SimpleUploadedFile('a.png', content, content_type='image/png'),
+            SimpleUploadedFile('b.png', content, content_type='image/png'),
+        ])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        names = set(Photo.objects.values_list('file', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(Blob.objects.get(name=names.pop()).ref_count, 2)
+
+    def test_failed_insert_removes_newly_stored_files(self):
+        import hashlib
+        from unittest import mock
+
+        existing, new = make_image(color=(1, 2, 3)), make_image(color=(4, 5, 6))
+        self._bulk_upload([SimpleUploadedFile('kept.png', existing, content_type='image/png')])
+        kept = Photo.objects.get().file.path
+        storage = Photo._meta.get_field('file').storage
+        dropped = storage.path(storage.blob_name(hashlib.sha256(new).hexdigest(), '.png'))
+
+        with mock.patch.object(Blob.objects, 'acquire_many', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self._bulk_upload([
+                    SimpleUploadedFile('again.png', existing, content_type='image/png'),
+                    SimpleUploadedFile('new.png', new, content_type='image/png'),
+                ])
+        self.assertTrue(os.path.exists(kept))
+        self.assertFalse(os.path.exists(dropped))
+        self.assertEqual(Photo.objects.count(), 1)
+
+    def test_invalid_files_are_reported_without_failing_the_batch(self):
+        files = self._images(1) + [SimpleUploadedFile('empty.png', b'', content_type='image/png')]
+        response = self._bulk_upload(files)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['created']), 1)
+        self.assertEqual([e['name'] for e in response.data['errors']], ['empty.png'])
+
+    def test_insert_query_count_does_not_grow_with_batch(self):
+        with CaptureQueriesContext(connection) as small:
+            self._bulk_upload(self._images(1))
+        with CaptureQueriesContext(connection) as large:
+            self._bulk_upload(self._images(4))
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+    def test_bulk_delete_removes_rows_and_files(self):
+        from .storage import wait_for_background_deletes
+        self._bulk_upload(self._images(3))
+        photos = list(Photo.objects.filter(owner=self.user1))
+        PhotoShare.objects.create(photo=photos[0], shared_to=self.user2)
+        paths = [p.file.path for p in photos]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                '/api/photos/bulk/', {'ids': [p.id for p in photos[:2]]}, format='json',
+            )
+        wait_for_background_deletes()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertEqual(list(Photo.objects.values_list('id', flat=True)), [photos[2].id])
+        self.assertFalse(PhotoShare.objects.exists())
+        self.assertFalse(Blob.objects.filter(name__in=[p.file.name for p in photos[:2]]).exists())
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertTrue(os.path.exists(paths[2]))
+
+    def test_bulk_delete_keeps_blobs_still_referenced(self):
+        from .storage import wait_for_background_deletes
+        content = make_image()
+        self._bulk_upload([
+            SimpleUploadedFile('a.png', content, content_type='image/png'),
+            SimpleUploadedFile('b.png', content, content_type='image/png'),
+        ])
+        first, second = Photo.objects.order_by('id')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/api/photos/bulk/', {'ids': [first.id]}, format='json')
+        wait_for_background_deletes()
+
+        self.assertEqual(Blob.objects.get(name=second.file.name).ref_count, 1)
+        self.assertTrue(os.path.exists(second.file.path))
+
+    def test_bulk_delete_ignores_other_users_photos(self):
+        foreign = Photo.objects.bulk_create([
+            Photo(owner=self.user2, file='uploads/foreign.gif', original_name='foreign.gif'),
+        ])[0]
+        response = self.client.delete('/api/photos/bulk/', {'ids': [foreign.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted'], 0)
+        self.assertTrue(Photo.objects.filter(id=foreign.id).exists())
+
+    def test_bulk_delete_invalidates_cached_access(self):
+        from .access import can_access_media
+        self._bulk_upload(self._images(1))
+        photo = Photo.objects.get()
+        PhotoShare.objects.create(photo=photo, shared_to=self.user2)
+        self.assertTrue(can_access_media(self.user2, photo.file.name))
+
+        self.client.delete('/api/photos/bulk/', {'ids': [photo.id]}, format='json')
+        self.assertFalse(can_access_media(self.user2, photo.file.name))
+
+
+class FeedEntryTests(PhotoTestCase):
+
+    def tearDown(self):
+        for photo in Photo.objects.all():
+            if os.path.exists(photo.file.path):
+                os.remove(photo.file.path)
+
+    def _entries(self, user):
+        return set(FeedEntry.objects.filter(user=user).values_list('photo_id', 'is_owned'))
+
+    def _assert_consistent(self):
+        self.assertEqual(diff_feed([self.user1.id, self.user2.id]), {'missing': [], 'extra': [], 'stale': []})
+
+    def test_signals_track_uploads_shares_and_deletes(self):
+        photo = self._upload()
+        self.assertEqual(self._entries(self.user1), {(photo.id, True)})
+
+        self.client.post('/api/photos/share/', {'photo': photo.id, 'shared_to': self.user2.email})
+        self.assertEqual(self._entries(self.user2), {(photo.id, False)})
+        self._assert_consistent()
+
+        PhotoShare.objects.get().delete()
+        self.assertEqual(self._entries(self.user2), set())
+
+        self.client.post('/api/photos/share/', {'photo': photo.id, 'shared_to': self.user2.email})
+        self.client.delete(f'/api/photos/{photo.id}/')
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_bulk_endpoints_maintain_entries(self):
+        self.client.post('/api/photos/bulk/', {'files': [
+            SimpleUploadedFile(f'b{i}.png', make_image(color=(i, 0, 0)), content_type='image/png') for i in range(3)
+        ]}, format='multipart')
+        ids = list(Photo.objects.values_list('id', flat=True))
+        self.client.post('/api/photos/share/bulk/', {'photos': ids, 'emails': [self.user2.email]}, format='json')
+        self.assertEqual(len(self._entries(self.user2)), 3)
+        self._assert_consistent()
+
+        self.client.delete('/api/photos/bulk/', {'ids': ids[:2]}, format='json')
+        self.assertEqual(self._entries(self.user2), {(ids[2], False)})
+        self._assert_consistent()
+
+    def test_feed_reads_only_the_entry_table(self):
+        photo = self._upload()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/photos/')
+        self.assertEqual([p['id'] for p in response.data['results']], [photo.id])
+        feed_sql = [q['sql'] for q in ctx.captured_queries if 'photos_feedentry' in q['sql']]
+        self.assertEqual(len(feed_sql), 1)
+        self.assertNotIn('photos_photoshare', feed_sql[0])
+
+    def test_check_feed_detects_and_repairs_drift(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        photo = self._upload()
+        self.client.post('/api/photos/share/', {'photo': photo.id, 'shared_to': self.user2.email})
+        FeedEntry.objects.filter(user=self.user2).delete()
+        FeedEntry.objects.filter(user=self.user1).update(is_owned=False)
+
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_feed', stdout=out)
+        self.assertIn('1 missing, 0 extra, 1 stale', out.getvalue())
+
+        call_command('check_feed', '--fix', stdout=io.StringIO())
+        self._assert_consistent()
+
+    def test_rebuild_feed_command(self):
+        from django.core.management import call_command
+        photo = self._upload()
+        PhotoShare.objects.bulk_create([PhotoShare(photo=photo, shared_to=self.user2)])
+        FeedEntry.objects.all().delete()
+
+        call_command('rebuild_feed', '--batch-size', '1', stdout=io.StringIO())
+        self.assertEqual(self._entries(self.user1), {(photo.id, True)})
+        self.assertEqual(self._entries(self.user2), {(photo.id, False)})
+
+
+def make_exif_jpeg(size=(600, 400), taken='2021:06:01 12:30:00', offset='+02:00', orientation=1):
+    from PIL import ExifTags
+    exif = Image.Exif()
+    exif[ExifTags.Base.Make] = 'Canon'
+    exif[ExifTags.Base.Model] = 'EOS R6'
+    exif[ExifTags.Base.Orientation] = orientation
+    details = exif.get_ifd(ExifTags.IFD.Exif)
+    details[ExifTags.Base.DateTimeOriginal] = taken
+    if offset:
+        details[ExifTags.Base.OffsetTimeOriginal] = offset
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (10, 120, 200)).save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+class PhotoMetadataTests(PhotoTestCase):
+
+    def _process(self):
+        process_claimed(claim_photos(limit=100))
+
+    def _feed(self, query=''):
+        response = self.client.get(f'/api/photos/{query}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [p['id'] for p in response.data['results']]
+
+    def test_reads_exif_and_display_dimensions(self):
+        from datetime import datetime, timezone as dt_timezone
+        photo_id = self._upload(make_exif_jpeg(orientation=6)).id
+        self._process()
+
+        data = self.client.get(f'/api/photos/{photo_id}/').data
+        self.assertEqual((data['width'], data['height']), (400, 600))
+        self.assertEqual(data['mime_type'], 'image/jpeg')
+        self.assertEqual((data['camera_make'], data['camera_model']), ('Canon', 'EOS R6'))
+        taken_at = Photo.objects.get(id=photo_id).taken_at
+        self.assertEqual(taken_at, datetime(2021, 6, 1, 10, 30, tzinfo=dt_timezone.utc))
+
+    def test_metadata_is_copied_to_feed_entries(self):
+        photo_id = self._upload(make_exif_jpeg()).id
+        self.client.post('/api/photos/share/', {'photo': photo_id, 'shared_to': self.user2.email})
+        self._process()
+        photo = Photo.objects.get(id=photo_id)
+
+        entries = FeedEntry.objects.filter(photo=photo).values_list('taken_at', 'width', 'height', 'mime_type')
+        self.assertEqual(set(entries), {(photo.taken_at, 600, 400, 'image/jpeg')})
+        self.assertEqual(diff_feed([self.user1.id, self.user2.id]), {'missing': [], 'extra': [], 'stale': []})
+
+    def test_photo_without_exif_sorts_by_upload_time(self):
+        photo_id = self._upload(make_image(), 'plain.png').id
+        self._process()
+        photo = Photo.objects.get(id=photo_id)
+        self.assertIsNone(photo.taken_at)
+        self.assertEqual(photo.mime_type, 'image/png')
+        self.assertEqual(FeedEntry.objects.get(photo=photo).taken_at, photo.created_at)
+
+    def test_filters_and_sort(self):
+        old = self._upload(make_exif_jpeg(size=(4000, 3000), taken='2015:01:01 08:00:00', offset=None), 'old.jpg').id
+        new = self._upload(make_exif_jpeg(size=(800, 600), taken='2023:07:01 08:00:00', offset=None), 'new.jpg').id
+        png = self._upload(make_image(size=(2000, 1000)), 'shot.png').id
+        self._process()
+
+        self.assertEqual(self._feed('?taken_before=2020-01-01T00:00:00Z'), [old])
+        self.assertEqual(self._feed('?taken_after=2020-01-01T00:00:00Z&mime_type=image/jpeg'), [new])
+        self.assertEqual(self._feed('?min_width=1000&max_height=2000'), [png])
+        self.assertEqual(self._feed('?mime_type=image/png'), [png])
+        self.assertEqual(self._feed('?sort=-taken_at'), [png, new, old])
+        self.assertEqual(self._feed('?sort=created_at'), [old, new, png])
+
+    def test_sorted_feed_paginates_by_its_key(self):
+        ids = [
+            self._upload(make_exif_jpeg(taken=f'20{year}:01:01 00:00:00', offset=None), f'{year}.jpg').id
+            for year in (18, 12, 20, 15)
+        ]
+        self._process()
+
+        seen, url = [], '/api/photos/?sort=taken_at&page_size=1'
+        while url:
+            response = self.client.get(url)
+            seen.extend(p['id'] for p in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [ids[1], ids[3], ids[0], ids[2]])
+
+    def test_filters_read_only_feed_entries(self):
+        self._upload(make_exif_jpeg())
+        self._process()
+        with CaptureQueriesContext(connection) as ctx:
+            self._feed('?min_width=100&mime_type=image/jpeg&sort=-taken_at')
+        feed_sql = next(q['sql'] for q in ctx.captured_queries if 'photos_feedentry' in q['sql'])
+        where = feed_sql.split('WHERE', 1)[1]
+        self.assertIn('"photos_feedentry"."width"', where)
+        self.assertNotIn('"photos_photo"', where)
+
+    def test_invalid_params_are_rejected(self):
+        for query in ('?sort=name', '?min_width=-1', '?taken_after=yesterday'):
+            response = self.client.get(f'/api/photos/{query}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+
+    def test_extract_metadata_command_backfills(self):
+        from django.core.management import call_command
+        photo_id = self._upload(make_exif_jpeg()).id
+        self._process()
+        Photo.objects.filter(id=photo_id).update(mime_type='', width=None, taken_at=None)
+
+        out = io.StringIO()
+        call_command('extract_metadata', stdout=out)
+        self.assertIn('Read metadata for 1 photos', out.getvalue())
+        self.assertEqual(Photo.objects.get(id=photo_id).width, 600)
+
+
+class PhotoExportTests(PhotoTestCase):
+
+    def _export(self, query=''):
+        response = self.client.get(f'/api/photos/export/{query}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        import zipfile
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_exports_owned_and_shared_photos_stored(self):
+        red, blue = make_image(color=(255, 0, 0)), make_image(color=(0, 0, 255))
+        self._upload(red, 'red.png')
+        self._login('user2', 'Password2')
+        shared = self._upload(blue, 'blue.png').id
+        self._upload(make_image(color=(0, 255, 0)), 'private.png')
+        self.client.post('/api/photos/share/', {'photo': shared, 'shared_to': self.user1.email})
+        self._login('user1', 'Password1')
+
+        archive = self._export()
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(sorted(archive.namelist()), ['blue.png', 'red.png'])
+        self.assertEqual(archive.read('red.png'), red)
+        self.assertEqual(archive.read('blue.png'), blue)
+        self.assertEqual({info.compress_type for info in archive.infolist()}, {0})
+
+    def test_selected_ids_and_name_collisions(self):
+        first = self._upload(make_image(color=(1, 2, 3)), 'same.png').id
+        second = self._upload(make_image(color=(4, 5, 6)), 'same.png').id
+        self._upload(make_image(color=(7, 8, 9)), 'other.png')
+        self._login('user2', 'Password2')
+        foreign = self._upload(make_image(color=(9, 9, 9)), 'foreign.png').id
+        self._login('user1', 'Password1')
+
+        archive = self._export(f'?ids={first}&ids={second}&ids={foreign}')
+        self.assertEqual(archive.namelist(), ['same.png', 'same (2).png'])
+
+    def test_streams_in_bounded_chunks(self):
+        from .delivery import CHUNK_SIZE
+        # Noise doesn't compress, so the PNG spans several chunks.
+        noise = Image.frombytes('RGB', (256, 256), os.urandom(256 * 256 * 3))
+        buffer = io.BytesIO()
+        noise.save(buffer, 'PNG')
+        self.assertGreater(buffer.tell(), CHUNK_SIZE * 2)
+        self._upload(buffer.getvalue(), 'noise.png')
+
+        response = self.client.get('/api/photos/export/')
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 3)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), CHUNK_SIZE)
+        self.assertNotIn('Content-Length', response)
+
+    def test_rejects_invalid_ids(self):
+        response = self.client.get('/api/photos/export/?ids=abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_requires_authentication(self):
+        self.client.credentials()
+        response = self.client.get('/api/photos/export/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PerformanceMetricsTests(PhotoTestCase):
+
+    def _scrape(self, **headers):
+        from rest_framework.test import APIClient
+        # A client of its own, so the user's JWT is not sent along.
+        return APIClient().get('/metrics', **headers)
+
+    def _sample(self, line_start):
+        with override_settings(METRICS_TOKEN='scrape-secret'):
+            response = self._scrape(HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for line in response.content.decode().splitlines():
+            if line.startswith(line_start + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0.0
+
+    def test_records_requests_queries_and_bytes_per_view(self):
+        view = 'view="photo-list-create"'
+        before = {
+            'requests': self._sample(f'http_requests_total{{{view},method="GET",status="200"}}'),
+            'queries': self._sample(f'http_request_db_queries_total{{{view}}}'),
+            'bytes': self._sample(f'http_response_bytes_total{{{view}}}'),
+            'timed': self._sample(f'http_request_duration_seconds_count{{{view}}}'),
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/photos/')
+        # The next request resets connection.queries, so count them now.
+        queries = len(ctx.captured_queries)
+
+        self.assertEqual(self._sample(f'http_requests_total{{{view},method="GET",status="200"}}'),
+                         before['requests'] + 1)
+        self.assertEqual(self._sample(f'http_request_db_queries_total{{{view}}}'),
+                         before['queries'] + queries)
+        self.assertEqual(self._sample(f'http_response_bytes_total{{{view}}}'),
+                         before['bytes'] + len(response.content))
+        self.assertEqual(self._sample(f'http_request_duration_seconds_count{{{view}}}'), before['timed'] + 1)
+
+    def test_counts_streamed_media_bytes(self):
+        content = make_image()
+        path = self._upload(content, 'm.png').file.name
+        view = 'http_response_bytes_total{view="protected-media"}'
+        before = self._sample(view)
+
+        response = self.client.get(f'/api/media/{path}/')
+        self.assertEqual(b''.join(response.streaming_content), content)
+        self.assertEqual(self._sample(view), before + len(content))
+
+    def test_upload_size_histogram(self):
+        series = 'photo_upload_size_bytes_bucket{view="photo-list-create",le="65536"}'
+        before = self._sample(series)
+        content = make_image(size=(32, 32))
+        self._upload(content, 's.png')
+        self.assertEqual(self._sample(series), before + 1)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_endpoint_requires_the_token(self):
+        for headers in [{}, {'HTTP_AUTHORIZATION': 'Bearer wrong'}, {'REMOTE_ADDR': '127.0.0.1'}]:
+            response = self._scrape(**headers)
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertIn('Bearer', response['WWW-Authenticate'])
+
+    def test_metrics_endpoint_is_hidden_without_a_token(self):
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self._scrape().status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_disabled_removes_middleware_and_endpoint(self):
+        from rest_framework.test import APIClient
+        from .metrics import REQUESTS
+        before = dict(REQUESTS.values)
+        with override_settings(PERFORMANCE_METRICS_ENABLED=False):
+            # A new client builds its middleware chain under the override.
+            client = APIClient()
+            client.credentials(**self.client._credentials)
+            self.assertEqual(client.get('/api/photos/').status_code, status.HTTP_200_OK)
+            self.assertEqual(client.get('/metrics').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(dict(REQUESTS.values), before)
+
+    def test_views_do_not_print(self):
+        from contextlib import redirect_stdout
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self._upload(make_image(), 'p.png')
+            self.client.get(f'/api/media/{Photo.objects.get().file.name}/')
+        self.assertEqual(out.getvalue(), '')
+
+
+class BenchApiCommandTests(APITestCase):
+
+    def test_seeds_and_reports_every_scenario(self):
+        import json
+        from django.core.management import call_command
+        from .benchmarks import QueryCounter
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+        out = io.StringIO()
+        call_command(
+            'bench_api', '--users', '3', '--photos-per-user', '2', '--shares', '4', '--files', '2',
+            '--requests', '6', '--concurrency', '1', '--pages', '2', '--page-size', '1',
+            stdout=out, stderr=io.StringIO(),
+        )
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(report['photos'], 6)
+        self.assertEqual(set(report['scenarios']), {'feed', 'thumbnails', 'uploads', 'shares'})
+        for name in ('feed', 'thumbnails', 'uploads', 'shares'):
+            summary = report['scenarios'][name]
+            self.assertEqual((summary['requests'], summary['errors']), (6, 0), name)
+            self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+            self.assertGreater(summary['queries_per_request']['mean'], 0)
+        self.assertEqual(Photo.objects.filter(original_name__startswith='bench-upload-').count(), 6)
+        self.assertFalse(any(isinstance(w, QueryCounter) for w in connection.execute_wrappers))
+
+    def test_seeded_photos_are_not_queued_for_processing(self):
+        from .benchmarks import seed_photos
+        user = User.objects.create_user(username='bench_seed', password='Password1')
+        seed_photos([user.id], 3)
+        self.assertEqual(claim_photos(), [])
+
+    def test_baseline_ratios(self):
+        from .management.commands.bench_api import add_baseline_ratios
+        report = {'scenarios': {'feed': {'p50_ms': 2.0, 'p95_ms': 3.0, 'p99_ms': None, 'requests_per_sec': 50}}}
+        add_baseline_ratios(report, {'scenarios': {'feed': {'p50_ms': 4.0, 'p95_ms': 3.0, 'p99_ms': 5.0,
+                                                            'requests_per_sec': 100}}})
+        self.assertEqual(report['scenarios']['feed']['vs_baseline'],
+                         {'p50_ms': 0.5, 'p95_ms': 1.0, 'requests_per_sec': 0.5})
+
+
+@unittest.skipUnless('webp' in supported_formats(), 'Pillow was built without WebP support')
+@override_settings(MEDIA_TRANSCODE_FORMATS=['webp'])
+class MediaTranscodeTests(PhotoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.photos = [self._upload(make_image(color=color)) for color in [(200, 40, 40), (40, 200, 40)]]
+
+    def tearDown(self):
+        for photo in self.photos:
+            photo.delete()
+
+    def _get(self, photo, accept=None):
+        headers = {'HTTP_ACCEPT': accept} if accept else {}
+        response = self.client.get(f'/api/media/{photo.file.name}/', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, b''.join(response.streaming_content)
+
+    def _encode_queued(self):
+        from .transcoding import claim_transcodes, process_transcodes
+        process_transcodes(claim_transcodes())
+
+    def _ready(self, photo, accept='image/webp'):
+        """Queue the copy with a first request, run the worker, then fetch it."""
+        self._get(photo, accept)
+        self._encode_queued()
+        return self._get(photo, accept)
+
+    def test_first_request_queues_and_serves_original(self):
+        response, body = self._get(self.photos[0], 'image/webp')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(MediaTranscode.objects.get().status, MediaTranscode.Status.PENDING)
+        self.assertFalse(MediaTranscode.objects.get().file)
+
+    def test_accept_webp_serves_webp_copy(self):
+        response, body = self._ready(self.photos[0], 'image/webp,image/*;q=0.8')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'])
+        image = Image.open(io.BytesIO(body))
+        self.assertEqual((image.format, image.size), ('WEBP', (600, 400)))
+        self.assertLess(len(body), self.photos[0].file.size)
+
+    def test_transcode_is_queued_and_encoded_once(self):
+        from .transcoding import claim_transcodes
+        self._get(self.photos[0], 'image/webp')
+        self._get(self.photos[0], 'image/webp')
+        self.assertEqual(MediaTranscode.objects.filter(source=self.photos[0].file.name).count(), 1)
+        claimed = claim_transcodes()
+        self.assertEqual(len(claimed), 1)
+        # Leased to the first worker, so no other one encodes it.
+        self.assertEqual(claim_transcodes(), [])
+
+    def test_original_without_explicit_accept(self):
+        for accept in [None, 'image/*', 'image/webp;q=0']:
+            response, body = self._get(self.photos[0], accept)
+            self.assertEqual(response['Content-Type'], 'image/png')
+            self.assertIn('Accept', response['Vary'])
+            self.assertEqual(Image.open(io.BytesIO(body)).format, 'PNG')
+        self.assertFalse(MediaTranscode.objects.exists())
+
+    def test_least_recently_used_copy_is_evicted(self):
+        self._ready(self.photos[0])
+        first = MediaTranscode.objects.get(source=self.photos[0].file.name)
+        with override_settings(MEDIA_TRANSCODE_QUOTA=first.file_size):
+            self._ready(self.photos[1])
+        self.assertEqual(list(MediaTranscode.objects.values_list('source', flat=True)), [self.photos[1].file.name])
+        self.assertFalse(os.path.exists(first.file.path))
+        response, _ = self._get(self.photos[0], 'image/webp')
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_copy_evicted_by_another_process_falls_back_to_original(self):
+        self._ready(self.photos[0])
+        transcode = MediaTranscode.objects.get()
+        # A worker's eviction clears only its own cache: remove the row and file without signals.
+        os.remove(transcode.file.path)
+        MediaTranscode.objects.filter(pk=transcode.pk)._raw_delete(using='default')
+
+        response, body = self._get(self.photos[0], 'image/webp')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(Image.open(io.BytesIO(body)).format, 'PNG')
+        self.assertEqual(MediaTranscode.objects.get().status, MediaTranscode.Status.PENDING)
+        self._encode_queued()
+        response, _ = self._get(self.photos[0], 'image/webp')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+
+    def test_repeat_signed_request_needs_no_queries(self):
+        from .signing import signed_media_url
+        self._ready(self.photos[0])
+        url = signed_media_url(self.user1.id, self.photos[0].file.name)
+        self.client.credentials()
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_ACCEPT='image/avif,image/webp,*/*')
+            b''.join(response.streaming_content)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+
+    async def test_async_view_serves_webp_copy(self):
+        url = f'/api/media-async/{self.photos[0].file.name}/'
+        headers = {'AUTHORIZATION': f'Bearer {self.token1}', 'ACCEPT': 'image/avif,image/webp,*/*'}
+        response = await self.async_client.get(url, headers=headers)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        await sync_to_async(self._encode_queued)()
+
+        response = await self.async_client.get(url, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual((await MediaTranscode.objects.aget()).format, 'webp')
+
+    def test_deleting_photo_removes_transcode(self):
+        self._ready(self.photos[0])
+        path = MediaTranscode.objects.get().file.path
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/photos/{self.photos[0].id}/')
+        self.assertFalse(MediaTranscode.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+
+class PhotoSimilarityTests(PhotoTestCase):
+
+    def _scene(self, seed, size=(600, 400), fmt='PNG'):
+        # Smooth random blobs: enough structure for a stable hash, distinct per seed.
+        import random
+        rng = random.Random(seed)
+        noise = Image.frombytes('L', (8, 6), bytes(rng.randrange(256) for _ in range(48)))
+        buffer = io.BytesIO()
+        noise.resize(size, Image.Resampling.BICUBIC).convert('RGB').save(buffer, fmt, quality=70)
+        return buffer.getvalue()
+
+    def _process(self):
+        process_claimed(claim_photos(limit=100))
+
+    def _similar(self, photo_id, query=''):
+        return self.client.get(f'/api/photos/{photo_id}/similar/{query}')
+
+    def test_hash_chunks_round_trip(self):
+        from .similarity import from_signed, hash_chunks, hash_fields, to_signed
+        value = 0xF00D_0000_BEEF_0001
+        self.assertEqual(from_signed(to_signed(value)), value)
+        self.assertLess(to_signed(value), 0)
+        self.assertEqual(hash_chunks(value), [0x0001, 0xBEEF, 0x0000, 0xF00D])
+        self.assertEqual(hash_fields(value)['phash_3'], 0xF00D)
+
+    def test_finds_reencoded_copy_but_not_other_photos(self):
+        original = self._upload(self._scene(1)).id
+        copy = self._upload(self._scene(1, size=(300, 200), fmt='JPEG'), 'copy.jpg').id
+        other = self._upload(self._scene(2), 'other.png').id
+        self._process()
+
+        response = self._similar(original)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['id'] for p in response.data], [copy])
+        self.assertLessEqual(response.data[0]['distance'], 3)
+        self.assertNotIn(other, [p['id'] for p in self._similar(copy).data])
+
+    def test_lookup_probes_index_chunks(self):
+        from .similarity import hash_fields
+        base = 0x1234_5678_9ABC_DEF0
+        ids = [self._upload(self._scene(seed), f'{seed}.png').id for seed in range(3)]
+        # Three flipped bits in three chunks leave one chunk intact; four leave none.
+        near = base ^ (1 | 1 << 16 | 1 << 32)
+        far = base ^ (1 | 1 << 16 | 1 << 32 | 1 << 48)
+        for photo_id, value in zip(ids, (base, near, far)):
+            Photo.objects.filter(id=photo_id).update(**hash_fields(value))
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._similar(ids[0])
+        self.assertEqual([(p['id'], p['distance']) for p in response.data], [(ids[1], 3)])
+        self.assertTrue(any('."phash_3" = ' in q['sql'] for q in ctx.captured_queries))
+
+        response = self._similar(ids[0], '?distance=2')
+        self.assertEqual(response.data, [])
+
+    def test_results_are_limited_to_visible_photos(self):
+        mine = self._upload(self._scene(3)).id
+        self._login('user2', 'Password2')
+        theirs = self._upload(self._scene(3, fmt='JPEG'), 'theirs.jpg').id
+        self._process()
+
+        self.assertEqual(self._similar(mine).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self._similar(theirs).data, [])
+
+        self._login('user1', 'Password1')
+        self.client.post('/api/photos/share/', {'photo': mine, 'shared_to': self.user2.email})
+        self._login('user2', 'Password2')
+        self.assertEqual([p['id'] for p in self._similar(theirs).data], [mine])
+
+    def test_invalid_distance_is_rejected(self):
+        photo = self._upload(self._scene(4)).id
+        self._process()
+        self.assertEqual(self._similar(photo, '?distance=9').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._similar(photo, '?distance=x').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_hash_photos_command_backfills(self):
+        from django.core.management import call_command
+        photo = self._upload(self._scene(5)).id
+        self._process()
+        Photo.objects.filter(id=photo).update(phash=None, phash_0=None)
+
+        out = io.StringIO()
+        call_command('hash_photos', stdout=out)
+        self.assertIn('Hashed 1 photos', out.getvalue())
+        self.assertIsNotNone(Photo.objects.get(id=photo).phash)
+
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    boto3 = None
+
+S3_OPTIONS = {
+    'bucket_name': 'photos-test', 'region_name': 'us-east-1',
+    'access_key': 'testing', 'secret_key': 'testing',
+}
+
+
+@unittest.skipIf(boto3 is None, 'boto3 and moto are needed for the S3 storage tests')
+class S3StorageTests(PhotoTestCase):
+
+    def setUp(self):
+        from unittest import mock
+        from .storage import S3ContentAddressedStorage, photo_storage
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=S3_OPTIONS['bucket_name'])
+
+        overrides = override_settings(STORAGES={
+            'default': {'BACKEND': 'photos.storage.S3Storage', 'OPTIONS': S3_OPTIONS},
+            'photos': {'BACKEND': 'photos.storage.S3ContentAddressedStorage', 'OPTIONS': S3_OPTIONS},
+            'staticfiles': settings.STORAGES['staticfiles'],
+        }, MEDIA_DELIVERY_BACKEND='django')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # The field resolved its storage callable at import time.
+        self.storage = photo_storage()
+        patcher = mock.patch.object(Photo._meta.get_field('file'), 'storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.assertIsInstance(self.storage, S3ContentAddressedStorage)
+
+        super().setUp()
+
+    def _keys(self):
+        listing = self.storage.client.list_objects_v2(Bucket=S3_OPTIONS['bucket_name'])
+        return sorted(obj['Key'] for obj in listing.get('Contents', []))
+
+    def test_identical_uploads_store_one_object(self):
+        content = make_image()
+        first = self._upload(content, 'a.png')
+        second = self._upload(content, 'b.png')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(self._keys(), [first.file.name])
+        self.assertEqual(Blob.objects.get(name=first.file.name).ref_count, 2)
+
+    def test_large_files_upload_in_parts(self):
+        from django.core.files.base import ContentFile
+        from .storage import S3ContentAddressedStorage
+        storage = S3ContentAddressedStorage(
+            **S3_OPTIONS, multipart_threshold=5 * 1024 * 1024, multipart_chunksize=5 * 1024 * 1024,
+            spool_max_size=1024 * 1024,
+        )
+        content = os.urandom(11 * 1024 * 1024)
+        name = storage.save('uploads/big.bin', ContentFile(content))
+
+        head = storage.client.head_object(Bucket=S3_OPTIONS['bucket_name'], Key=name)
+        self.assertTrue(head['ETag'].strip('"').endswith('-3'))
+        self.assertEqual(storage.stat(name).st_size, len(content))
+        with storage.open(name) as fh:
+            self.assertEqual(fh.read(), content)
+
+        storage.delete(name)
+        self.assertFalse(storage.exists(name))
+        with self.assertRaises(FileNotFoundError):
+            storage.stat(name)
+
+    def test_django_backend_streams_ranges_from_the_bucket(self):
+        content = make_image()
+        photo = self._upload(content)
+        response = self.client.get(f'/api/media/{photo.file.name}/', HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), content[:10])
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{len(content)}')
+
+        etag = response['ETag']
+        response = self.client.get(f'/api/media/{photo.file.name}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(MEDIA_DELIVERY_BACKEND='redirect')
+    def test_redirect_backend_sends_a_presigned_url(self):
+        photo = self._upload(make_image())
+        response = self.client.get(f'/api/media/{photo.file.name}/')
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertIn(photo.file.name, response['Location'])
+        self.assertIn('Signature=', response['Location'])
+
+    def test_missing_object_is_404(self):
+        photo = self._upload(make_image())
+        self.storage.delete(photo.file.name)
+        response = self.client.get(f'/api/media/{photo.file.name}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_renditions_are_written_to_the_bucket(self):
+        photo = self._upload(make_image(), 'r.png')
+        response = self.client.get(f'/api/media/{photo.file.name}/?size=256')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        image = Image.open(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(image.width, 256)
+        rendition = PhotoRendition.objects.get(photo=photo)
+        self.assertIn(rendition.file.name, self._keys())
+
+    def test_deleting_photos_removes_their_objects(self):
+        from .storage import wait_for_background_deletes
+        photo = self._upload(make_image())
+        self.client.get(f'/api/media/{photo.file.name}/?size=256')
+        self.assertEqual(len(self._keys()), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete('/api/photos/bulk/', {'ids': [photo.id]}, format='json')
+        self.assertEqual(response.data['deleted'], 1)
+        wait_for_background_deletes()
+        self.assertEqual(self._keys(), [])
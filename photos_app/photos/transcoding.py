@@ -0,0 +1,235 @@
+"""
+Full-size WebP/AVIF copies of original JPEG and PNG uploads.
+
+The media view asks negotiate_format() which of MEDIA_TRANSCODE_FORMATS the
+request's Accept header lists and serves get_transcode() instead of the
+original when a copy is ready. A request never encodes: the first one for a
+(source, format) queues a pending MediaTranscode row and is answered with the
+original, and the process_photos worker claims pending rows under the same
+kind of lease as photos, so each copy is encoded once by one process.
+
+Copies are stored under transcodes/ beside the renditions and shared by every
+photo with the same file. When they take up more than MEDIA_TRANSCODE_QUOTA
+bytes the least recently served ones are deleted. A ready or skipped copy's
+stored name is cached per (path, format) for MEDIA_LOOKUP_CACHE_TTL seconds,
+so a repeat request runs no queries; last_used_at is refreshed, at most every
+TOUCH_INTERVAL, when that entry has expired.
+"""
+import hashlib
+import logging
+import mimetypes
+import traceback
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .models import MediaTranscode
+from .renditions import encode, load_image, supported_formats
+from .storage import photo_storage
+
+logger = logging.getLogger(__name__)
+
+SOURCE_TYPES = {'image/jpeg', 'image/png'}
+TOUCH_INTERVAL = timedelta(minutes=10)
+
+
+def accepted_types(header):
+    """Media types explicitly listed in an Accept header with a non-zero q."""
+    types = set()
+    for item in (header or '').split(','):
+        media_type, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type and quality > 0:
+            types.add(media_type.lower())
+    return types
+
+
+def transcodable(path):
+    """Whether `path` is an original that may be served transcoded."""
+    return bool(settings.MEDIA_TRANSCODE_FORMATS) and mimetypes.guess_type(path)[0] in SOURCE_TYPES
+
+
+def negotiate_format(request):
+    """The first MEDIA_TRANSCODE_FORMATS entry the client accepts and Pillow can encode, or None."""
+    accepted = accepted_types(request.META.get('HTTP_ACCEPT'))
+    available = supported_formats()
+    for fmt in settings.MEDIA_TRANSCODE_FORMATS:
+        if fmt in available and f'image/{fmt}' in accepted:
+            return fmt
+    return None
+
+
+def _cache_key(path, fmt):
+    digest = hashlib.md5(path.encode('utf-8')).hexdigest()
+    return f'media-transcode:{digest}:{fmt}'
+
+
+def get_transcode(path, fmt):
+    """The ready `fmt` copy of `path`, or None to serve the original; the first miss queues the copy."""
+    key = _cache_key(path, fmt)
+    name = cache.get(key)
+    if name is not None:
+        return _cached(path, fmt, name)
+    transcode = MediaTranscode.objects.filter(source=path, format=fmt).first()
+    if transcode is None:
+        queue_transcode(path, fmt)
+        return None
+    if transcode.status == MediaTranscode.Status.PENDING:
+        return None
+    cache.set(key, transcode.file.name or '', settings.MEDIA_LOOKUP_CACHE_TTL)
+    if transcode.status != MediaTranscode.Status.READY:
+        return None
+    now = timezone.now()
+    if transcode.last_used_at < now - TOUCH_INTERVAL:
+        MediaTranscode.objects.filter(pk=transcode.pk).update(last_used_at=now)
+    return transcode
+
+
+async def aget_transcode(path, fmt):
+    """get_transcode() for async views; only a lookup that misses the cache runs in a thread."""
+    name = await cache.aget(_cache_key(path, fmt))
+    if name is not None:
+        return _cached(path, fmt, name)
+    return await sync_to_async(get_transcode)(path, fmt)
+
+
+def _cached(path, fmt, name):
+    # An empty name records a skipped copy.
+    return MediaTranscode(source=path, format=fmt, file=name, status=MediaTranscode.Status.READY) if name else None
+
+
+def invalidate_transcode(path, fmt):
+    cache.delete(_cache_key(path, fmt))
+
+
+def discard_transcode(path, fmt, name):
+    """
+    Drop the copy of `path` stored as `name`, whose file turned out to be
+    missing, and queue it again. A process_photos worker that evicted it only
+    cleared its own cache, which the web process may not share.
+    """
+    invalidate_transcode(path, fmt)
+    MediaTranscode.objects.filter(source=path, format=fmt, file=name).delete()
+    queue_transcode(path, fmt)
+
+
+def queue_transcode(path, fmt):
+    try:
+        with transaction.atomic():
+            transcode = MediaTranscode.objects.create(source=path, format=fmt, last_used_at=timezone.now())
+    except IntegrityError:
+        # Another request queued it first.
+        return
+    if settings.PHOTO_PROCESSING_BACKEND == 'eager':
+        transaction.on_commit(lambda: process_transcodes(claim_transcodes(ids=[transcode.pk])))
+
+
+def claim_transcodes(limit=None, ids=None):
+    """Lease up to `limit` pending copies to the caller and return their ids."""
+    now = timezone.now()
+    expired = now - timedelta(seconds=settings.PHOTO_PROCESSING_LEASE)
+    pending = MediaTranscode.objects.filter(
+        Q(encoding_started_at__isnull=True) | Q(encoding_started_at__lt=expired),
+        status=MediaTranscode.Status.PENDING,
+    )
+    if ids is not None:
+        pending = pending.filter(id__in=ids)
+
+    with transaction.atomic():
+        claimed = pending.select_for_update(skip_locked=True).order_by('id').values_list('id', flat=True)
+        claimed = list(claimed[:limit] if limit else claimed)
+        MediaTranscode.objects.filter(id__in=claimed).update(encoding_started_at=now)
+    return claimed
+
+
+def _encode(path, fmt):
+    """Encoded content for `path`, or None when the original should be served."""
+    storage = photo_storage()
+    try:
+        image = load_image(storage.open(path, 'rb'))
+        content, _ = encode(image, max(image.size), fmt)
+    except OSError:
+        logger.warning('Could not transcode %s to %s; serving the original', path, fmt, exc_info=True)
+        return None
+    if content.size >= storage.size(path):
+        return None
+    return content
+
+
+def run_transcode(transcode_id):
+    """Encode one claimed copy. Returns None on success or the formatted error."""
+    try:
+        transcode = MediaTranscode.objects.filter(pk=transcode_id).first()
+        if transcode is None:
+            return None
+        content = _encode(transcode.source, transcode.format)
+        if content is None:
+            MediaTranscode.objects.filter(pk=transcode_id).update(
+                status=MediaTranscode.Status.SKIPPED, encoding_started_at=None,
+            )
+            return None
+        stem = transcode.source.rsplit('.', 1)[0]
+        name = transcode.file.storage.save(
+            transcode.file.field.generate_filename(transcode, f'{stem}.{transcode.format}'), content,
+        )
+        updated = MediaTranscode.objects.filter(pk=transcode_id).update(
+            status=MediaTranscode.Status.READY, encoding_started_at=None,
+            file=name, file_size=content.size, last_used_at=timezone.now(),
+        )
+        if not updated:
+            # The source was deleted while encoding.
+            transcode.file.storage.delete(name)
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+def process_transcodes(transcode_ids, executor=None):
+    """Encode claimed copies, in `executor` when one is given, then enforce the quota."""
+    if executor is None:
+        results = map(run_transcode, transcode_ids)
+    else:
+        results = executor.map(run_transcode, transcode_ids)
+    for transcode_id, error in zip(transcode_ids, results):
+        if error is not None:
+            logger.warning('Transcoding %s failed:\n%s', transcode_id, error)
+            MediaTranscode.objects.filter(pk=transcode_id).update(
+                status=MediaTranscode.Status.SKIPPED, encoding_started_at=None,
+            )
+    if transcode_ids:
+        evict_transcodes(settings.MEDIA_TRANSCODE_QUOTA, keep=transcode_ids)
+
+
+def evict_transcodes(quota, keep=()):
+    """
+    Delete least recently used copies until the stored ones fit in `quota`
+    bytes, never those with a pk in `keep`. Returns the number deleted.
+    """
+    total = MediaTranscode.objects.aggregate(total=Sum('file_size'))['total'] or 0
+    if total <= quota:
+        return 0
+    victims = []
+    candidates = (
+        MediaTranscode.objects.filter(status=MediaTranscode.Status.READY)
+        .exclude(pk__in=keep).order_by('last_used_at', 'pk')
+    )
+    for pk, file_size in candidates.values_list('pk', 'file_size').iterator():
+        if total <= quota:
+            break
+        victims.append(pk)
+        total -= file_size
+    # Per-row delete signals remove the files.
+    MediaTranscode.objects.filter(pk__in=victims).delete()
+    return len(victims)
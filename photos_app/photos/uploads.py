@@ -0,0 +1,232 @@
+"""
+Upload validation from the first bytes of the file.
+
+The format comes from the magic bytes and the dimensions from the format's
+own header (PNG IHDR, GIF screen descriptor, JPEG SOF marker, WebP VP8*
+chunk), so no pixels are decoded and a decompression bomb is refused before
+anything tries to.
+
+ImageUploadHandler runs the same checks on the multipart stream: a part that
+is not a supported image is refused as soon as its first bytes arrive, and one
+that grows past PHOTO_MAX_UPLOAD_SIZE as soon as it does. The rest of a
+refused part is read off the socket and dropped instead of being spooled to
+disk, and the part reaches the view as a RejectedUpload that ImageUploadField
+turns into a validation error.
+"""
+import io
+import struct
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+# Header bytes the upload handler keeps for parsing; a JPEG whose SOF marker
+# comes later is checked once the whole file has arrived.
+HEADER_BYTES = 64 * 1024
+
+MAGIC = [
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+]
+MAGIC_BYTES = 12
+
+# JPEG start-of-frame markers; C4, C8 and CC share the range but are not frames.
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Markers without a length field.
+STANDALONE_MARKERS = set(range(0xD0, 0xDA)) | {0x01}
+
+ImageHeader = namedtuple('ImageHeader', 'format width height')
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class TruncatedHeader(InvalidImage):
+    """The bytes seen so far end before the dimensions."""
+
+
+def sniff_format(start):
+    for magic, fmt in MAGIC:
+        if start.startswith(magic):
+            return fmt
+    if start[:4] == b'RIFF' and start[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def _read(fp, size):
+    data = fp.read(size)
+    if len(data) < size:
+        raise TruncatedHeader('The image header is incomplete.')
+    return data
+
+
+def _png_size(fp):
+    fp.seek(8)
+    length, chunk, width, height = struct.unpack('>I4sII', _read(fp, 16))
+    if chunk != b'IHDR':
+        raise InvalidImage('The PNG has no IHDR chunk.')
+    return width, height
+
+
+def _gif_size(fp):
+    fp.seek(6)
+    return struct.unpack('<HH', _read(fp, 4))
+
+
+def _jpeg_size(fp):
+    fp.seek(2)
+    while True:
+        if _read(fp, 1) != b'\xff':
+            raise InvalidImage('The JPEG marker stream is corrupt.')
+        marker = _read(fp, 1)[0]
+        while marker == 0xFF:
+            marker = _read(fp, 1)[0]
+        if marker in STANDALONE_MARKERS:
+            continue
+        if marker == 0xDA:
+            raise InvalidImage('The JPEG has no frame header.')
+        length, = struct.unpack('>H', _read(fp, 2))
+        if marker in SOF_MARKERS:
+            _, height, width = struct.unpack('>BHH', _read(fp, 5))
+            return width, height
+        if length < 2:
+            raise InvalidImage('The JPEG marker stream is corrupt.')
+        fp.seek(length - 2, io.SEEK_CUR)
+
+
+def _webp_size(fp):
+    fp.seek(12)
+    chunk = _read(fp, 4)
+    fp.seek(20)
+    if chunk == b'VP8 ':
+        frame = _read(fp, 10)
+        if frame[3:6] != b'\x9d\x01\x2a':
+            raise InvalidImage('The WebP frame is corrupt.')
+        width, height = struct.unpack('<HH', frame[6:10])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L':
+        data = _read(fp, 5)
+        if data[0] != 0x2F:
+            raise InvalidImage('The WebP frame is corrupt.')
+        bits, = struct.unpack('<I', data[1:])
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        data = _read(fp, 10)
+        return int.from_bytes(data[4:7], 'little') + 1, int.from_bytes(data[7:10], 'little') + 1
+    raise InvalidImage('The WebP has no image chunk.')
+
+
+SIZE_READERS = {'JPEG': _jpeg_size, 'PNG': _png_size, 'GIF': _gif_size, 'WEBP': _webp_size}
+
+
+def read_image_header(fp):
+    """Format and dimensions of the image in `fp`, read from its header only."""
+    fp.seek(0)
+    fmt = sniff_format(fp.read(MAGIC_BYTES))
+    if fmt is None:
+        raise InvalidImage('Upload a valid image. The file is not a JPEG, PNG, GIF or WebP image.')
+    width, height = SIZE_READERS[fmt](fp)
+    if not width or not height:
+        raise InvalidImage('The image has no pixels.')
+    return ImageHeader(fmt, width, height)
+
+
+def check_image_header(header):
+    if header.format not in settings.PHOTO_UPLOAD_FORMATS:
+        raise InvalidImage(f'{header.format} images are not accepted.')
+    if header.width * header.height > settings.PHOTO_MAX_IMAGE_PIXELS:
+        raise InvalidImage(
+            f'The image is {header.width}x{header.height} pixels; at most '
+            f'{settings.PHOTO_MAX_IMAGE_PIXELS} pixels are accepted.'
+        )
+    return header
+
+
+def check_upload_size(size):
+    if size > settings.PHOTO_MAX_UPLOAD_SIZE:
+        raise InvalidImage(f'Uploads are limited to {settings.PHOTO_MAX_UPLOAD_SIZE} bytes.')
+
+
+def validate_image_upload(file):
+    """Check a received file from its header; raises InvalidImage."""
+    check_upload_size(file.size)
+    try:
+        return check_image_header(read_image_header(file))
+    finally:
+        file.seek(0)
+
+
+class RejectedUpload(UploadedFile):
+    """An empty stand-in for a file part the upload handler refused; `rejection` says why."""
+
+    def __init__(self, name, content_type, rejection):
+        super().__init__(io.BytesIO(), name, content_type, 0)
+        self.rejection = rejection
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """
+    Checks each file part while it streams in and passes accepted bytes on to
+    the next handler. Must come first in FILE_UPLOAD_HANDLERS.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.header = bytearray()
+        self.received = 0
+        self.checked = False
+        self.rejection = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.rejection:
+            return None
+        self.received += len(raw_data)
+        if not self.checked and len(self.header) < HEADER_BYTES:
+            self.header += raw_data[:HEADER_BYTES - len(self.header)]
+        try:
+            check_upload_size(self.received)
+            self.check_header(complete=False)
+        except InvalidImage as exc:
+            self.reject(str(exc))
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not self.rejection:
+            try:
+                self.check_header(complete=True)
+            except InvalidImage as exc:
+                self.reject(str(exc))
+        if self.rejection:
+            return RejectedUpload(self.file_name, self.content_type, self.rejection)
+        return None
+
+    def check_header(self, complete):
+        if self.checked:
+            return
+        if len(self.header) < MAGIC_BYTES and not complete:
+            return
+        try:
+            check_image_header(read_image_header(io.BytesIO(self.header)))
+        except TruncatedHeader:
+            if complete and self.received <= len(self.header):
+                raise
+            if complete or len(self.header) >= HEADER_BYTES:
+                # Dimensions lie beyond the kept bytes; ImageUploadField reads them from the file.
+                self.checked = True
+            return
+        self.checked = True
+
+    def reject(self, message):
+        self.rejection = message
+        # Drop what the following handlers buffered before the part was refused.
+        handlers = self.request.upload_handlers
+        for handler in handlers[handlers.index(self) + 1:]:
+            file = getattr(handler, 'file', None)
+            if file is not None:
+                file.close()
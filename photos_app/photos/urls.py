@@ -1,8 +1,19 @@
 from django.urls import path
-from .views import PhotoListCreateView, PhotoDetailView, PhotoShareView
+from .views import (
+    PhotoListCreateView, PhotoDetailView, PhotoSimilarView, PhotoBulkView, PhotoExportView, PhotoShareView,
+    PhotoBulkShareView,
+    UploadSessionCreateView, UploadSessionDetailView, UploadSessionCompleteView,
+)
 
 urlpatterns = [
     path('', PhotoListCreateView.as_view(), name='photo-list-create'),
     path('<int:pk>/', PhotoDetailView.as_view(), name='photo-detail'),
+    path('<int:pk>/similar/', PhotoSimilarView.as_view(), name='photo-similar'),
+    path('bulk/', PhotoBulkView.as_view(), name='photo-bulk'),
+    path('export/', PhotoExportView.as_view(), name='photo-export'),
     path('share/', PhotoShareView.as_view(), name='photo-share'),
+    path('share/bulk/', PhotoBulkShareView.as_view(), name='photo-share-bulk'),
+    path('uploads/', UploadSessionCreateView.as_view(), name='upload-session-create'),
+    path('uploads/<uuid:pk>/', UploadSessionDetailView.as_view(), name='upload-session-detail'),
+    path('uploads/<uuid:pk>/complete/', UploadSessionCompleteView.as_view(), name='upload-session-complete'),
 ]
\ No newline at end of file
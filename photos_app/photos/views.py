@@ -1,14 +1,34 @@
 from rest_framework import generics, permissions, serializers
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
+from django.core.files import File, locks
+from django.db import transaction
+from rest_framework.views import APIView
 import logging
+from collections import Counter, defaultdict
 
-from .models import Photo, PhotoShare
-from .serializers import PhotoSerializer, PhotoShareSerializer
+from .access import acan_access_media, can_access_media, invalidate_media_access
+from .delivery import aserve_media, serve_media
+from .export import stream_zip
+from .feed import MaterializedFeed, add_owner_entries, add_share_entries
+from .metrics import observe_upload
+from .models import Blob, Photo, PhotoShare, UploadSession, delete_unreferenced_blobs, restore_blob
+from .pagination import FeedCursorPagination
+from .permissions import HasValidMediaSignature
+from .processing import enqueue_photo
+from .renditions import aget_rendition, content_type_for, get_rendition, supported_formats
+from .signing import verify_media_signature
+from .similarity import MAX_DISTANCE, similar_photos
+from .storage import photo_storage
+from .transcoding import aget_transcode, discard_transcode, get_transcode, negotiate_format, transcodable
+from .serializers import (
+    BulkDeleteSerializer, BulkShareSerializer, ExportQuerySerializer, FeedQuerySerializer, PhotoSerializer,
+    PhotoShareSerializer, SimilarPhotoSerializer, UploadSessionSerializer,
+)
 from django.contrib.auth.models import User
+from users.authentication import StatelessJWTAuthentication, auser_is_active, token_user_id
 
 logger = logging.getLogger(__name__)
 
@@ -17,8 +37,9 @@ class PhotoListCreateView(generics.ListCreateAPIView):
     queryset = Photo.objects.all()
     serializer_class = PhotoSerializer
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     parser_classes = [MultiPartParser, FormParser]
+    pagination_class = FeedCursorPagination
 
     def create(self, request, *args, **kwargs):
         try:
@@ -32,103 +53,556 @@ class PhotoListCreateView(generics.ListCreateAPIView):
         return super().create(request, *args, **kwargs)
 
     def get_queryset(self):
-        user = self.request.user
-        owned_photos = Photo.objects.filter(owner=user)
-        shared_photos = Photo.objects.filter(shares__shared_to=user)
-        
-        return (owned_photos | shared_photos).distinct()
+        # Pages come from get_feed_page(); this is the same FeedEntry-backed set.
+        return Photo.objects.filter(feed_entries__user_id=self.request.user.id)
+
+    def get_feed_page(self, position, limit):
+        query = FeedQuerySerializer(data=self.request.query_params)
+        query.is_valid(raise_exception=True)
+        filters = dict(query.validated_data)
+        sort = filters.pop('sort')
+        return MaterializedFeed(self.request.user, sort, filters).page(position, limit)
 
     def perform_create(self, serializer):
         file = self.request.data.get('file')
         if not file:
             raise serializers.ValidationError({'file': 'No file provided'})
         original_name = file.name
-        print(f"[DEBUG] Uploading file: {original_name} for user: {self.request.user.username}")
         photo = serializer.save(owner=self.request.user, original_name=original_name)
-        print(f"[DEBUG] Successfully saved photo ID {photo.id} with file: {photo.file.name}")
+        restore_blob(photo.file.name, file)
+        enqueue_photo(photo)
+        observe_upload(file.size)
+        logger.debug('Saved photo %s (%s) for user %s as %s', photo.id, original_name, self.request.user.id, photo.file.name)
 
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import IsAuthenticated
-from django.http import FileResponse, HttpResponseForbidden, Http404
+from django.http import HttpResponseBadRequest, Http404, JsonResponse, StreamingHttpResponse
 from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed, NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework_simplejwt.exceptions import InvalidToken
+from asgiref.sync import sync_to_async
 import mimetypes
 import os
 
 
+class MediaContentNegotiation(DefaultContentNegotiation):
+    """
+    Media bodies are files rather than rendered data, so an Accept header
+    listing only image types (image/avif,image/webp,...) must not end in a 406;
+    error payloads fall back to the first renderer.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
+
+
+def media_negotiation(func):
+    # api_view() picks this up like the attributes set by the other DRF decorators.
+    func.content_negotiation_class = MediaContentNegotiation
+    return func
+
+
 @api_view(['GET'])
-@authentication_classes([JWTAuthentication])
-@permission_classes([IsAuthenticated])
+@authentication_classes([StatelessJWTAuthentication])
+@permission_classes([IsAuthenticated | HasValidMediaSignature])
+@media_negotiation
 def protected_media(request, path):
-    
-    print("\n--- DEBUG: protected_media ---")
-    print(f"1. Received request for path: {path}")
-    
+    # A signed URL was authorized when the feed issued it; skip the lookup.
+    max_age = verify_media_signature(path, request.GET)
+    if max_age is None:
+        if not can_access_media(request.user, path):
+            logger.debug('Media access denied: user=%s path=%s', request.user.id, path)
+            # A 403 would confirm that someone else stored these bytes.
+            raise Http404()
+
+    if 'size' in request.GET:
+        return rendition_media(request, path, max_age)
+    return serve_original(request, path, max_age)
+
+
+def original_format(request, path):
+    """The WebP/AVIF format to answer for the original at `path` with, or None; needs no database."""
+    return negotiate_format(request) if transcodable(path) else None
+
+
+def _original_source(path, transcode):
+    if transcode is not None:
+        return transcode.file.storage, transcode.file.name, content_type_for(transcode.format)
+    return photo_storage(), path, mimetypes.guess_type(path)[0]
+
+
+def resolve_original(request, path):
+    """
+    The (storage, name, content_type) to answer `request` for the original at
+    `path` with: a ready WebP/AVIF copy the client accepts, or the upload.
+    """
+    fmt = original_format(request, path)
+    return _original_source(path, get_transcode(path, fmt) if fmt else None)
+
+
+async def aresolve_original(request, path):
+    """resolve_original() for async views; clients that get the upload never leave the event loop."""
+    fmt = original_format(request, path)
+    return _original_source(path, await aget_transcode(path, fmt) if fmt else None)
+
+
+def vary_on_accept(response, path):
+    if transcodable(path):
+        # The body depends on Accept, so shared caches must not hand a WebP to a client without support.
+        patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def serve_original(request, path, max_age=None):
+    storage, name, content_type = resolve_original(request, path)
+    try:
+        response = serve_media(request, storage, name, content_type, max_age)
+    except FileNotFoundError:
+        if name == path:
+            raise Http404()
+        discard_transcode(path, original_format(request, path), name)
+        try:
+            response = serve_media(request, *_original_source(path, None), max_age)
+        except FileNotFoundError:
+            raise Http404()
+    return vary_on_accept(response, path)
+
+
+async def aserve_original(request, path, max_age=None):
+    storage, name, content_type = await aresolve_original(request, path)
+    try:
+        response = await aserve_media(request, storage, name, content_type, max_age)
+    except FileNotFoundError:
+        if name == path:
+            raise Http404()
+        await sync_to_async(discard_transcode)(path, original_format(request, path), name)
+        try:
+            response = await aserve_media(request, *_original_source(path, None), max_age)
+        except FileNotFoundError:
+            raise Http404()
+    return vary_on_accept(response, path)
+
+
+def rendition_params(request):
+    """The requested (size, format) of a rendition, or None if it is not one that is generated."""
     try:
-        photo = Photo.objects.get(file=path)
-        print(f"2. [SUCCESS] Found photo in database: {photo.original_name}")
+        size = int(request.GET['size'])
+    except ValueError:
+        size = None
+    fmt = request.GET.get('fmt', 'jpeg')
+    if size not in settings.PHOTO_RENDITION_SIZES or fmt not in supported_formats():
+        return None
+    return size, fmt
+
+
+def rendition_media(request, path, max_age=None):
+    params = rendition_params(request)
+    if params is None:
+        return HttpResponseBadRequest('Unsupported rendition')
+    size, fmt = params
+
+    try:
+        rendition = get_rendition(path, size, fmt)
+    except Photo.DoesNotExist:
+        raise Http404()
+    except OSError:
+        logger.warning('Could not render %s at %spx as %s; serving the original', path, size, fmt, exc_info=True)
+        return serve_original(request, path, max_age)
+
+    try:
+        return serve_media(request, rendition.file.storage, rendition.file.name, content_type_for(fmt), max_age)
+    except FileNotFoundError:
+        raise Http404()
+
+
+async def arendition_media(request, path, max_age=None):
+    params = rendition_params(request)
+    if params is None:
+        return HttpResponseBadRequest('Unsupported rendition')
+    size, fmt = params
+
+    try:
+        # Rendering a missing rendition is Pillow work, which aget_rendition() runs in a thread.
+        rendition = await aget_rendition(path, size, fmt)
     except Photo.DoesNotExist:
-        print(f"2. [ERROR] Http404! No Photo found in database with path: {path}")
         raise Http404()
+    except OSError:
+        logger.warning('Could not render %s at %spx as %s; serving the original', path, size, fmt, exc_info=True)
+        return await aserve_original(request, path, max_age)
 
-    user = request.user
-    owned = photo.owner == user
-    shared = photo.shares.filter(shared_to=user).exists()
-    
-    if not (owned or shared):
-        print(f"3. [ERROR] HttpResponseForbidden! Access denied. Owner: {owned}, Shared: {shared}")
-        return HttpResponseForbidden('Access denied')
-    
-    print(f"3. [SUCCESS] Access granted. Owner: {owned}, Shared: {shared}")
-
-    file_path = settings.MEDIA_ROOT / path
-    print(f"4. Full file path: {file_path}")
-    
-    if not os.path.exists(str(file_path)):
-        print(f"5. [ERROR] Http404! File DOES NOT EXIST on disk at path: {file_path}")
+    try:
+        return await aserve_media(request, rendition.file.storage, rendition.file.name, content_type_for(fmt), max_age)
+    except FileNotFoundError:
         raise Http404()
-    
-    print(f"5. [SUCCESS] File exists on disk.")
 
-    content_type, _ = mimetypes.guess_type(str(file_path))
-    return FileResponse(open(file_path, 'rb'), content_type=content_type)
+
+async def _authenticate_jwt(request):
+    """Return the id of the active user the bearer token belongs to."""
+    auth = StatelessJWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        raise AuthenticationFailed('Authentication credentials were not provided.')
+    user_id = token_user_id(auth.get_validated_token(raw_token))
+    if not await auser_is_active(user_id):
+        raise AuthenticationFailed('User is inactive')
+    return user_id
+
+
+@require_GET
+async def protected_media_async(request, path):
+    """
+    protected_media() as a native async view for ASGI deployments: the token
+    check, access lookup and file reads all yield to the event loop instead of
+    holding one of the thread-sensitive executor's slots per download.
+    """
+    max_age = verify_media_signature(path, request.GET)
+    if max_age is None:
+        try:
+            user_id = await _authenticate_jwt(request)
+        except (AuthenticationFailed, InvalidToken) as exc:
+            response = JsonResponse({'detail': exc.detail}, status=exc.status_code)
+            response['WWW-Authenticate'] = StatelessJWTAuthentication().authenticate_header(request)
+            return response
+
+        if not await acan_access_media(user_id, path):
+            raise Http404()
+
+    if 'size' in request.GET:
+        return await arendition_media(request, path, max_age)
+    return await aserve_original(request, path, max_age)
 
 
 class PhotoDetailView(generics.RetrieveDestroyAPIView):
     serializer_class = PhotoSerializer
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
 
     def get_queryset(self):
         user = self.request.user
-        return Photo.objects.filter(owner=user)
+        return Photo.objects.filter(owner_id=user.id)
 
     def perform_destroy(self, instance):
-        if instance.file:
-            instance.file.delete(save=False)
-        print(f"[DEBUG] Deleted photo ID {instance.id} ({instance.original_name}) by user {self.request.user.username}")
+        # The file is released through its Blob and removed with the last reference.
         instance.delete()
+        logger.debug('Deleted photo %s by user %s', instance.id, self.request.user.id)
+
+
+class PhotoSimilarView(generics.GenericAPIView):
+    """
+    Near-duplicates of a photo among the photos the user can see, closest
+    first. ``?distance=`` (0-3, default 3) caps the Hamming distance.
+    """
+    serializer_class = SimilarPhotoSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [StatelessJWTAuthentication]
+    max_results = 100
+
+    def get_queryset(self):
+        return Photo.objects.filter(feed_entries__user_id=self.request.user.id)
+
+    def get(self, request, pk):
+        photo = get_object_or_404(self.get_queryset(), pk=pk)
+        try:
+            max_distance = int(request.query_params.get('distance', MAX_DISTANCE))
+        except ValueError:
+            max_distance = -1
+        if not 0 <= max_distance <= MAX_DISTANCE:
+            raise serializers.ValidationError({'distance': f'Must be an integer between 0 and {MAX_DISTANCE}.'})
+
+        matches = similar_photos(photo, self.get_queryset(), max_distance)[:self.max_results]
+        for distance, match in matches:
+            match.distance = distance
+        serializer = self.get_serializer([match for _, match in matches], many=True)
+        return Response(serializer.data)
+
+
+class PhotoExportView(APIView):
+    """
+    Download the photos the user owns or has been shared as one ZIP, streamed
+    while it is built. ``?ids=`` limits it to those photos; ids the user
+    cannot see are left out.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [StatelessJWTAuthentication]
+
+    def get(self, request):
+        query = ExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        photos = Photo.objects.filter(feed_entries__user_id=request.user.id)
+        if 'ids' in query.validated_data:
+            photos = photos.filter(id__in=query.validated_data['ids'])
+        photos = photos.only('id', 'file', 'original_name', 'created_at', 'taken_at').order_by('created_at', 'id')
+
+        response = StreamingHttpResponse(stream_zip(photos.iterator(chunk_size=500)), content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="photos.zip"'
+        response['Cache-Control'] = 'no-store'
+        return response
 
 
 class PhotoShareView(generics.CreateAPIView):
     serializer_class = PhotoShareSerializer
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
 
     def perform_create(self, serializer):
         photo_id = self.request.data.get('photo')
         email_to_share = serializer.validated_data.get('shared_to')
-        
-        print(f"[DEBUG] Share request: photo_id={photo_id}, email={email_to_share}, from_user={self.request.user.username}")
-        
         photo = get_object_or_404(Photo, id=photo_id, owner=self.request.user)
-        print(f"[DEBUG] Photo found: {photo.original_name} (ID: {photo.id})")
-        
+        shared_to_user = User.objects.get(email=email_to_share)
+        photo_share = serializer.save(photo=photo, shared_to=shared_to_user)
+        logger.debug('User %s shared photo %s with user %s (share %s)',
+                     self.request.user.id, photo.id, shared_to_user.id, photo_share.id)
+
+
+
+class PhotoBulkShareView(APIView):
+    """
+    Share many photos with many users in one request. Emails, photo ownership
+    and existing shares are each resolved with a single query and the new
+    shares are inserted in bulk; the response reports every (photo, email) pair.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [StatelessJWTAuthentication]
+
+    def post(self, request):
+        serializer = BulkShareSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        photo_ids = serializer.validated_data['photos']
+        emails = serializer.validated_data['emails']
+        own_email = (request.user.email or '').lower()
+
+        users = {user.email: user for user in User.objects.filter(email__in=emails)}
+        owned = dict(Photo.objects.filter(owner=request.user, id__in=photo_ids).values_list('id', 'file'))
+        existing = set(
+            PhotoShare.objects.filter(photo_id__in=owned, shared_to__in=users.values())
+            .values_list('photo_id', 'shared_to_id')
+        )
+
+        results = []
+        new_shares = []
+        for photo_id in photo_ids:
+            for email in emails:
+                user = users.get(email)
+                if photo_id not in owned:
+                    outcome = 'photo_not_found'
+                elif email.lower() == own_email:
+                    outcome = 'self'
+                elif user is None:
+                    outcome = 'user_not_found'
+                elif (photo_id, user.id) in existing:
+                    outcome = 'already_shared'
+                else:
+                    outcome = 'shared'
+                    new_shares.append(PhotoShare(photo_id=photo_id, shared_to=user))
+                results.append({'photo': photo_id, 'email': email, 'status': outcome})
+
+        with transaction.atomic():
+            PhotoShare.objects.bulk_create(new_shares, batch_size=1000, ignore_conflicts=True)
+            add_share_entries(new_shares)
+
+        # bulk_create sends no post_save, so drop cached denials here.
+        recipients = defaultdict(list)
+        for share in new_shares:
+            recipients[owned[share.photo_id]].append(share.shared_to_id)
+        for path, user_ids in recipients.items():
+            invalidate_media_access(user_ids, path)
+
+        return Response({'shared': len(new_shares), 'results': results}, status=status.HTTP_200_OK)
+
+
+class PhotoBulkView(APIView):
+    """
+    Upload or delete many photos in one request.
+
+    POST takes a multipart body with one ``files`` part per photo; valid files
+    are stored and their rows inserted with a single bulk_create, invalid ones
+    are reported back without failing the batch. DELETE takes ``{"ids": [...]}``
+    and removes the caller's photos in one queryset delete; files on disk are
+    unlinked from a thread pool once the transaction commits.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [StatelessJWTAuthentication]
+    parser_classes = [MultiPartParser, FormParser, JSONParser]
+
+    def post(self, request):
+        uploads = request.FILES.getlist('files')
+        if not uploads:
+            raise serializers.ValidationError({'files': 'No files provided'})
+
+        file_field = Photo._meta.get_field('file')
+        storage = file_field.storage
+        photos, sizes, contents, errors = [], {}, {}, []
         try:
-            shared_to_user = User.objects.get(email=email_to_share)
-            print(f"[DEBUG] Target user found: {shared_to_user.username} (email: {email_to_share})")
-        except User.DoesNotExist:
-            print(f"[DEBUG] User with email {email_to_share} not found!")
+            for upload in uploads:
+                serializer = PhotoSerializer(data={'file': upload}, context={'request': request})
+                if not serializer.is_valid():
+                    errors.append({'name': upload.name, 'errors': serializer.errors})
+                    continue
+                name = storage.save(file_field.generate_filename(None, upload.name), upload)
+                sizes[name] = upload.size
+                contents[name] = upload
+                observe_upload(upload.size)
+                photos.append(Photo(owner=request.user, file=name, original_name=upload.name))
+
+            with transaction.atomic():
+                Photo.objects.bulk_create(photos)
+                # bulk_create sends no post_save, so take the blob references here.
+                Blob.objects.acquire_many(sizes, Counter(photo.file.name for photo in photos))
+                add_owner_entries(photos)
+                for photo in photos:
+                    enqueue_photo(photo)
+        except Exception:
+            # Without Blob rows nothing would ever release these files; keep
+            # the ones other photos already use.
+            delete_unreferenced_blobs(list(sizes))
             raise
-        
-        photo_share = serializer.save(photo=photo, shared_to=shared_to_user)
-        print(f"[DEBUG] Photo shared successfully! PhotoShare ID: {photo_share.id}")
\ No newline at end of file
+        for name, upload in contents.items():
+            restore_blob(name, upload)
+            invalidate_media_access([request.user.id], name)
+
+        data = PhotoSerializer(photos, many=True, context={'request': request}).data
+        code = status.HTTP_201_CREATED if photos else status.HTTP_400_BAD_REQUEST
+        return Response({'created': data, 'errors': errors}, status=code)
+
+    def delete(self, request):
+        serializer = BulkDeleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+
+        _, deleted = Photo.objects.filter(owner_id=request.user.id, id__in=ids).delete()
+        return Response({'deleted': deleted.get(Photo._meta.label, 0)}, status=status.HTTP_200_OK)
+
+
+class PartialUploadFile(File):
+    """A completed part file; storage moves it into place instead of copying it."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class UploadSessionCreateView(generics.CreateAPIView):
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [StatelessJWTAuthentication]
+
+    def perform_create(self, serializer):
+        session = serializer.save(owner=self.request.user)
+        os.makedirs(settings.RESUMABLE_UPLOAD_DIR, exist_ok=True)
+        open(session.path, 'xb').close()
+
+
+class UploadSessionMixin:
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [StatelessJWTAuthentication]
+
+    def get_session(self, pk):
+        return get_object_or_404(UploadSession, pk=pk, owner_id=self.request.user.id)
+
+    @staticmethod
+    def open_locked(session):
+        """Open the part file for appending, or return None if another request holds it."""
+        try:
+            part = open(session.path, 'ab')
+        except FileNotFoundError:
+            raise Http404()
+        if not locks.lock(part, locks.LOCK_EX | locks.LOCK_NB):
+            part.close()
+            return None
+        return part
+
+    @staticmethod
+    def offset_response(session, offset, status_code=status.HTTP_204_NO_CONTENT):
+        response = Response(status=status_code)
+        response['Upload-Offset'] = str(offset)
+        response['Upload-Length'] = str(session.size)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+class UploadSessionDetailView(UploadSessionMixin, APIView):
+    """
+    GET/HEAD report the current offset, PATCH appends the request body at
+    ``Upload-Offset`` and DELETE abandons the upload.
+    """
+    chunk_size = 64 * 1024
+
+    def get(self, request, pk):
+        session = self.get_session(pk)
+        response = self.offset_response(session, session.offset, status.HTTP_200_OK)
+        response.data = UploadSessionSerializer(session).data
+        return response
+
+    def patch(self, request, pk):
+        session = self.get_session(pk)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response({'detail': 'Upload-Offset and Content-Length headers are required.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        part = self.open_locked(session)
+        if part is None:
+            return Response({'detail': 'Another request is appending to this upload.'},
+                            status=status.HTTP_409_CONFLICT)
+        with part:
+            current = part.tell()
+            if offset != current:
+                return self.offset_response(session, current, status.HTTP_409_CONFLICT)
+            if current + length > session.size:
+                return Response({'detail': 'Chunk exceeds the declared upload size.'},
+                                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+            # Copy the body straight from the socket into the part file.
+            stream = request._request
+            remaining = length
+            while remaining:
+                chunk = stream.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                part.write(chunk)
+                remaining -= len(chunk)
+            current = part.tell()
+        UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+        return self.offset_response(session, current)
+
+    def delete(self, request, pk):
+        self.get_session(pk).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadSessionCompleteView(UploadSessionMixin, APIView):
+
+    def post(self, request, pk):
+        session = self.get_session(pk)
+        part = self.open_locked(session)
+        if part is None:
+            return Response({'detail': 'Another request is appending to this upload.'},
+                            status=status.HTTP_409_CONFLICT)
+        with part:
+            if part.tell() != session.size:
+                return self.offset_response(session, part.tell(), status.HTTP_409_CONFLICT)
+
+            with open(session.path, 'rb') as fh:
+                serializer = PhotoSerializer(
+                    data={'file': PartialUploadFile(fh, name=session.filename)},
+                    context={'request': request},
+                )
+                serializer.is_valid(raise_exception=True)
+                with transaction.atomic():
+                    photo = serializer.save(owner=request.user, original_name=session.filename)
+                    session.delete()
+                restore_blob(photo.file.name, File(fh))
+                enqueue_photo(photo)
+                observe_upload(session.size)
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
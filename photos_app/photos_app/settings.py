@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -22,6 +23,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'photos.metrics.PerformanceMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -51,6 +53,16 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'photos_app.wsgi.application'
 
+# Database connections outlive the request: each worker thread keeps its
+# connection for DB_CONN_MAX_AGE seconds (0 reconnects on every request) and
+# checks it is still alive before reusing it, so a restarted PostgreSQL costs
+# one failed ping rather than a 500. DB_POOL=1
+# uses psycopg 3's connection pool instead (`pip install "psycopg[pool]"`),
+# shared by all threads of a process and sized by DB_POOL_MIN_SIZE and
+# DB_POOL_MAX_SIZE; prefer it under ASGI, where requests do not keep to one
+# thread. Django requires CONN_MAX_AGE=0 with the pool.
+DB_POOL = os.environ.get('DB_POOL', '0') == '1'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -59,9 +71,33 @@ DATABASES = {
         'PASSWORD': 'password',
         'HOST': 'localhost',
         'PORT': '5432',
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+if DB_POOL:
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            # Seconds a request waits for a free connection before failing.
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        },
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -93,13 +129,118 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.StatelessJWTAuthentication',
     ),
 }
 
+# Seconds each process trusts a user's active status before re-checking it.
+# 0 checks on every request; None never checks (revocation waits for token expiry).
+JWT_USER_STATUS_CACHE_TTL = int(os.environ.get('JWT_USER_STATUS_CACHE_TTL', 30))
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    # Photo uploads: deduplicated by content under MEDIA_ROOT/blobs/.
+    'photos': {
+        'BACKEND': 'photos.storage.ContentAddressedStorage',
+    },
+}
+
+# 'local' keeps media under MEDIA_ROOT; 's3' stores uploads and renditions in
+# an S3-compatible bucket (set PHOTO_S3_ENDPOINT_URL for MinIO and friends).
+PHOTO_STORAGE_BACKEND = os.environ.get('PHOTO_STORAGE_BACKEND', 'local')
+if PHOTO_STORAGE_BACKEND == 's3':
+    S3_STORAGE_OPTIONS = {
+        'bucket_name': os.environ.get('PHOTO_S3_BUCKET'),
+        'endpoint_url': os.environ.get('PHOTO_S3_ENDPOINT_URL'),
+        'region_name': os.environ.get('PHOTO_S3_REGION'),
+        'access_key': os.environ.get('PHOTO_S3_ACCESS_KEY'),
+        'secret_key': os.environ.get('PHOTO_S3_SECRET_KEY'),
+        # Presigned URLs used by MEDIA_DELIVERY_BACKEND='redirect'; keep this
+        # longer than MEDIA_URL_TTL so a cached redirect never outlives it.
+        'querystring_expire': 3600,
+    }
+    STORAGES['default'] = {'BACKEND': 'photos.storage.S3Storage', 'OPTIONS': S3_STORAGE_OPTIONS}
+    STORAGES['photos'] = {'BACKEND': 'photos.storage.S3ContentAddressedStorage', 'OPTIONS': S3_STORAGE_OPTIONS}
+
+# Per-request timings, SQL counts, bytes served and upload sizes, scraped by
+# Prometheus from /metrics with `Authorization: Bearer <METRICS_TOKEN>`; the
+# endpoint is a 404 while no token is set. Counters are kept per process.
+# Set PERFORMANCE_METRICS_ENABLED=0 to take the middleware out.
+PERFORMANCE_METRICS_ENABLED = os.environ.get('PERFORMANCE_METRICS_ENABLED', '1') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Seconds a (user, media path) access decision stays cached.
+MEDIA_ACCESS_CACHE_TTL = int(os.environ.get('MEDIA_ACCESS_CACHE_TTL', 300))
+
+# Seconds the stored file behind a rendition or WebP/AVIF copy stays cached per
+# (path, size, format), so repeat signed-URL requests run no queries.
+MEDIA_LOOKUP_CACHE_TTL = int(os.environ.get('MEDIA_LOOKUP_CACHE_TTL', 300))
+
+# How authorized media bytes are sent: 'django' streams them from the worker
+# (development), 'nginx' returns X-Accel-Redirect to an internal location under
+# MEDIA_ACCEL_REDIRECT_PREFIX, 'sendfile' returns X-Sendfile with the file path
+# (Apache mod_xsendfile, lighttpd), 'redirect' sends a 302 to a presigned
+# object-store URL (PHOTO_STORAGE_BACKEND='s3' only).
+MEDIA_DELIVERY_BACKEND = os.environ.get('MEDIA_DELIVERY_BACKEND', 'django')
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Browser cache lifetime for media responses. Responses are always private,
+# so a revoked share is honoured by browsers after at most this many seconds.
+MEDIA_CACHE_MAX_AGE = 60
+
+# Lifetime in seconds of the signed media URLs returned by the photo API. A
+# signed URL keeps working for its whole lifetime even if the share is revoked.
+MEDIA_URL_TTL = 15 * 60
+
+# Downscaled copies served by /api/media/<path>/?size=<px>[&fmt=jpeg|webp|avif].
+# Sizes are the longest edge in pixels; formats Pillow cannot encode are skipped.
+PHOTO_RENDITION_SIZES = [256, 1024]
+PHOTO_RENDITION_FORMATS = ['jpeg', 'webp', 'avif']
+
+# Full-size originals are served as the first of these formats the request's
+# Accept header lists (JPEG and PNG originals only). The first request queues
+# the copy for `manage.py process_photos` and gets the original; the copy is
+# encoded once and kept under transcodes/, and beyond MEDIA_TRANSCODE_QUOTA
+# bytes the least recently served copies are deleted. An empty list serves
+# originals as-is.
+MEDIA_TRANSCODE_FORMATS = ['avif', 'webp']
+MEDIA_TRANSCODE_QUOTA = int(os.environ.get('MEDIA_TRANSCODE_QUOTA', 5 * 1024 ** 3))
+
+# Post-upload processing. 'worker' leaves new photos queued for
+# `manage.py process_photos`; 'eager' runs the pipeline in the web process
+# after the upload commits (development without a worker).
+PHOTO_PROCESSING_BACKEND = os.environ.get('PHOTO_PROCESSING_BACKEND', 'worker')
+PHOTO_PROCESSING_MAX_ATTEMPTS = 3
+PHOTO_PROCESSING_LEASE = 600
+
+PHOTO_MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+
+# Uploads are checked from their header: the format must be one of these and
+# width x height at most PHOTO_MAX_IMAGE_PIXELS. ImageUploadHandler applies
+# the checks while multipart bodies stream in, so bad files are dropped after
+# their first chunk instead of being written to disk.
+PHOTO_UPLOAD_FORMATS = ['JPEG', 'PNG', 'GIF', 'WEBP']
+PHOTO_MAX_IMAGE_PIXELS = 120 * 1000 * 1000
+FILE_UPLOAD_HANDLERS = [
+    'photos.uploads.ImageUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Resumable uploads (/api/photos/uploads/) keep received bytes here until
+# completion; sessions idle for longer than the expiry are purged by
+# `manage.py purge_upload_sessions`.
+RESUMABLE_UPLOAD_DIR = MEDIA_ROOT / 'partial'
+RESUMABLE_UPLOAD_EXPIRY = 24 * 60 * 60
+
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:5173',
     'http://127.0.0.1:5173',
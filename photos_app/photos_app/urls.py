@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from photos.views import protected_media
+from photos.metrics import metrics_view
+from photos.views import protected_media, protected_media_async
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -10,4 +11,6 @@ urlpatterns = [
     path('api/photos/', include('photos.urls')),
  
     path('api/media/<path:path>/', protected_media, name='protected-media'),
+    path('api/media-async/<path:path>/', protected_media_async, name='protected-media-async'),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
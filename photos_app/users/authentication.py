@@ -0,0 +1,119 @@
+"""
+JWT authentication that trusts the token for the user id.
+
+simplejwt's JWTAuthentication fetches the whole User row on every request, even
+when the view only filters by the caller's id. StatelessJWTAuthentication puts
+a LazyUser on the request instead: `id`/`pk` come from the token and the row is
+loaded only if a view reads any other attribute.
+
+Whether the account is still active is checked separately and can be cached
+per process for JWT_USER_STATUS_CACHE_TTL seconds; None skips the check, so a
+deactivated user keeps access until their access token expires.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+STATUS_CACHE_MAX_ENTRIES = 10_000
+
+_status_cache = {}
+_status_lock = threading.Lock()
+
+
+def _user_id(claim):
+    # Recent simplejwt versions serialize the id claim as a string.
+    field = get_user_model()._meta.get_field(api_settings.USER_ID_FIELD)
+    return field.to_python(claim)
+
+
+def _load_user(user_id):
+    return get_user_model().objects.get(**{api_settings.USER_ID_FIELD: user_id})
+
+
+class LazyUser(SimpleLazyObject):
+    """A User whose row is fetched on first access to anything but its id."""
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id):
+        super().__init__(lambda: _load_user(user_id))
+        self.__dict__['id'] = self.__dict__['pk'] = user_id
+
+    def __bool__(self):
+        # DRF permissions test `request.user` for truthiness; that alone shouldn't load the row.
+        return True
+
+    def __repr__(self):
+        return f'<LazyUser: {self.id}>'
+
+
+def _cached_status(user_id):
+    with _status_lock:
+        entry = _status_cache.get(user_id)
+    if entry is not None and entry[1] > time.monotonic():
+        return entry[0]
+    return None
+
+
+def _store_status(user_id, active, ttl):
+    with _status_lock:
+        if len(_status_cache) >= STATUS_CACHE_MAX_ENTRIES:
+            _status_cache.clear()
+        _status_cache[user_id] = (active, time.monotonic() + ttl)
+
+
+def forget_user_status(user_id):
+    with _status_lock:
+        _status_cache.pop(user_id, None)
+
+
+def _active_users(user_id):
+    return get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id, 'is_active': True})
+
+
+def user_is_active(user_id):
+    ttl = settings.JWT_USER_STATUS_CACHE_TTL
+    if ttl is None:
+        return True
+    active = _cached_status(user_id) if ttl else None
+    if active is None:
+        active = _active_users(user_id).exists()
+        if ttl:
+            _store_status(user_id, active, ttl)
+    return active
+
+
+async def auser_is_active(user_id):
+    ttl = settings.JWT_USER_STATUS_CACHE_TTL
+    if ttl is None:
+        return True
+    active = _cached_status(user_id) if ttl else None
+    if active is None:
+        active = await _active_users(user_id).aexists()
+        if ttl:
+            _store_status(user_id, active, ttl)
+    return active
+
+
+def token_user_id(validated_token):
+    try:
+        return _user_id(validated_token[api_settings.USER_ID_CLAIM])
+    except (KeyError, ValidationError):
+        raise InvalidToken(_('Token contained no recognizable user identification'))
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        user_id = token_user_id(validated_token)
+        if not user_is_active(user_id):
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return LazyUser(user_id)
@@ -1,7 +1,12 @@
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
 from rest_framework import status
 
+from .authentication import LazyUser
+
 class UserAuthTests(APITestCase):
 
     def setUp(self):
@@ -68,4 +73,49 @@ class UserAuthTests(APITestCase):
         User.objects.create_user(username='loginuser', password='LoginPassword123')
         data = {'username': 'loginuser', 'password': 'WrongPassword'}
         response = self.client.post('/api/auth/login/', data)
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class StatelessJWTAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tokenuser', password='TokenPassword123')
+        login_resp = self.client.post('/api/auth/login/', {'username': 'tokenuser', 'password': 'TokenPassword123'})
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {login_resp.data["access"]}')
+
+    def _user_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/photos/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [q['sql'] for q in ctx.captured_queries if 'auth_user' in q['sql']]
+
+    def test_cached_status_skips_the_user_query(self):
+        self.assertEqual(len(self._user_queries()), 1)
+        self.assertEqual(self._user_queries(), [])
+
+    @override_settings(JWT_USER_STATUS_CACHE_TTL=None)
+    def test_status_check_can_be_disabled(self):
+        self.assertEqual(self._user_queries(), [])
+
+    @override_settings(JWT_USER_STATUS_CACHE_TTL=0)
+    def test_uncached_status_is_checked_every_request(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.get('/api/photos/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivating_a_user_drops_the_cached_status(self):
+        self._user_queries()
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/api/photos/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_lazy_user_loads_on_demand(self):
+        lazy = LazyUser(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(lazy.id, self.user.pk)
+            self.assertTrue(lazy.is_authenticated)
+            self.assertTrue(lazy)
+        with self.assertNumQueries(1):
+            self.assertEqual(lazy.username, 'tokenuser')
+            self.assertEqual(lazy.email, self.user.email)
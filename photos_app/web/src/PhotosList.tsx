@@ -1,6 +1,6 @@
 import { useEffect, useState } from 'react';
 import API from './api';
-import type { Photo } from './types';
+import type { FeedPage, Photo } from './types';
 import SharePhoto from './SharePhoto';
 import type { AxiosResponse } from 'axios';
 
@@ -8,68 +8,73 @@ export default function PhotosList({ token }: { token: string }) {
   const [photos, setPhotos] = useState<Photo[]>([]);
   const [loading, setLoading] = useState(false);
 
+  const [nextPage, setNextPage] = useState<string | null>(null);
+
+  // Media URLs from the API are signed for this user, so <img> can load them directly.
+  const withPreviews = (items: Photo[]): Photo[] =>
+    items
+      .filter(p => p.url)
+      .map(p => ({ ...p, preview: `${p.url}&size=256&fmt=webp` }));
+
   useEffect(() => {
     let mounted = true;
     API.get('/photos/', {
       headers: { Authorization: `Bearer ${token}` },
     })
-      .then(async (res: AxiosResponse<Photo[]>) => {
-        if (!mounted) return;
-        const items: Photo[] = res.data;
-        
-        const validItems = items.filter(p => p.file && p.file.trim().length > 0);
-        console.log(`Loaded ${items.length} photos, ${validItems.length} have files`);
-
-        const apiBaseUrl = import.meta.env.VITE_API_URL;
-        const withPreview = await Promise.all(
-          validItems.map(async (p: Photo) => {
-            try {
-              console.log(`Fetching preview for file: ${p.file}`);
-              const mediaUrl = `${apiBaseUrl}/media/${p.file}/`;
-              console.log(`Absolute media URL: ${mediaUrl}`);
-              const r = await fetch(mediaUrl, {
-                headers: { Authorization: `Bearer ${token}` },
-              });
-              if (!r.ok) {
-                throw new Error(`HTTP ${r.status}: ${r.statusText}`);
-              }
-              const blob = await r.blob();
-              const url = URL.createObjectURL(blob);
-              return { ...p, preview: url };
-            } catch (e: any) {
-              console.error(`Failed to load preview for ${p.file}:`, e.message);
-              return p;
-            }
-          })
-        );
-
+      .then((res: AxiosResponse<FeedPage>) => {
         if (mounted) {
-          setPhotos(withPreview);
+          setPhotos(withPreviews(res.data.results));
+          setNextPage(res.data.next);
         }
       });
 
     return () => {
       mounted = false;
-      setPhotos((prevPhotos: Photo[]) => {
-        prevPhotos.forEach(p => {
-          if (p.preview) URL.revokeObjectURL(p.preview);
-        });
-        return [];
-      });
+      setPhotos([]);
     };
   }, [token]);
 
-  const handleView = (blobUrl: string) => {
-    window.open(blobUrl, '_blank');
+  const handleLoadMore = async () => {
+    if (!nextPage) return;
+    try {
+      setLoading(true);
+      const res: AxiosResponse<FeedPage> = await API.get(nextPage, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      setPhotos(prevPhotos => [...prevPhotos, ...withPreviews(res.data.results)]);
+      setNextPage(res.data.next);
+    } catch (err: any) {
+      console.error('Failed to load more photos:', err.message);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const fetchOriginal = async (p: Photo): Promise<string> => {
+    const r = await fetch(p.url!);
+    if (!r.ok) {
+      throw new Error(`HTTP ${r.status}: ${r.statusText}`);
+    }
+    return URL.createObjectURL(await r.blob());
   };
 
-  const handleDownload = (blobUrl: string, originalName: string) => {
-    const link = document.createElement('a');
-    link.href = blobUrl;
-    link.setAttribute('download', originalName);
-    document.body.appendChild(link);
-    link.click();
-    document.body.removeChild(link);
+  const handleView = (p: Photo) => {
+    if (p.url) window.open(p.url, '_blank');
+  };
+
+  const handleDownload = async (p: Photo) => {
+    try {
+      const blobUrl = await fetchOriginal(p);
+      const link = document.createElement('a');
+      link.href = blobUrl;
+      link.setAttribute('download', p.original_name);
+      document.body.appendChild(link);
+      link.click();
+      document.body.removeChild(link);
+      URL.revokeObjectURL(blobUrl);
+    } catch (e: any) {
+      console.error(`Failed to download ${p.file}:`, e.message);
+    }
   };
 
   const handleDelete = async (photoId: number, photoName: string) => {
@@ -112,14 +117,14 @@ export default function PhotosList({ token }: { token: string }) {
         {p.preview && (
           <div className="photo-actions">
             <button
-              onClick={() => handleView(p.preview!)}
+              onClick={() => handleView(p)}
               className="action-button"
               disabled={loading}
             >
               View
             </button>
             <button
-              onClick={() => handleDownload(p.preview!, p.original_name)}
+              onClick={() => handleDownload(p)}
               className="action-button download-button"
               disabled={loading}
             >
@@ -154,6 +159,12 @@ export default function PhotosList({ token }: { token: string }) {
         photos={photos.filter(p => !p.isOwned)}
         PhotoItem={PhotoItem}
       />
+
+      {nextPage && (
+        <button onClick={handleLoadMore} className="action-button" disabled={loading}>
+          Load more
+        </button>
+      )}
     </div>
   );
 }
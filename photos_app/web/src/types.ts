@@ -2,7 +2,14 @@ export interface Photo {
   id: number;
   original_name: string;
   file: string;
+  url: string | null;
   created_at: string;
+  status: 'processing' | 'ready' | 'failed';
   preview?: string;
   isOwned: boolean;
-}
\ No newline at end of file
+}
+
+export interface FeedPage {
+  next: string | null;
+  results: Photo[];
+}